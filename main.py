@@ -15,6 +15,7 @@
 """Main module.
 """
 
+import json
 import logging
 import os
 import threading
@@ -23,14 +24,23 @@ from typing import Any
 from flask import Flask
 from flask import jsonify
 from flask import request
+from flask import Response
 from output_writers.acs_feed_destination import ACSFeedDestination
 from output_writers.dv360_feed_destination import DV360FeedDestination
+from output_writers.file_feed_destination import FileFeedDestination
 from output_writers.sa360_feed_destination import SA360FeedDestination
 from services.content_generator_service import ContentGeneratorService
 from utils.entry import Entry
 from utils.enums import Destination
+from utils.enums import FeedLayout
 from utils.enums import FirstTermSource
 from utils.enums import SecondTermSource
+from utils import cassette
+from utils import circuit_breaker
+from utils import metrics
+from utils import tracing
+from utils.task_progress import TaskProgress
+from utils.token_usage import TokenUsage
 from utils.utils import Utils
 
 app = Flask(__name__)
@@ -41,13 +51,42 @@ logging.root.setLevel(logging.INFO)
 
 # Helpers and config
 config = Utils.load_config('config.json')
+tracing.init_tracing(config)
+circuit_breaker.init_circuit_breakers(config)
+cassette.init_cassette(config)
 
 content_generator_service = ContentGeneratorService(config)
 
 
 tasks = {}
+task_progress = {}
 task_id = 0
 
+# Seconds between progress events if nothing changed
+PROGRESS_STREAM_HEARTBEAT = 15
+
+FILE_DESTINATIONS = [
+    Destination.CSV_FILE,
+    Destination.JSONL_FILE,
+    Destination.PARQUET_FILE
+]
+
+FEED_LAYOUTS = {
+    'sa360feed': FeedLayout.SA360_FEED,
+    'dv360feed': FeedLayout.DV360_FEED,
+    'acsfeed': FeedLayout.ACS_FEED
+}
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+  """Exposes the Prometheus metrics.
+
+  Returns:
+    The metrics in the Prometheus text format.
+  """
+  return Response(metrics.generate_latest(), mimetype=metrics.CONTENT_TYPE)
+
 
 @app.route('/tasks/<int:tid>', methods=['GET'])
 def get_task_status(tid):
@@ -62,7 +101,64 @@ def get_task_status(tid):
   if tid not in tasks:
     return jsonify({'error': 'Task not found'}), 404
 
-  return jsonify(tasks[tid]), 200
+  return jsonify(__get_task(tid)), 200
+
+
+@app.route('/tasks/<int:tid>/stream', methods=['GET'])
+def stream_task_progress(tid):
+  """Streams the progress of a task as Server-Sent Events.
+
+  An event is sent on every change, or every PROGRESS_STREAM_HEARTBEAT
+  seconds, until the task is no longer running.
+
+  Args:
+    tid(int): The task id to stream progress of.
+
+  Returns:
+    A text/event-stream response with the status and progress.
+  """
+  if tid not in tasks:
+    return jsonify({'error': 'Task not found'}), 404
+
+  def events():
+    while True:
+      task = __get_task(tid)
+      yield f'data: {json.dumps(task)}\n\n'
+
+      if tasks[tid]['status'] != 'running' or tid not in task_progress:
+        return
+      task_progress[tid].wait_for_update(
+          task['progress']['version'],
+          PROGRESS_STREAM_HEARTBEAT
+          )
+
+  return Response(events(), mimetype='text/event-stream')
+
+
+def __get_task(tid: int) -> dict[str, Any]:
+  """Returns a task with its progress.
+
+  A running task waiting for open circuits is reported as paused, with the
+  state of the circuits.
+
+  Args:
+    tid(int): The task id.
+
+  Returns:
+    dict[str, Any]: The status, progress and result of the task.
+  """
+  task = dict(tasks[tid])
+  if tid in task_progress:
+    task['progress'] = task_progress[tid].to_dict()
+
+  if task['status'] == 'running':
+    circuits = circuit_breaker.get_open_circuits()
+    if circuits:
+      task['circuits'] = circuits
+      if any(c['mode'] == circuit_breaker.PAUSE for c in circuits.values()):
+        task['status'] = 'paused'
+
+  return task
 
 
 @app.route('/content', methods=['POST'])
@@ -74,11 +170,15 @@ def start_task():
   Returns:
     A JSON response with a success message and a 202 status code if params ok
     and generation started.
+    A JSON response with the plan and a 200 status code if dry_run is true.
     A JSON response with an error message and a 400 status code if user error.
     A JSON response with an error message and a 500 status code if bt failure.
   """
   global task_id
 
+  if (request.get_json(silent=True) or {}).get('dry_run'):
+    return __plan_task()
+
   try:
     if task_id in tasks and tasks[task_id]['status'] == 'running':
       return jsonify({'error': 'Task already running'}), 409
@@ -95,6 +195,8 @@ def start_task():
         )
 
     task_id += 1
+    task_progress[task_id] = TaskProgress()
+    tasks[task_id] = {'status': 'running'}
 
     threading.Thread(
         target=__generate_and_export_content,
@@ -115,12 +217,50 @@ def start_task():
     tasks[task_id] = {'status': 'failed 500', 'result': str(e)}
     return jsonify({'error': str(e)}), 500
 
-  tasks[task_id] = {'status': 'running'}
-
   logging.info(' Task %s started', task_id)
   return jsonify({'status': 'accepted', 'task_id': task_id}), 202
 
 
+def __plan_task():
+  """Plans the generation of a dry_run request, without starting a task.
+
+  No task is created, so failures are only returned, and tasks keeps the
+  status of the last real task.
+
+  Returns:
+    A JSON response with the plan and a 200 status code if params ok.
+    A JSON response with an error message and a 400 status code if user error.
+    A JSON response with an error message and a 500 status code if bt failure.
+  """
+  try:
+    destination = __get_destination(request)
+    first_term_source = __get_first_term_source(request)
+    second_term_source = __get_second_term_source(request)
+    must_find_relationship = __get_must_find_relationship(request)
+    body_params = __validate_body_params(
+        request,
+        destination,
+        first_term_source,
+        second_term_source
+        )
+
+    plan = content_generator_service.plan_content(
+        first_term_source,
+        second_term_source,
+        must_find_relationship,
+        body_params
+        )
+  except ValueError as e:
+    logging.error(' %s', str(e))
+    return jsonify({'error': str(e)}), 400
+  except Exception as e:
+    logging.error(' %s', str(e))
+    return jsonify({'error': str(e)}), 500
+
+  logging.info(' Dry run plan: %s', plan['total'])
+  return jsonify({'status': 'planned', 'plan': plan}), 200
+
+
 def __generate_and_export_content(
     tid: int,
     first_term_source: FirstTermSource,
@@ -139,20 +279,66 @@ def __generate_and_export_content(
     body_params (dict[str, Any]): The params of the request.
     destination(Destination): The destination output.
   """
-  try:
-    entries = content_generator_service.generate_content(
-        first_term_source,
-        second_term_source,
-        must_find_relationship,
-        body_params
-        )
+  progress = task_progress[tid]
+  usage = TokenUsage(config.get('model_prices'))
 
-    __export_entries(entries, destination, body_params)
+  def export_partial(entries: list[Entry]) -> None:
+    # A failed partial export is retried by the next one or the final export
+    try:
+      with tracing.span('partial_export', entries=len(entries)):
+        __export_entries(entries, destination, body_params)
+    except Exception as e:
+      logging.error(' Partial export failed: %s', str(e))
 
-    tasks[tid] = {'status': 'completed', 'result': 'ok'}
+  try:
+    with tracing.span(
+        'task',
+        task_id=tid,
+        first_term_source=first_term_source.name,
+        second_term_source=(
+            second_term_source.name if second_term_source else None
+            ),
+        destination=destination.name
+        ) as span:
+      entries = content_generator_service.generate_content(
+          first_term_source,
+          second_term_source,
+          must_find_relationship,
+          body_params,
+          progress,
+          usage,
+          export_partial if body_params.get('export_every') else None
+          )
+      span.set_attribute('entries', len(entries))
+
+      with (progress.stage('export'),
+            metrics.track('destination', destination.name.lower()),
+            tracing.span('export')):
+        __export_entries(entries, destination, body_params)
+    metrics.ROWS_EXPORTED.labels(destination.name.lower()).inc(len(entries))
+
+    tasks[tid] = {
+        'status': 'completed',
+        'result': 'ok',
+        'usage': usage.to_dict()
+        }
+  except circuit_breaker.CircuitOpenError as e:
+    logging.error(' %s', str(e))
+    tasks[tid] = {
+        'status': 'failed 503',
+        'result': str(e),
+        'circuit': e.service,
+        'usage': usage.to_dict()
+        }
   except Exception as e:
     logging.error(' %s', str(e))
-    tasks[tid] = {'status': 'failed 500', 'result': str(e)}
+    tasks[tid] = {
+        'status': 'failed 500',
+        'result': str(e),
+        'usage': usage.to_dict()
+        }
+
+  logging.info(' Task %s token usage: %s', tid, usage.to_dict(False)['total'])
 
 
 def __get_destination(r) -> Destination:
@@ -176,6 +362,12 @@ def __get_destination(r) -> Destination:
       return Destination.SA360_FEED
     case 'acsfeed':
       return Destination.ACS_FEED
+    case 'csv':
+      return Destination.CSV_FILE
+    case 'jsonl':
+      return Destination.JSONL_FILE
+    case 'parquet':
+      return Destination.PARQUET_FILE
     case 'dv360':
       raise ValueError('Destination dv360 not yet supported')
       # return Destination.DV360_API
@@ -185,7 +377,8 @@ def __get_destination(r) -> Destination:
     case _:
       raise ValueError(
           'Invalid destination query param.' +
-          'Supported values are dv360feed, sa360feed, dv360, sa360.'
+          'Supported values are dv360feed, sa360feed, acsfeed, csv, jsonl, '+
+          'parquet, dv360, sa360.'
           )
 
 
@@ -322,6 +515,32 @@ def __validate_body_params(
       and 'default_url' not in data):
     raise ValueError('Missing default_url body param.')
 
+  if 'dry_run' in data and not isinstance(data['dry_run'], bool):
+    raise ValueError('Invalid dry_run body param, must be of type bool.')
+
+  if 'batch_mode' in data and not isinstance(data['batch_mode'], bool):
+    raise ValueError('Invalid batch_mode body param, must be of type bool.')
+
+  if 'stream' in data and not isinstance(data['stream'], bool):
+    raise ValueError('Invalid stream body param, must be of type bool.')
+
+  for budget in ('time_budget_seconds', 'cost_budget'):
+    if budget in data and (
+        not isinstance(data[budget], (int, float))
+        or isinstance(data[budget], bool)
+        or data[budget] <= 0
+        ):
+      raise ValueError(
+          f'Invalid {budget} body param, must be a positive number.'
+          )
+
+  if 'export_every' in data and (
+      not isinstance(data['export_every'], int)
+      or isinstance(data['export_every'], bool)
+      or data['export_every'] <= 0
+      ):
+    raise ValueError('Invalid export_every body param, must be a positive int.')
+
   if 'num_headlines' not in data:
     raise ValueError('Missing num_headlines body param.')
   elif not isinstance(data['num_headlines'], int):
@@ -393,6 +612,11 @@ def __validate_body_params(
       raise ValueError('Missing or invalid limit in second_term_source_config. Must be of type int.')
     if data['second_term_source_config']['limit'] == 0:
       data['second_term_source_config']['limit'] = 9999
+    if not isinstance(
+        data['second_term_source_config'].get('priority_by_rank', False),
+        bool
+        ):
+      raise ValueError('Invalid priority_by_rank in second_term_source_config. Must be of type bool.')
   elif second_term_source == SecondTermSource.SEARCH_SCOUT:
     if 'project_id' not in data['second_term_source_config']:
       raise ValueError('Missing project_id in second_term_source_config.')
@@ -472,6 +696,21 @@ def __validate_body_params(
         not isinstance(data['destination_config']['starting_row'], int)
         ):
       raise ValueError('Missing or invalid starting_row in destination_config. Must be of type int.')
+    if not isinstance(
+        data['destination_config'].get('associative_term_column', 'F'),
+        str
+        ):
+      raise ValueError('Invalid associative_term_column in destination_config. Must be of type str.')
+  elif destination in FILE_DESTINATIONS:
+    if 'destination_config' not in data:
+      raise ValueError('Missing destination_config body param.')
+    if 'output_path' not in data['destination_config']:
+      raise ValueError('Missing output_path in destination_config.')
+    if data['destination_config'].get('feed_layout') not in FEED_LAYOUTS:
+      raise ValueError(
+          'Missing or invalid feed_layout in destination_config. '+
+          'Supported values are sa360feed, dv360feed and acsfeed.'
+          )
 
   return data
 
@@ -488,6 +727,9 @@ def __export_entries(entries: list[Entry], destination: Destination, body_params
     str: The destination query param.
   """
   logging.info(' Exporting content...')
+  incremental = bool(
+      body_params.get('destination_config', {}).get('incremental', False)
+      )
   if destination == Destination.SA360_FEED:
     sa360_feed_destination = SA360FeedDestination(config)
     sheet_id = body_params['destination_config']['spreadsheet_id']
@@ -495,7 +737,8 @@ def __export_entries(entries: list[Entry], destination: Destination, body_params
     sa360_feed_destination.write_destination_output(
         entries,
         sheet_id,
-        sheet_name
+        sheet_name,
+        incremental
         )
   elif destination == Destination.DV360_FEED:
     sheet_id = body_params['destination_config']['spreadsheet_id']
@@ -504,7 +747,8 @@ def __export_entries(entries: list[Entry], destination: Destination, body_params
     dv360_feed_destination.write_destination_output(
         entries,
         sheet_id,
-        sheet_name
+        sheet_name,
+        incremental
         )
   elif destination == Destination.ACS_FEED:
     sheet_id = body_params['destination_config']['spreadsheet_id']
@@ -513,6 +757,10 @@ def __export_entries(entries: list[Entry], destination: Destination, body_params
     constant_columns = body_params['destination_config']['constant_columns']
     copies_columns = body_params['destination_config']['copies_columns']
     starting_row = body_params['destination_config']['starting_row']
+    associative_term_column = body_params['destination_config'].get(
+        'associative_term_column',
+        'F'
+        )
     acs_feed_destination = ACSFeedDestination(config)
     acs_feed_destination.write_destination_output(
         entries,
@@ -521,7 +769,17 @@ def __export_entries(entries: list[Entry], destination: Destination, body_params
         variant_name_column,
         constant_columns,
         copies_columns,
-        starting_row
+        starting_row,
+        associative_term_column
+        )
+  elif destination in FILE_DESTINATIONS:
+    output_path = body_params['destination_config']['output_path']
+    feed_layout = FEED_LAYOUTS[body_params['destination_config']['feed_layout']]
+    file_feed_destination = FileFeedDestination(config, destination)
+    file_feed_destination.write_destination_output(
+        entries,
+        output_path,
+        feed_layout
         )
   elif destination == Destination.SA360_API:
     pass
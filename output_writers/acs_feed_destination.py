@@ -18,11 +18,22 @@ It transforms and loads data to a Google sheet
 with the correct format of an ACS feed.
 """
 
+import gspread
+from output_writers import feed_validator
+from output_writers.destination import Destination
+from output_writers.validations import ValidationRule
 from utils.entry import Entry
 from utils.sheet_helper import GoogleSheetsHelper
 
+VALIDATION_LIMITS = {
+    'headlines': {
+        'min_char_len_limit': 1,
+        'max_char_len_limit': 30,
+    },
+}
 
-class ACSFeedDestination:
+
+class ACSFeedDestination(Destination):
   """ACS Feed Destination class.
 
   It transforms and loads data to a Google sheet
@@ -31,6 +42,8 @@ class ACSFeedDestination:
 
   config: dict[str, str]
   sheets_helper: GoogleSheetsHelper
+  validation_limits = VALIDATION_LIMITS
+  row_id_attribute = 'id'
 
   def __init__(self, config: dict[str, str]):
     """Init method for ACSFeedDestination."""
@@ -45,7 +58,8 @@ class ACSFeedDestination:
       variant_name_column: str,
       constant_columns: list[str],
       copies_columns: list[str],
-      starting_row: int
+      starting_row: int,
+      associative_term_column: str = 'F'
       ) -> None:
     """Write output in ACS format.
 
@@ -57,53 +71,185 @@ class ACSFeedDestination:
       constant_columns(list[str]): Columns with constant values.
       copies_columns(list[str]): Columns to write generated content to.
       starting_row(int): Row to start writing content from.
+      associative_term_column(str): The column of the associative terms.
     """
-    acs_feed = self.__generate_feed(entries)
+    validation_errors = self.validate(entries)
+    self.write_validation_errors(validation_errors, sheet_id, sheet_name)
 
-    self.sheets_helper.create_or_clear_sheet(sheet_id, sheet_name)
+    acs_feed = self.generate_feed(entries)
 
-    self.sheets_helper.write_data_to_sheet(
+    # Constant values are read from the template row before it is cleared
+    constant_values = self.__read_constant_values(
         sheet_id,
         sheet_name,
-        f'{copies_columns[0]}{starting_row}:{copies_columns[-1]}9999',
-        acs_feed
+        constant_columns,
+        starting_row
         )
 
-    for column in constant_columns:
-      value = self.sheets_helper.get_cell_value(
-          sheet_id,
-          sheet_name,
-          starting_row,
-          column
-          )
-      self.sheets_helper.write_data_to_sheet(
+    self.sheets_helper.create_or_clear_sheet(sheet_id, sheet_name)
+
+    write_plan = self.__build_write_plan(
+        entries,
+        acs_feed,
+        variant_name_column,
+        constant_values,
+        copies_columns,
+        starting_row,
+        associative_term_column
+        )
+    self.sheets_helper.write_ranges_to_sheet(sheet_id, sheet_name, write_plan)
+
+  def __read_constant_values(
+      self,
+      sheet_id: str,
+      sheet_name: str,
+      constant_columns: list[str],
+      starting_row: int
+      ) -> dict[str, object]:
+    """Reads the values of all constant columns in a single request.
+
+    Args:
+      sheet_id(str): The output sheet id.
+      sheet_name(str): The output sheet name.
+      constant_columns(list[str]): Columns with constant values.
+      starting_row(int): Row to read the constant values from.
+
+    Returns:
+      dict[str, object]: The constant value for each column.
+    """
+    try:
+      ranges = self.sheets_helper.batch_get_values(
           sheet_id,
           sheet_name,
-          f'{column}{starting_row}:{column}9999',
-          [[value]] * len(entries)
+          [f'{column}{starting_row}' for column in constant_columns]
           )
+    except gspread.exceptions.WorksheetNotFound as _:
+      ranges = [[] for _ in constant_columns]
+
+    constant_values = {}
+    for column, values in zip(constant_columns, ranges):
+      constant_values[column] = values[0][0] if values and values[0] else None
+
+    return constant_values
+
+  def __build_write_plan(
+      self,
+      entries: list[Entry],
+      acs_feed: list[list[str]],
+      variant_name_column: str,
+      constant_values: dict[str, object],
+      copies_columns: list[str],
+      starting_row: int,
+      associative_term_column: str
+      ) -> list[tuple[str, list[list[str]]]]:
+    """Collects every range of the ACS feed to write them in one request.
+
+    Args:
+      entries(list[Entry]): A list of source entries.
+      acs_feed(list[list[str]]): The copies of each entry.
+      variant_name_column(str): The column corresponding to the variant name.
+      constant_values(dict[str, object]): The constant value for each column.
+      copies_columns(list[str]): Columns to write generated content to.
+      starting_row(int): Row to start writing content from.
+      associative_term_column(str): The column of the associative terms.
+
+    Returns:
+      list[tuple[str, list[list[str]]]]: The (range, data) tuples to write.
+    """
+    write_plan = [(f'{copies_columns[0]}{starting_row}', acs_feed)]
+
+    for column, value in constant_values.items():
+      write_plan.append((f'{column}{starting_row}', [[value]] * len(entries)))
 
     variant_names = []
     for entry in entries:
-      variant_names.append([' '.join(entry.headlines)]) # TODO: REVIEW
+      variant_names.append([' '.join(entry.headlines)])
 
-    self.sheets_helper.write_data_to_sheet(
-        sheet_id,
-        sheet_name,
-        f'{variant_name_column}{starting_row}:{variant_name_column}9999',
-        variant_names
-        )
+    write_plan.append((f'{variant_name_column}{starting_row}', variant_names))
 
     if entries[0].associative_term:
-      self.sheets_helper.write_data_to_sheet(
-          sheet_id,
-          sheet_name,
-          # f'{second_term_column}{starting_row}:{second_term_column}9999', # TODO: REVIEW
-          f'F{starting_row}:F9999',
+      write_plan.append((
+          f'{associative_term_column}{starting_row}',
           [[e.associative_term] for e in entries]
-          )
+          ))
+
+    return write_plan
+
+  def get_validation_rules(self) -> dict[str, list[ValidationRule]]:
+    """Returns the set of validation rules for an ACS feed.
+
+    Returns:
+      dict[str, list[ValidationRule]]: a dictionary with the validation rules
+    """
+    return feed_validator.build_validation_rules([
+        ('char_length', 'headlines'),
+        ('unique_in_list', 'headlines'),
+        ('case', 'headlines'),
+    ])
+
+  @staticmethod
+  def generate_table(entries: list[Entry]) -> list[list[str]]:
+    """Generates the ACS feed as a table with headers, for file exports.
+
+    Args:
+      entries(list[Entry]): The entries to generate feed
+
+    Returns:
+      list[list[str]]: the feed with a header row, variant names, associative
+      terms (if any) and copies.
+    """
+    header = ACSFeedDestination.generate_table_header(entries)
+    return [header] + ACSFeedDestination.generate_table_rows(entries, header)
+
+  @staticmethod
+  def generate_table_header(entries: list[Entry]) -> list[str]:
+    """Generates the header of the ACS feed table.
+
+    Args:
+      entries(list[Entry]): All the entries of the feed.
+
+    Returns:
+      list[str]: the header, with a copy column per headline of the entry
+      with the most headlines.
+    """
+    num_copies = max((len(e.headlines or []) for e in entries), default=0)
+
+    header = ['Variant Name']
+    if entries and entries[0].associative_term:
+      header.append('Associative Term')
+    header.extend(f'Copy {i + 1}' for i in range(num_copies))
+    return header
+
+  @staticmethod
+  def generate_table_rows(
+      entries: list[Entry],
+      header: list[str]
+      ) -> list[list[str]]:
+    """Generates the rows of the ACS feed table for some of its entries.
+
+    Args:
+      entries(list[Entry]): The entries to generate rows for.
+      header(list[str]): The header of the whole table.
+
+    Returns:
+      list[list[str]]: a row per entry, padded to the header.
+    """
+    with_associative_term = 'Associative Term' in header
+
+    rows = []
+    for entry, copies in zip(entries, ACSFeedDestination.generate_feed(entries)):
+      # Entries whose generation failed have no headlines and are left blank
+      row = [' '.join(entry.headlines or [])]
+      if with_associative_term:
+        row.append(entry.associative_term)
+      row.extend(copies)
+      row.extend([''] * (len(header) - len(row)))
+      rows.append(row)
+
+    return rows
 
-  def __generate_feed(self, entries: list[Entry]) -> list[list[str]]:
+  @staticmethod
+  def generate_feed(entries: list[Entry]) -> list[list[str]]:
     """Appends columns to each row and then the row to the feed.
 
     Args:
@@ -116,7 +262,7 @@ class ACSFeedDestination:
 
     for entry in entries:
       row = []
-      for h in entry.headlines:
+      for h in entry.headlines or []:
         row.append(h)
       feed.append(row)
 
@@ -20,15 +20,25 @@ destination subclasses.
 For example:
   - DV360FeedDestination
   - SA360FeedDestination
+  - ACSFeedDestination
 """
 
+from utils import metrics
 from utils.entry import Entry
+from output_writers.feed_validator import FeedValidator
 from output_writers.validations import ValidationRule
 
+VALIDATION_ERRORS_HEADERS = ['Error']
+
 
 class Destination:
   """Common set of methods that must be implemented by all destinations."""
 
+  # Limits of each validated element, e.g. {'headlines': {'max_len_limit': 15}}
+  validation_limits: dict[str, dict[str, int]] = {}
+  # Row attribute identifying each row in validation messages
+  row_id_attribute: str = 'row_id'
+
   def __init__(self):
     """Init method for DestinationProto."""
 
@@ -44,7 +54,8 @@ class Destination:
   def get_validation_rules(self) -> dict[str, list[ValidationRule]]:
     """Returns the set of validation rules for a destination.
 
-    Sub-classes must implement this method.
+    Sub-classes opt into validation by overriding this method, usually with
+    feed_validator.build_validation_rules.
 
     Returns:
       dict[str, list[ValidationRule]]: a dictionary of validation rules.
@@ -60,3 +71,35 @@ class Destination:
     Returns:
       list[str]: list of validation errors if any.
     """
+    validator = FeedValidator(
+        self.get_validation_rules(),
+        self.validation_limits,
+        self.row_id_attribute,
+        self.config.get('validation_workers')
+        )
+    with metrics.track('validation', type(self).__name__):
+      return validator.validate(rows)
+
+  def write_validation_errors(
+      self,
+      validation_errors: list[str],
+      sheet_id: str,
+      sheet_name: str
+      ) -> None:
+    """Writes validation errors, if any, to a '<sheet_name>_errors' sheet.
+
+    Args:
+      validation_errors(list[str]): the validation errors.
+      sheet_id(str): the output sheet id.
+      sheet_name(str): the output sheet name.
+    """
+    if not validation_errors:
+      return
+
+    self.sheets_helper.create_or_clear_sheet(sheet_id, sheet_name + '_errors')
+    self.sheets_helper.write_data_to_sheet(
+        sheet_id,
+        sheet_name + '_errors',
+        'A1',
+        [VALIDATION_ERRORS_HEADERS] + [[error] for error in validation_errors]
+        )
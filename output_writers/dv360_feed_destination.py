@@ -18,11 +18,43 @@ It transforms and loads data to a Google sheet
 with the correct format of an DV360 feed.
 """
 
+from output_writers import feed_validator
+from output_writers.destination import Destination
+from output_writers.validations import ValidationRule
 from utils.entry import Entry
 from utils.sheet_helper import GoogleSheetsHelper
 
-
-class DV360FeedDestination:
+# Columns identifying a feed row across exports
+FEED_KEY_COLUMNS = ['Term', 'Associative Term', 'SKU']
+
+# Columns of every DV360 feed, before and after the optional columns
+FEED_HEADERS_START = ['Id', 'Term']
+FEED_HEADERS_END = ['Headlines', 'Descriptions', 'Keywords', 'Active', 'Default']
+# Optional columns, included if the first entry has the attribute
+OPTIONAL_FEED_HEADERS = [
+    ('term_description', 'Term Description'),
+    ('sku', 'SKU'),
+    ('associative_term', 'Associative Term'),
+    ('associative_term_description', 'Associative Term Description'),
+    ('url', 'URL'),
+    ('image_url', 'Image URL'),
+    ('association_reason', 'Association Reason'),
+    ('association_reason', 'Relationship'),
+]
+
+VALIDATION_LIMITS = {
+    'headlines': {
+        'min_char_len_limit': 1,
+        'max_char_len_limit': 30,
+    },
+    'descriptions': {
+        'min_char_len_limit': 1,
+        'max_char_len_limit': 90,
+    },
+}
+
+
+class DV360FeedDestination(Destination):
   """DV360 Feed Destination class.
 
   It transforms and loads data to a Google sheet
@@ -31,6 +63,8 @@ class DV360FeedDestination:
 
   config: dict[str, str]
   sheets_helper: GoogleSheetsHelper
+  validation_limits = VALIDATION_LIMITS
+  row_id_attribute = 'id'
 
   def __init__(self, config: dict[str, str]):
     """Init method for DV360FeedDestination."""
@@ -41,7 +75,8 @@ class DV360FeedDestination:
       self,
       entries: list[Entry],
       sheet_id: str,
-      sheet_name: str
+      sheet_name: str,
+      incremental: bool = False
       ) -> None:
     """Write output in DV360 format.
 
@@ -49,19 +84,70 @@ class DV360FeedDestination:
       entries(list[Entry]): A list of source entries.
       sheet_id(str): the output sheet id.
       sheet_name(str): the output sheet name.
+      incremental(bool): whether to write only the rows that changed since
+      the last export instead of rewriting the sheet.
     """
-    dv360_feed = self.__generate_feed(entries)
+    validation_errors = self.validate(entries)
+    self.write_validation_errors(validation_errors, sheet_id, sheet_name)
+
+    dv360_feed = self.generate_feed(entries)
+
+    if incremental:
+      self.sheets_helper.sync_rows(
+          sheet_id,
+          sheet_name,
+          dv360_feed,
+          key_columns=FEED_KEY_COLUMNS,
+          ignore_columns=['Id']
+          )
+      return
 
     self.sheets_helper.create_or_clear_sheet(sheet_id, sheet_name)
 
     self.sheets_helper.write_data_to_sheet(
         sheet_id,
         sheet_name,
-        'A1:ZZ9999',
+        'A1',
         dv360_feed
         )
 
-  def __generate_feed(self, entries: list[Entry]) -> list[list[str]]:
+  def get_validation_rules(self) -> dict[str, list[ValidationRule]]:
+    """Returns the set of validation rules for a DV360 feed.
+
+    Returns:
+      dict[str, list[ValidationRule]]: a dictionary with the validation rules
+    """
+    return feed_validator.build_validation_rules([
+        ('url', 'url'),
+        ('char_length', 'headlines'),
+        ('unique_in_list', 'headlines'),
+        ('case', 'headlines'),
+        ('char_length', 'descriptions'),
+        ('unique_in_list', 'descriptions'),
+        ('case', 'descriptions'),
+    ])
+
+  @staticmethod
+  def generate_header(entries: list[Entry]) -> list[str]:
+    """Generates the header of the feed, from its first entry.
+
+    Args:
+      entries(list[Entry]): The entries of the feed, possibly none.
+
+    Returns:
+      list[str]: the header, without optional columns if there are no entries.
+    """
+    header = list(FEED_HEADERS_START)
+    if entries:
+      header.extend(
+          column for attribute, column in OPTIONAL_FEED_HEADERS
+          if getattr(entries[0], attribute)
+          )
+    header.extend(FEED_HEADERS_END)
+    return header
+
+  @staticmethod
+  def generate_feed(entries: list[Entry]) -> list[list[str]]:
     """Appends columns to each row and then the row to the feed.
 
     Args:
@@ -70,33 +156,8 @@ class DV360FeedDestination:
     Returns:
       list[list[str]]: the feed ready to be exported to spreadsheet
     """
-    header = []
-    header.append('Id')
-    header.append('Term')
-    if entries[0].term_description:
-      header.append('Term Description')
-    if entries[0].sku:
-      header.append('SKU')
-    if entries[0].associative_term:
-      header.append('Associative Term')
-    if entries[0].associative_term_description:
-      header.append('Associative Term Description')
-    if entries[0].url:
-      header.append('URL')
-    if entries[0].image_url:
-      header.append('Image URL')
-    if entries[0].association_reason:
-      header.append('Association Reason')
-    if entries[0].association_reason:
-      header.append('Relationship')
-    header.append('Headlines')
-    header.append('Descriptions')
-    header.append('Keywords')
-    header.append('Active')
-    header.append('Default')
-
     feed = []
-    feed.append(header)
+    feed.append(DV360FeedDestination.generate_header(entries))
 
     for entry in entries:
       row = []
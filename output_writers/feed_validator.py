@@ -0,0 +1,588 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Columnar validation engine for feeds.
+
+Validation rules are compiled once per feed, resolving their limits and the
+static parts of their error messages up front. Each rule then runs over a
+whole column of the feed at once, and error messages are only formatted for
+the rows that fail.
+
+Rules are registered by name, so any destination can opt into them with
+build_validation_rules. Large feeds can be split into row ranges validated in
+a pool of forked processes, enabled with the validation_workers config.
+"""
+
+import concurrent.futures
+import itertools
+import multiprocessing
+import string
+import threading
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from output_writers import validations
+from output_writers.validations import ValidationRule
+
+# Characters replaced in headlines and descriptions before validating them
+REPLACEMENTS = str.maketrans({"'": '"', '[': '{', ']': '}'})
+# Joins the elements of a column to translate them in a single call
+ELEMENT_SEPARATOR = '\0'
+
+# Feeds with at least this many rows are validated in a process pool, if
+# the validation_workers config enables it
+PARALLEL_MIN_ROWS = 50000
+
+# Feed validated by the forked processes of the process pool
+_forked_feed: dict[str, Any] = {}
+_forked_feed_lock = threading.Lock()
+
+# Rule scopes: transforms modify rows in place and run before any check,
+# single row rules report per row and all rows rules report once per feed
+TRANSFORM = 'transform'
+SINGLE_ROW = 'single_row'
+ALL_ROWS = 'all_rows'
+
+# Registered rules by name: (scope, error message, function)
+RULE_REGISTRY: dict[str, tuple[str, str, Callable]] = {}
+
+
+def register_rule(name: str, scope: str, error_message: str):
+  """Registers a columnar validation rule function under a name.
+
+  Args:
+    name(str): the name destinations use to opt into the rule.
+    scope(str): TRANSFORM, SINGLE_ROW or ALL_ROWS.
+    error_message(str): the error message template of the rule.
+
+  Returns:
+    The decorator registering the function.
+  """
+  def decorator(function: Callable) -> Callable:
+    RULE_REGISTRY[name] = (scope, error_message, function)
+    return function
+  return decorator
+
+
+def build_validation_rules(
+    rules: list[tuple[str, str]]
+    ) -> dict[str, list[ValidationRule]]:
+  """Builds validation rules from registered rule names.
+
+  Args:
+    rules(list[tuple[str, str]]): (rule name, elements to validate) tuples, in
+    the order they should run.
+
+  Returns:
+    dict[str, list[ValidationRule]]: the 'transform_rules', 'all_rows_rules'
+    and 'single_row_rules'.
+
+  Raises:
+    ValueError: If a rule name is not registered.
+  """
+  validation_rules = {
+      'transform_rules': [],
+      'all_rows_rules': [],
+      'single_row_rules': [],
+      }
+  for name, elements in rules:
+    if name not in RULE_REGISTRY:
+      raise ValueError(f'Unknown validation rule: {name}')
+    scope, error_message, function = RULE_REGISTRY[name]
+    validation_rules[scope + '_rules'].append(
+        ValidationRule(f'{name} {elements}', elements, error_message, function)
+        )
+  return validation_rules
+
+
+class CompiledRule:
+  """A validation rule with its limits and static message fields resolved."""
+
+  rule: ValidationRule
+  limits: dict[str, int]
+  message_template: str
+  detail_field: str | None
+
+  def __init__(self, rule: ValidationRule, limits: dict[str, int]):
+    self.rule = rule
+    self.limits = limits
+
+    static_fields = {'elements': rule.elements_to_validate}
+    static_fields.update({k: str(v) for k, v in limits.items()})
+
+    # Static fields are substituted now, row fields are kept as placeholders
+    field_names = [
+        field for _, field, _, _ in string.Formatter().parse(
+            rule.error_message
+            ) if field
+        ]
+    self.message_template = rule.error_message.format(**{
+        field: static_fields.get(field, '{' + field + '}')
+        for field in field_names
+        })
+    row_fields = [
+        field for field in field_names
+        if field not in static_fields and field != 'row_id'
+        ]
+    self.detail_field = row_fields[0] if row_fields else None
+
+  def format_message(self, row_id: str, detail: str) -> str:
+    """Formats the error message of a failing row.
+
+    Args:
+      row_id(str): the id of the failing row.
+      detail(str): the failing elements or value.
+
+    Returns:
+      str: the error message.
+    """
+    fields = {'row_id': row_id}
+    if self.detail_field:
+      fields[self.detail_field] = detail
+    return self.message_template.format(**fields)
+
+
+class FeedValidator:
+  """Validates a whole feed column by column."""
+
+  transform_rules: list[CompiledRule]
+  all_rows_rules: list[CompiledRule]
+  single_row_rules: list[CompiledRule]
+  row_id_attribute: str
+  max_workers: int | None
+
+  def __init__(
+      self,
+      validation_rules: dict[str, list[ValidationRule]],
+      validation_limits: dict[str, dict[str, int]],
+      row_id_attribute: str = 'row_id',
+      max_workers: int | None = None
+      ):
+    """Init method for FeedValidator.
+
+    Args:
+      validation_rules(dict[str, list[ValidationRule]]): the
+      'transform_rules', 'all_rows_rules' and 'single_row_rules' to validate.
+      validation_limits(dict[str, dict[str, int]]): the limits of each
+      element to validate.
+      row_id_attribute(str): the row attribute used as row id in messages.
+      max_workers(int | None): the processes used to validate large feeds.
+      The process pool is disabled by default, or if 1.
+    """
+    self.transform_rules, self.all_rows_rules, self.single_row_rules = [
+        [
+            CompiledRule(
+                rule, validation_limits.get(rule.elements_to_validate, {})
+                )
+            for rule in validation_rules.get(key) or []
+            ]
+        for key in ['transform_rules', 'all_rows_rules', 'single_row_rules']
+        ]
+    self.row_id_attribute = row_id_attribute
+    self.max_workers = max_workers
+
+  def validate(self, rows: list[object]) -> list[str]:
+    """Validates the rows of a feed.
+
+    Transform rules run first, on all rows. Single row rules run on ranges of
+    rows in a process pool if enabled and the feed is large enough.
+
+    Args:
+      rows(list[object]): the feed rows to validate.
+
+    Returns:
+      list[str]: list of validation errors if any, all rows errors first and
+      then errors of each row in rule order.
+    """
+    if not rows:
+      return []
+
+    row_ids = [str(getattr(row, self.row_id_attribute)) for row in rows]
+    columns = {}
+    for compiled_rule in (
+        self.transform_rules + self.all_rows_rules + self.single_row_rules
+        ):
+      column = compiled_rule.rule.elements_to_validate
+      if column not in columns:
+        columns[column] = pd.Series([getattr(row, column) for row in rows])
+
+    for compiled_rule in self.transform_rules:
+      compiled_rule.rule.function(
+          columns[compiled_rule.rule.elements_to_validate],
+          compiled_rule.limits
+          )
+
+    validation_errors = []
+    for compiled_rule in self.all_rows_rules:
+      details = compiled_rule.rule.function(
+          columns[compiled_rule.rule.elements_to_validate],
+          compiled_rule.limits
+          )
+      if details is not None:
+        validation_errors.extend(
+            compiled_rule.format_message('', detail) for detail in details
+            )
+
+    failures = self.__validate_single_row_rules(columns, len(rows))
+
+    failures.sort(key=lambda failure: (failure[0], failure[1]))
+    validation_errors.extend(
+        self.single_row_rules[rule_index].format_message(
+            row_ids[row_index], detail
+            )
+        for row_index, rule_index, detail in failures
+        )
+
+    return validation_errors
+
+  def __validate_single_row_rules(
+      self,
+      columns: dict[str, pd.Series],
+      num_rows: int
+      ) -> list[tuple[int, int, str]]:
+    """Runs the single row rules, in a process pool for large feeds if enabled.
+
+    Args:
+      columns(dict[str, pd.Series]): the columns of the feed.
+      num_rows(int): the number of rows of the feed.
+
+    Returns:
+      list[tuple[int, int, str]]: (row index, rule index, detail) failures.
+    """
+    if (
+        not self.max_workers
+        or self.max_workers <= 1
+        or num_rows < PARALLEL_MIN_ROWS
+        or 'fork' not in multiprocessing.get_all_start_methods()
+        ):
+      return _validate_chunk(self.single_row_rules, columns)
+
+    chunk_size = -(-num_rows // self.max_workers)
+    failures = []
+    with _forked_feed_lock:
+      # Forked processes inherit the columns, so only row ranges and the
+      # failures are pickled, and __main__ is not imported again
+      _forked_feed['rules'] = self.single_row_rules
+      _forked_feed['columns'] = columns
+      try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('fork')
+            ) as executor:
+          futures = [
+              executor.submit(_validate_forked_rows, i, i + chunk_size)
+              for i in range(0, num_rows, chunk_size)
+              ]
+          for future in futures:
+            failures.extend(future.result())
+      finally:
+        _forked_feed.clear()
+
+    return failures
+
+
+def _validate_forked_rows(start: int, stop: int) -> list[tuple[int, int, str]]:
+  """Runs the single row rules of the forked feed over a range of rows.
+
+  Args:
+    start(int): the position of the first row.
+    stop(int): the position after the last row.
+
+  Returns:
+    list[tuple[int, int, str]]: (row index, rule index, detail) failures.
+  """
+  return _validate_chunk(
+      _forked_feed['rules'],
+      {
+          name: column.iloc[start:stop]
+          for name, column in _forked_feed['columns'].items()
+      }
+      )
+
+
+def _validate_chunk(
+    single_row_rules: list[CompiledRule],
+    columns: dict[str, pd.Series]
+    ) -> list[tuple[int, int, str]]:
+  """Runs single row rules over a chunk of rows.
+
+  Args:
+    single_row_rules(list[CompiledRule]): the rules to run.
+    columns(dict[str, pd.Series]): the columns of the chunk, indexed by the
+    position of each row in the feed.
+
+  Returns:
+    list[tuple[int, int, str]]: (row index, rule index, detail) failures.
+  """
+  failures = []
+  for rule_index, compiled_rule in enumerate(single_row_rules):
+    details = compiled_rule.rule.function(
+        columns[compiled_rule.rule.elements_to_validate],
+        compiled_rule.limits
+        )
+    if details is not None:
+      for row_index, detail in details.items():
+        failures.append((row_index, rule_index, detail))
+  return failures
+
+
+def _explode(column: pd.Series) -> pd.Series:
+  """Explodes a column of lists into one element per row, keeping row index.
+
+  Args:
+    column(pd.Series): a column of lists.
+
+  Returns:
+    pd.Series: the elements of all lists, indexed by the row they belong to.
+  """
+  return column.explode().dropna().astype(str)
+
+
+def _map_elements(
+    function: Callable, elements: pd.Series, dtype: type
+    ) -> np.ndarray:
+  """Maps a function over string elements into a numpy array.
+
+  Faster than the pandas str accessor, which also handles missing values.
+
+  Args:
+    function(Callable): the function, e.g. len.
+    elements(pd.Series): the elements of _explode.
+    dtype(type): the type of the results.
+
+  Returns:
+    np.ndarray: the result for each element.
+  """
+  return np.fromiter(
+      map(function, elements.tolist()),
+      dtype=dtype,
+      count=len(elements)
+      )
+
+
+def _join_by_row(elements: pd.Series, separator: str = ', ') -> pd.Series:
+  """Joins the failing elements of each row.
+
+  Args:
+    elements(pd.Series): the failing elements, indexed by row.
+    separator(str): the separator between elements.
+
+  Returns:
+    pd.Series: the joined elements of each failing row.
+  """
+  joined = {}
+  for row, element in zip(elements.index.tolist(), elements.tolist()):
+    joined.setdefault(row, []).append(element)
+  return pd.Series(
+      {row: separator.join(row_elements) for row, row_elements in joined.items()},
+      dtype=object
+      )
+
+
+@register_rule(
+    'replace_quotes',
+    TRANSFORM,
+    'Id {row_id} - Single quotes and square brackets replaced in {elements}'
+    )
+def replace_single_quotes_square_brackets(
+    column: pd.Series, limits: dict[str, int]
+    ) -> None:
+  """Replaces single quotes and square brackets in lists, in place.
+
+  All the elements of the column are translated in a single call, and only
+  the lists with a replaced character are updated.
+
+  Args:
+    column(pd.Series): a column of headlines/descriptions lists.
+    limits(dict[str, int]): unused.
+  """
+  lists = [elements for elements in column if elements]
+  elements = list(itertools.chain.from_iterable(lists))
+  text = ELEMENT_SEPARATOR.join(elements)
+  translated = text.translate(REPLACEMENTS)
+  if translated == text:
+    return
+
+  translated_elements = translated.split(ELEMENT_SEPARATOR)
+  if len(translated_elements) != len(elements):
+    # An element contains the separator, translate them one by one
+    translated_elements = [element.translate(REPLACEMENTS) for element in elements]
+
+  start = 0
+  for row_elements in lists:
+    end = start + len(row_elements)
+    if translated_elements[start:end] != row_elements:
+      row_elements[:] = translated_elements[start:end]
+    start = end
+
+
+@register_rule(
+    'list_length',
+    SINGLE_ROW,
+    'Id {row_id} - {elements} list should have min {min_len_limit} and '
+    'max {max_len_limit} elements.'
+    )
+def validate_list_length(
+    column: pd.Series, limits: dict[str, int]
+    ) -> pd.Series:
+  """Validates that list lengths are within the limits.
+
+  Args:
+    column(pd.Series): a column of lists.
+    limits(dict[str, int]): the min_len_limit and max_len_limit.
+
+  Returns:
+    pd.Series: an empty detail for each failing row.
+  """
+  lengths = column.map(len)
+  failing = (
+      (lengths < limits['min_len_limit']) | (lengths > limits['max_len_limit'])
+      )
+  return pd.Series('', index=column.index[failing])
+
+
+@register_rule(
+    'char_length',
+    SINGLE_ROW,
+    'Id {row_id} - The following {elements}: {incorrect_char_len_elements} '
+    'should have min {min_char_len_limit} and max {max_char_len_limit} '
+    'characters.'
+    )
+def validate_char_length(
+    column: pd.Series, limits: dict[str, int]
+    ) -> pd.Series:
+  """Validates that every element of the lists has a length within limits.
+
+  Args:
+    column(pd.Series): a column of lists of strings.
+    limits(dict[str, int]): the min_char_len_limit and max_char_len_limit.
+
+  Returns:
+    pd.Series: the incorrect elements of each failing row.
+  """
+  elements = _explode(column)
+  lengths = _map_elements(len, elements, np.int64)
+  failing = (
+      (lengths < limits['min_char_len_limit']) |
+      (lengths > limits['max_char_len_limit'])
+      )
+  return _join_by_row(elements[failing])
+
+
+@register_rule(
+    'unique_in_list',
+    SINGLE_ROW,
+    'Id {row_id} - Duplicate {elements} found: {duplicate_elements}.'
+    )
+def validate_unique_in_list(
+    column: pd.Series, limits: dict[str, int]
+    ) -> pd.Series:
+  """Validates that the elements of each list are unique.
+
+  Args:
+    column(pd.Series): a column of lists.
+    limits(dict[str, int]): unused.
+
+  Returns:
+    pd.Series: the duplicate elements of each failing row.
+  """
+  elements = _explode(column)
+  frame = pd.DataFrame({'row': elements.index, 'element': elements.values})
+  duplicated = frame.duplicated(keep='first').to_numpy()
+  return _join_by_row(elements[duplicated], ',')
+
+
+@register_rule(
+    'case',
+    SINGLE_ROW,
+    'Id {row_id} - The following {elements}: {incorrect_case_elements} '
+    'contain all words in uppercase.'
+    )
+def validate_case(column: pd.Series, limits: dict[str, int]) -> pd.Series:
+  """Validates that list elements don't have all their words in upper case.
+
+  Args:
+    column(pd.Series): a column of lists of strings.
+    limits(dict[str, int]): unused.
+
+  Returns:
+    pd.Series: the upper case elements of each failing row.
+  """
+  elements = _explode(column)
+  return _join_by_row(elements[_map_elements(str.isupper, elements, bool)])
+
+
+@register_rule(
+    'url',
+    SINGLE_ROW,
+    'Id {row_id} - The URL {url} should be a valid URL.'
+    )
+def validate_url(column: pd.Series, limits: dict[str, int]) -> pd.Series:
+  """Validates that non empty urls are valid.
+
+  Each distinct url is only validated once.
+
+  Args:
+    column(pd.Series): a column of urls.
+    limits(dict[str, int]): unused.
+
+  Returns:
+    pd.Series: the invalid url of each failing row.
+  """
+  urls = column[column.fillna('').astype(bool)]
+  valid_urls = {url: validations.valid_url(url) for url in urls.unique()}
+  return urls[~urls.map(valid_urls).astype(bool)]
+
+
+@register_rule(
+    'number',
+    SINGLE_ROW,
+    'Id {row_id} - {elements} {value} should be a number.'
+    )
+def validate_number(column: pd.Series, limits: dict[str, int]) -> pd.Series:
+  """Validates that values are numeric.
+
+  Args:
+    column(pd.Series): a column of values.
+    limits(dict[str, int]): unused.
+
+  Returns:
+    pd.Series: the non numeric value of each failing row.
+  """
+  values = column.astype(str)
+  return values[~values.str.isnumeric()]
+
+
+@register_rule(
+    'unique_across_rows',
+    ALL_ROWS,
+    'Duplicate {elements} found: {duplicate_elements}.'
+    )
+def validate_unique_across_rows(
+    column: pd.Series, limits: dict[str, int]
+    ) -> pd.Series:
+  """Validates that values are unique across all rows of the feed.
+
+  Args:
+    column(pd.Series): a column of values.
+    limits(dict[str, int]): unused.
+
+  Returns:
+    pd.Series: a single detail with all duplicate values, empty if valid.
+  """
+  duplicates = column[column.duplicated(keep='first')].astype(str)
+  if duplicates.empty:
+    return pd.Series(dtype=str)
+  return pd.Series([', '.join(duplicates)])
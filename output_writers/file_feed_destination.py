@@ -0,0 +1,216 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""File Feed Destination class.
+
+It transforms and loads data to a CSV, JSONL or Parquet file, local or in a
+mounted GCS bucket, with the layout of an SA360, DV360 or ACS feed.
+"""
+
+import csv
+import json
+import logging
+import os
+from typing import Iterator
+
+import pyarrow
+import pyarrow.parquet
+from output_writers.acs_feed_destination import ACSFeedDestination
+from output_writers.destination import Destination
+from output_writers.dv360_feed_destination import DV360FeedDestination
+from output_writers.sa360_feed_destination import FEED_HEADERS
+from output_writers.sa360_feed_destination import SA360FeedDestination
+from utils.entry import Entry
+from utils.enums import Destination as DestinationType
+from utils.enums import FeedLayout
+
+# Rows generated and written to the file at a time, and Parquet row group size
+CHUNK_SIZE = 10000
+
+
+class FileFeedDestination(Destination):
+  """File Feed Destination class.
+
+  It transforms and loads data to a CSV, JSONL or Parquet file
+  with the layout of an SA360, DV360 or ACS feed.
+  """
+
+  config: dict[str, str]
+  file_format: DestinationType
+
+  def __init__(self, config: dict[str, str], file_format: DestinationType):
+    """Init method for FileFeedDestination.
+
+    Args:
+      config(dict[str, str]): A dictionary containing configuration parameters.
+      file_format(DestinationType): CSV_FILE, JSONL_FILE or PARQUET_FILE.
+    """
+    self.config = config
+    self.file_format = file_format
+
+  def write_destination_output(
+      self,
+      entries: list[Entry],
+      output_path: str,
+      feed_layout: FeedLayout
+      ) -> None:
+    """Write output to a file with the given feed layout.
+
+    Args:
+      entries(list[Entry]): A list of source entries.
+      output_path(str): The output file path.
+      feed_layout(FeedLayout): The layout of the feed to write.
+    """
+    header, chunks = self.generate_feed_chunks(entries, feed_layout)
+
+    directory = os.path.dirname(output_path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+
+    logging.info(' Writing %d rows to file: %s', len(entries), output_path)
+
+    if self.file_format == DestinationType.CSV_FILE:
+      self.__write_csv(output_path, header, chunks)
+    elif self.file_format == DestinationType.JSONL_FILE:
+      self.__write_jsonl(output_path, header, chunks)
+    elif self.file_format == DestinationType.PARQUET_FILE:
+      self.__write_parquet(output_path, header, chunks)
+    else:
+      raise ValueError(f'Unsupported file format: {self.file_format}')
+
+    logging.info(' File written successfully')
+
+  def generate_feed_chunks(
+      self,
+      entries: list[Entry],
+      feed_layout: FeedLayout
+      ) -> tuple[list[str], Iterator[list[list[str]]]]:
+    """Generates the feed with the given layout, CHUNK_SIZE rows at a time.
+
+    Rows are generated from the entries of each chunk as it is written, so
+    only one chunk of the feed is in memory at a time.
+
+    Args:
+      entries(list[Entry]): A list of source entries.
+      feed_layout(FeedLayout): The layout of the feed.
+
+    Returns:
+      tuple[list[str], Iterator[list[list[str]]]]: the header of the feed and
+      its chunks of rows.
+    """
+    if feed_layout == FeedLayout.SA360_FEED:
+      header = FEED_HEADERS
+
+      def generate_rows(chunk: list[Entry]) -> list[list[str]]:
+        feed_rows = SA360FeedDestination._convert_entries_to_sa360_feed_rows(
+            chunk
+            )
+        return SA360FeedDestination.generate_feed(feed_rows)[1:]
+    elif feed_layout == FeedLayout.DV360_FEED:
+      header = DV360FeedDestination.generate_header(entries)
+
+      def generate_rows(chunk: list[Entry]) -> list[list[str]]:
+        return DV360FeedDestination.generate_feed(chunk)[1:]
+    elif feed_layout == FeedLayout.ACS_FEED:
+      header = ACSFeedDestination.generate_table_header(entries)
+
+      def generate_rows(chunk: list[Entry]) -> list[list[str]]:
+        return ACSFeedDestination.generate_table_rows(chunk, header)
+    else:
+      raise ValueError(f'Unsupported feed layout: {feed_layout}')
+
+    chunks = (
+        generate_rows(entries[i:i + CHUNK_SIZE])
+        for i in range(0, len(entries), CHUNK_SIZE)
+        )
+    return header, chunks
+
+  def __to_str(self, value: object) -> str:
+    """Converts a feed value to a string.
+
+    Args:
+      value(object): The value to convert.
+
+    Returns:
+      str: The value as a string, empty if None.
+    """
+    return '' if value is None else str(value)
+
+  def __write_csv(
+      self,
+      output_path: str,
+      header: list[str],
+      chunks: Iterator[list[list[str]]]
+      ) -> None:
+    """Writes the feed to a CSV file.
+
+    Args:
+      output_path(str): The output file path.
+      header(list[str]): The header row.
+      chunks(Iterator[list[list[str]]]): The chunks of feed rows.
+    """
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+      writer = csv.writer(f)
+      writer.writerow(header)
+      for chunk in chunks:
+        writer.writerows(chunk)
+
+  def __write_jsonl(
+      self,
+      output_path: str,
+      header: list[str],
+      chunks: Iterator[list[list[str]]]
+      ) -> None:
+    """Writes the feed to a JSONL file, one JSON object per row.
+
+    Args:
+      output_path(str): The output file path.
+      header(list[str]): The header row, used as keys.
+      chunks(Iterator[list[list[str]]]): The chunks of feed rows.
+    """
+    with open(output_path, 'w', encoding='utf-8') as f:
+      for chunk in chunks:
+        f.writelines(
+            json.dumps(dict(zip(header, row)), ensure_ascii=False, default=str)
+            + '\n'
+            for row in chunk
+            )
+
+  def __write_parquet(
+      self,
+      output_path: str,
+      header: list[str],
+      chunks: Iterator[list[list[str]]]
+      ) -> None:
+    """Writes the feed to a Parquet file, one row group per chunk.
+
+    All columns are written as strings.
+
+    Args:
+      output_path(str): The output file path.
+      header(list[str]): The header row, used as column names.
+      chunks(Iterator[list[list[str]]]): The chunks of feed rows.
+    """
+    schema = pyarrow.schema([(name, pyarrow.string()) for name in header])
+
+    with pyarrow.parquet.ParquetWriter(output_path, schema) as writer:
+      for chunk in chunks:
+        columns = [
+            pyarrow.array(
+                [self.__to_str(row[i]) if i < len(row) else '' for row in chunk],
+                type=pyarrow.string()
+                )
+            for i in range(len(header))
+            ]
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
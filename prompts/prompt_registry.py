@@ -0,0 +1,285 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prompt registry.
+
+It resolves the prompt template of each request variant once, and keeps it
+parsed, so prompts are rendered without walking the prompts dictionaries or
+parsing the format strings again.
+"""
+
+import functools
+import string
+from typing import Any, Callable
+
+from prompts.prompts import prompts
+
+
+def _render_parts(
+    parts: list[tuple[str, str | None]],
+    values: dict[str, Any]
+    ) -> str:
+  """Joins parsed literal text and field values.
+
+  Args:
+    parts (list[tuple[str, str | None]]): The literal text and field name of
+    each part of a template.
+    values (dict[str, Any]): The value of each field.
+
+  Returns:
+    str: The rendered text.
+  """
+  return ''.join(
+      literal + (str(values[field]) if field is not None else '')
+      for literal, field in parts
+      )
+
+
+class PromptTemplate:
+  """A format string parsed once into literal text and fields."""
+
+  name: str
+  parts: list[tuple[str, str | None]]
+  fields: frozenset[str]
+  static_text: str
+
+  def __init__(
+      self,
+      name: str,
+      template: str,
+      token_counter: Callable[[str], int] | None = None
+      ):
+    """Init method for PromptTemplate.
+
+    Args:
+      name (str): The path of the template in the prompts dictionary.
+      template (str): A str.format template.
+      token_counter (Callable[[str], int] | None): Counts the tokens of a
+      text, used for static_tokens.
+    """
+    self.name = name
+    self.parts = [
+        (literal, field)
+        for literal, field, _, _ in string.Formatter().parse(template)
+        ]
+    self.fields = frozenset(field for _, field in self.parts if field)
+    self.static_text = ''.join(literal for literal, _ in self.parts)
+    self.token_counter = token_counter
+
+  @functools.cached_property
+  def static_tokens(self) -> int:
+    """The tokens of the template without its fields."""
+    if self.token_counter is None:
+      return 0
+    return self.token_counter(self.static_text)
+
+  def render(self, values: dict[str, Any]) -> str:
+    """Renders the template, like str.format.
+
+    Args:
+      values (dict[str, Any]): The value of each field. Extra values are
+      ignored.
+
+    Returns:
+      str: The prompt.
+
+    Raises:
+      KeyError: If the value of a field is missing.
+    """
+    return _render_parts(self.parts, values)
+
+  def split(
+      self,
+      values: dict[str, Any],
+      constant_fields: frozenset[str]
+      ) -> tuple[str, str]:
+    """Renders the template split before its first variable field.
+
+    The prefix only depends on the literal text and the constant fields, so
+    it is shared by every prompt of a task, and prefix + suffix is the same
+    as render(values).
+
+    Args:
+      values (dict[str, Any]): The value of each field.
+      constant_fields (frozenset[str]): The fields with the same value in
+      every prompt of a task, e.g. company.
+
+    Returns:
+      tuple[str, str]: The shared prefix and the variable suffix.
+    """
+    for i, (_, field) in enumerate(self.parts):
+      if field is not None and field not in constant_fields:
+        prefix = _render_parts(self.parts[:i], values) + self.parts[i][0]
+        suffix = str(values[field]) + _render_parts(self.parts[i+1:], values)
+        return prefix, suffix
+    return self.render(values), ''
+
+  def count_tokens(self, values: dict[str, Any]) -> int:
+    """Counts the tokens of the rendered template.
+
+    The static tokens are counted once, and only the values are counted on
+    each call, so the result may differ by a few tokens at the boundaries.
+
+    Args:
+      values (dict[str, Any]): The value of each field.
+
+    Returns:
+      int: The number of tokens.
+    """
+    if self.token_counter is None:
+      return 0
+    return self.static_tokens + sum(
+        self.token_counter(str(values[field]))
+        for _, field in self.parts
+        if field is not None
+        )
+
+
+class PromptRegistry:
+  """Compiled prompt templates of a language, resolved once per variant."""
+
+  language: str
+
+  def __init__(
+      self,
+      language: str,
+      token_counter: Callable[[str], int] | None = None
+      ):
+    """Init method for PromptRegistry.
+
+    Args:
+      language (str): The prompts language, e.g. EN.
+      token_counter (Callable[[str], int] | None): Counts the tokens of a
+      text, used for the static token counts.
+    """
+    self.language = language
+    self.token_counter = token_counter
+
+  @functools.cache
+  def get(self, *path: str) -> PromptTemplate:
+    """Returns the compiled template at a path of the prompts dictionary.
+
+    Args:
+      *path (str): The keys of the template, e.g. 'GENERATION', 'PATHS'.
+
+    Returns:
+      PromptTemplate: The compiled template.
+    """
+    template = prompts[self.language]
+    for key in path:
+      template = template[key]
+    return PromptTemplate('/'.join(path), template, self.token_counter)
+
+  @functools.cache
+  def get_association_template(
+      self,
+      has_term_description: bool,
+      has_associative_term_description: bool
+      ) -> PromptTemplate:
+    """Returns the term-associative_term association template.
+
+    Args:
+      has_term_description (bool): If the term has a description.
+      has_associative_term_description (bool): If the associative term has a
+      description.
+
+    Returns:
+      PromptTemplate: The variant for the descriptions, with the common part.
+    """
+    if has_term_description and has_associative_term_description:
+      variant = 'WITH_BOTH_DESCRIPTIONS'
+    elif has_term_description:
+      variant = 'WITH_TERM_DESCRIPTION'
+    elif has_associative_term_description:
+      variant = 'WITH_ASSOCIATIVE_TERM_DESCRIPTION'
+    else:
+      variant = 'WITHOUT_DESCRIPTIONS'
+
+    association = prompts[self.language]['ASSOCIATION']
+    return PromptTemplate(
+        f'ASSOCIATION/{variant}+COMMON_PART',
+        association[variant] + association['COMMON_PART'],
+        self.token_counter
+        )
+
+  @functools.cache
+  def get_copy_generation_template(
+      self,
+      t: str,
+      has_associative_term: bool,
+      must_find_relationship: bool,
+      has_term_description: bool,
+      has_associative_term_description: bool
+      ) -> PromptTemplate:
+    """Returns the copy generation template.
+
+    Args:
+      t (str): The type of copies (headlines|descriptions|paths).
+      has_associative_term (bool): If the entry has an associative term.
+      must_find_relationship (bool): If an association between
+      first_term and second_term must be found.
+      has_term_description (bool): If the term has a description.
+      has_associative_term_description (bool): If the associative term has a
+      description.
+
+    Returns:
+      PromptTemplate: The variant for the copy type and entry.
+
+    Raises:
+      ValueError: If the type is not supported.
+    """
+    if t == 'paths':
+      if has_term_description:
+        return self.get('GENERATION', 'PATHS_WITH_TERM_DESCRIPTION')
+      return self.get('GENERATION', 'PATHS_WITHOUT_TERM_DESCRIPTION')
+    elif t not in ('headlines', 'descriptions'):
+      raise ValueError("Only types supported: 'headlines' and 'descriptions'")
+
+    if not has_associative_term:
+      if has_term_description:
+        variant = 'WITH_DESCRIPTION'
+      else:
+        variant = 'WITHOUT_DESCRIPTION'
+      return self.get('GENERATION', 'WITHOUT_ASSOCIATIVE_TERM', variant)
+
+    if not must_find_relationship:
+      variant = 'WITHOUT_RELATIONSHIP_AND_DESCRIPTIONS'
+    elif has_term_description and has_associative_term_description:
+      variant = 'WITH_BOTH_DESCRIPTIONS'
+    elif has_term_description:
+      variant = 'WITH_TERM_DESCRIPTION'
+    elif has_associative_term_description:
+      variant = 'WITH_ASSOCIATIVE_TERM_DESCRIPTION'
+    else:
+      variant = 'WITHOUT_DESCRIPTIONS'
+    return self.get('GENERATION', 'WITH_ASSOCIATIVE_TERM', variant)
+
+  def get_static_token_counts(self) -> dict[str, int]:
+    """Returns the static token count of every template of the language.
+
+    Returns:
+      dict[str, int]: The static tokens of each template, by path.
+    """
+    counts = {}
+
+    def walk(templates: dict[str, Any], path: tuple[str, ...]) -> None:
+      for key, value in templates.items():
+        if isinstance(value, dict):
+          walk(value, path + (key,))
+        else:
+          template = self.get(*path, key)
+          counts[template.name] = template.static_tokens
+
+    walk(prompts[self.language], ())
+    return counts
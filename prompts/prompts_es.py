@@ -165,7 +165,7 @@ prompts_es = {
         Dame el resultado en el siguiente formato:
         "Característica 1", "Característica 2", ..., "Característica N"
     """,
-    'KEYWORD_GENERATION': """
+    'KEYWORDS_GENERATION': """
         Dado el término '{term}', dame una lista de hasta 10 keywords para Google ads que pueda usar relacionadas con el término.
         Dame el resultado de la siguiente forma:
         ["Característica 1", "Característica 2", ..., "Característica N"]
@@ -18,13 +18,20 @@ This module contains all the methods for
 associating two terms and generating content.
 """
 
+import collections
+import copy
+import datetime
 import logging
 import random
 import re
 import requests
+import time
+
+from typing import Any, Callable
 
 from alive_progress import alive_bar
-from prompts.prompts import prompts
+from prompts.prompt_registry import PromptRegistry
+from prompts.prompt_registry import PromptTemplate
 from services.keyword_suggestion_service import KeywordSuggestionService
 from utils.bigquery_helper import BigQueryHelper
 from utils.entry import Entry
@@ -32,16 +39,46 @@ from utils.enums import FirstTermSource
 from utils.enums import SecondTermSource
 from utils.gemini_helper import GeminiHelper
 from utils.sheet_helper import GoogleSheetsHelper
+from utils.task_progress import TaskProgress
+from utils.token_usage import TokenUsage
+from utils import circuit_breaker
+from utils import tracing
 
 # Logger config
 logging.basicConfig()
 logging.root.setLevel(logging.INFO)
 
+GOOGLE_TRENDS_US_TABLE = 'bigquery-public-data.google_trends.top_terms'
+GOOGLE_TRENDS_INTERNATIONAL_TABLE = (
+    'bigquery-public-data.google_trends.international_top_terms'
+    )
+# Seconds the latest refresh date of a Google Trends table is reused before
+# it is queried again. Tables are refreshed once a day, so cached top terms
+# are at most this stale
+GOOGLE_TRENDS_REFRESH_DATE_TTL = 15 * 60
+
+# Maximum length of each copy type, in characters
+COPY_LENGTHS = {'headlines': 30, 'descriptions': 90, 'paths': 15}
+# Expected output tokens of requests that don't generate copies
+PLANNED_OUTPUT_TOKENS = {
+    'association': 80,
+    'keywords': 80,
+    'feature_extraction': 150,
+}
+# Seconds per Gemini call if no call of that kind was measured yet
+DEFAULT_CALL_LATENCY = 3.0
+# Prompt fields with the same value in every copy prompt of a task
+PROMPT_CONSTANT_FIELDS = frozenset(['n', 'length', 'location', 'company'])
+
 
 class ContentGeneratorService:
   """Methods for associating two terms and generating content.
   """
   entries: list[Entry]
+  google_trends_cache: dict[tuple[str, datetime.date, int], list[str]]
+  google_trends_refresh_dates: dict[str, tuple[datetime.date, float]]
+  progress: TaskProgress
+  usage: TokenUsage
 
   def __init__(self, config: dict[str, str]):
     self.config = config
@@ -50,44 +87,315 @@ class ContentGeneratorService:
     if 'google_ads_developer_token' in self.config and 'login_customer_id' in self.config:
         self.keyword_suggestion_service = KeywordSuggestionService(self.config)
     self.sheets_helper = GoogleSheetsHelper(self.config)
+    self.prompt_registry = PromptRegistry(
+        self.config['language'],
+        self.gemini_helper.count_tokens
+        )
+    self.google_trends_cache = {}
+    self.google_trends_refresh_dates = {}
+    self.dry_run = False
+    self.batch_mode = False
+    self.stream = False
+    self.started_at = None
+    self.on_entries_done = None
 
   def generate_content(
       self,
       first_term_source: FirstTermSource,
       second_term_source: SecondTermSource,
       must_find_relationship: bool,
-      body_params: dict[str, str]
+      body_params: dict[str, str],
+      progress: TaskProgress | None = None,
+      usage: TokenUsage | None = None,
+      on_entries_done: Callable[[list[Entry]], None] | None = None
       ) -> list[Entry]:
     """Generates all the entries and content with AI.
 
+    Entries are populated in priority order. If the time_budget_seconds or
+    cost_budget body params are exhausted, the remaining entries are
+    skipped.
+
     Args:
       first_term_source (FirstTermSource): The term's source .
       second_term_source (SecondTermSource): The second term's source.
       must_find_relationship (bool): If an association between
       first_term and second_term must be found.
       body_params (dict[str, str]): The body parameters of the request.
+      progress (TaskProgress | None): The live counters of the task.
+      usage (TokenUsage | None): The token counts of the task.
+      on_entries_done (Callable[[list[Entry]], None] | None): Called with the
+      entries populated so far every export_every entries, to export them
+      before the task ends.
 
     Returns:
       list(Entry): A list of entries with content generated, ready to export.
     """
     logging.info(' Starting method generate_content')
+    self.started_at = time.time()
+    self.on_entries_done = on_entries_done
     self.first_term_source = first_term_source
     self.second_term_source = second_term_source
     self.must_find_relationship = must_find_relationship
     self.body_params = body_params
+    self.progress = progress or TaskProgress()
+    self.gemini_helper.progress = self.progress
+    self.usage = usage or TokenUsage(self.config.get('model_prices'))
+    self.gemini_helper.usage = self.usage
+    self.batch_mode = bool(body_params.get('batch_mode'))
+    self.stream = bool(body_params.get('stream'))
+    with self.progress.stage('base_entries'):
+      self.__generate_base_entries()
+    self.progress.set_entries_total(len(self.entries))
+    try:
+      if self.batch_mode:
+        with self.progress.stage('batch_prediction'):
+          self.__run_batch_prediction()
+      with alive_bar(len(self.entries)) as self.bar:
+        self.__populate_entries()
+        return self.entries
+    finally:
+      self.gemini_helper.clear_context_cache()
+      self.gemini_helper.clear_batch_responses()
+
+  def plan_content(
+      self,
+      first_term_source: FirstTermSource,
+      second_term_source: SecondTermSource,
+      must_find_relationship: bool,
+      body_params: dict[str, str]
+      ) -> dict[str, Any]:
+    """Estimates the Gemini calls, tokens, cost and time of a generation.
+
+    The sources are read and every prompt is rendered and counted locally,
+    but no content is generated. URLs are not checked, and the feature
+    extraction prompts are counted but not run, so copy prompts are
+    estimated with the full descriptions. Size enforcement and retries are
+    not included. If a relationship must be found, content is counted for
+    every entry, as relationships are not known yet.
+
+    The plan is built on a shallow copy of the service, so a dry run during
+    a running task does not replace the sources, params or entries of the
+    task. Helpers and caches are shared.
+
+    Args:
+      first_term_source (FirstTermSource): The term's source .
+      second_term_source (SecondTermSource): The second term's source.
+      must_find_relationship (bool): If an association between
+      first_term and second_term must be found.
+      body_params (dict[str, str]): The body parameters of the request.
+
+    Returns:
+      dict[str, Any]: The number of entries, and the calls, tokens, cost and
+      seconds of each kind of request and in total.
+    """
+    logging.info(' Starting method plan_content')
+    planner = copy.copy(self)
+    return planner.__plan_content(
+        first_term_source,
+        second_term_source,
+        must_find_relationship,
+        body_params
+        )
+
+  def __plan_content(
+      self,
+      first_term_source: FirstTermSource,
+      second_term_source: SecondTermSource,
+      must_find_relationship: bool,
+      body_params: dict[str, str]
+      ) -> dict[str, Any]:
+    """Estimates a generation with the state of this instance, see plan_content.
+
+    Args:
+      first_term_source (FirstTermSource): The term's source .
+      second_term_source (SecondTermSource): The second term's source.
+      must_find_relationship (bool): If an association between
+      first_term and second_term must be found.
+      body_params (dict[str, str]): The body parameters of the request.
+
+    Returns:
+      dict[str, Any]: The plan, see plan_content.
+    """
+    self.first_term_source = first_term_source
+    self.second_term_source = second_term_source
+    self.must_find_relationship = must_find_relationship
+    self.body_params = body_params
+
+    self.dry_run = True
     self.__generate_base_entries()
-    with alive_bar(len(self.entries)) as self.bar:
-      self.__populate_entries()
-      return self.entries
+
+    plan = collections.defaultdict(collections.Counter)
+
+    def add_prompt(
+        kind: str,
+        template: PromptTemplate,
+        values: dict[str, Any],
+        output_tokens: int
+        ) -> None:
+      plan[kind]['calls'] += 1
+      plan[kind]['prompt_tokens'] += template.count_tokens(values)
+      plan[kind]['output_tokens'] += output_tokens
+
+    if self.body_params.get('enable_feature_extraction'):
+      for description in {e.term_description for e in self.entries}:
+        if description:
+          add_prompt(
+              'feature_extraction',
+              self.prompt_registry.get('EXTRACT_MAIN_FEATURES'),
+              {'description': description},
+              PLANNED_OUTPUT_TOKENS['feature_extraction']
+              )
+
+    copies = self.__get_num_copies()
+    uses_google_ads = (
+        'google_ads_developer_token' in self.config
+        and 'login_customer_id' in self.config
+        )
+    google_ads_calls = 0
+
+    for entry in self.entries:
+      if self.must_find_relationship:
+        add_prompt(
+            'association',
+            self.prompt_registry.get_association_template(
+                entry.term_description is not None,
+                entry.associative_term_description is not None
+                ),
+            self.__get_prompt_values(entry),
+            PLANNED_OUTPUT_TOKENS['association']
+            )
+
+      for t, num_copies in copies.items():
+        if num_copies:
+          add_prompt(
+              t,
+              self.__get_copy_generation_template(t, entry),
+              self.__get_prompt_values(entry, t, num_copies),
+              num_copies * (COPY_LENGTHS[t] // 4 + 4)
+              )
+
+      if uses_google_ads:
+        google_ads_calls += 1
+      else:
+        add_prompt(
+            'keywords',
+            self.prompt_registry.get('KEYWORDS_GENERATION'),
+            {'term': entry.term},
+            PLANNED_OUTPUT_TOKENS['keywords']
+            )
+
+    total = collections.Counter()
+    calls = {}
+    for kind, counts in plan.items():
+      latency = (
+          self.gemini_helper.get_average_latency(kind) or DEFAULT_CALL_LATENCY
+          )
+      model_name = self.gemini_helper.get_model_name(kind)
+      calls[kind] = {
+          **counts,
+          'model': model_name,
+          'cost': round(self.gemini_helper.usage.get_cost(
+              model_name,
+              counts['prompt_tokens'],
+              counts['output_tokens']
+              ), 6),
+          'seconds': round(counts['calls'] * latency),
+      }
+      total.update(
+          {k: v for k, v in calls[kind].items() if k != 'model'}
+          )
+
+    # Calls are sent one at a time, unless the quota is the bottleneck
+    seconds = total['seconds']
+    requests_per_minute = self.config.get('gemini_requests_per_minute')
+    if requests_per_minute:
+      seconds = max(seconds, total['calls'] * 60 / requests_per_minute)
+
+    return {
+        'entries': len(self.entries),
+        'model': self.gemini_helper.model_name,
+        'token_counter': self.gemini_helper.get_token_counter(),
+        'calls': calls,
+        'template_static_tokens': self.prompt_registry.get_static_token_counts(),
+        'google_ads_calls': google_ads_calls,
+        'total': {
+            'calls': total['calls'],
+            'prompt_tokens': total['prompt_tokens'],
+            'output_tokens': total['output_tokens'],
+            'cost': round(total['cost'], 6),
+        },
+        'estimated_seconds': round(seconds),
+    }
+
+  def __run_batch_prediction(self) -> None:
+    """Generates the Gemini responses of all entries in batch predictions.
+
+    The association, copy and keyword prompts are rendered for every entry
+    and run as batch prediction jobs. Copy prompts need the association
+    reasons, so if a relationship must be found the associations run in a
+    first job. __populate_entries then uses the responses instead of calling
+    Gemini, with the same post-processing. Retries and size enforcement
+    still call Gemini online.
+    """
+    if self.must_find_relationship:
+      self.gemini_helper.run_batch([
+          (self.__get_association_prompt(entry), 'association')
+          for entry in self.entries
+          ])
+      for entry in self.entries:
+        with self.usage.entry(entry.id):
+          self.__find_association(entry)
+
+    uses_google_ads = (
+        'google_ads_developer_token' in self.config
+        and 'login_customer_id' in self.config
+        )
+    prompts = []
+    for entry in self.entries:
+      if not entry.must_generate_content(self.must_find_relationship):
+        continue
+
+      for t, num_copies in self.__get_num_copies().items():
+        if num_copies:
+          template = self.__get_copy_generation_template(t, entry)
+          prompts.append((
+              template.render(self.__get_prompt_values(entry, t, num_copies)),
+              t
+              ))
+
+      if not uses_google_ads:
+        prompts.append((
+            self.prompt_registry.get('KEYWORDS_GENERATION').render(
+                {'term': entry.term}
+                ),
+            'keywords'
+            ))
+
+    self.gemini_helper.run_batch(prompts)
+
+  def __get_num_copies(self) -> dict[str, int]:
+    """Returns the number of copies of each type requested.
+
+    Returns:
+      dict[str, int]: The number of headlines, descriptions and paths.
+    """
+    return {
+        'headlines': self.body_params['num_headlines'],
+        'descriptions': self.body_params['num_descriptions'],
+        'paths': 2 if self.body_params.get('generate_paths') else 0,
+    }
 
   def __get_first_term_info_from_spreadsheet(
       self
-      ) -> tuple[list[str], list[str], list[str], list[str], list[str]]:
-    """Gets the terms, descriptions, skus, urls and image_urls from spreadsheet.
+      ) -> tuple[
+          list[str], list[str], list[str], list[str], list[str], list[float]
+          ]:
+    """Gets the terms and the details of each term from spreadsheet.
 
     Returns:
-      tuple(list(str), list(str), list(str), list(str), list(str)):
-      A tuple with a list of terms, descriptions, skus, urls and image_urls.
+      tuple(list(str), list(str), list(str), list(str), list(str), list(float)):
+      A tuple with a list of terms, descriptions, skus, urls, image_urls and
+      priorities.
     """
     logging.info(' Getting terms and descriptions from spreadsheet')
     sheet_id = self.body_params['first_term_source_config']['spreadsheet_id']
@@ -161,16 +469,35 @@ class ContentGeneratorService:
     else:
       image_urls = []
 
-    return terms, descriptions, skus, urls, image_urls
+    if 'priority_column' in self.body_params['first_term_source_config']:
+      priority_column = (
+          self.body_params['first_term_source_config']['priority_column']
+          )
+      priorities = self.__to_priorities(
+          self.sheets_helper.read_column_from_row(
+              sheet_id,
+              sheet_name,
+              priority_column,
+              starting_row,
+              limit
+              )
+          )
+    else:
+      priorities = []
+
+    return terms, descriptions, skus, urls, image_urls, priorities
 
   def __get_first_term_info_from_bq(
       self
-      ) -> tuple[list[str], list[str], list[str], list[str], list[str]]:
-    """Gets the terms, descriptions, skus, urls and image_urls from bq.
+      ) -> tuple[
+          list[str], list[str], list[str], list[str], list[str], list[float]
+          ]:
+    """Gets the terms and the details of each term from bq.
 
     Returns:
-      tuple(list(str), list(str), list(str), list(str), list(str)):
-      A tuple with a list of terms, descriptions, skus, urls and image_urls.
+      tuple(list(str), list(str), list(str), list(str), list(str), list(float)):
+      A tuple with a list of terms, descriptions, skus, urls, image_urls and
+      priorities.
     """
     logging.info(' Getting terms and descriptions from bq')
     if 'query' in self.body_params['first_term_source_config']:
@@ -187,8 +514,15 @@ class ContentGeneratorService:
           [row['image_url'] for row in r]
           if 'image_url' in r[0].keys() else []
           )
+      priority_column = (
+          self.body_params['first_term_source_config'].get('priority_column')
+          )
+      priorities = (
+          self.__to_priorities([row[priority_column] for row in r])
+          if priority_column in r[0].keys() else []
+          )
 
-      return terms, descriptions, skus, urls, image_urls
+      return terms, descriptions, skus, urls, image_urls, priorities
 
     project_id = self.body_params['first_term_source_config']['project_id']
     dataset_id = self.body_params['first_term_source_config']['dataset']
@@ -257,16 +591,35 @@ class ContentGeneratorService:
     else:
       image_urls = []
 
-    return terms, descriptions, skus, urls, image_urls
+    if 'priority_column' in self.body_params['first_term_source_config']:
+      priority_column = (
+          self.body_params['first_term_source_config']['priority_column']
+          )
+      priorities = self.__to_priorities(
+          self.bigquery_helper.read_bigquery_column(
+              project_id,
+              dataset_id,
+              table_id,
+              priority_column,
+              limit
+              )
+          )
+    else:
+      priorities = []
+
+    return terms, descriptions, skus, urls, image_urls, priorities
 
   def __get_first_term_info(
       self
-      ) -> tuple[list[str], list[str], list[str], list[str], list[str]]:
+      ) -> tuple[
+          list[str], list[str], list[str], list[str], list[str], list[float]
+          ]:
     """Gets the terms and descriptions to generate content for.
 
     Returns:
-      tuple(list(str), list(str), list(str), list(str), list(str)):
-      A tuple with a list of terms, descriptions, skus, urls and image_urls.
+      tuple(list(str), list(str), list(str), list(str), list(str), list(float)):
+      A tuple with a list of terms, descriptions, skus, urls, image_urls and
+      priorities.
     """
     if self.first_term_source == FirstTermSource.SPREADSHEET:
       return self.__get_first_term_info_from_spreadsheet()
@@ -278,34 +631,95 @@ class ContentGeneratorService:
            'Supported values are spreadsheet and big_query.')
           )
 
+  def __get_google_trends_table(self) -> str:
+    """Gets the Google Trends table to read top terms from.
+
+    Returns:
+      str: The fully qualified Google Trends table for the configured country.
+    """
+    if self.config['country'] == 'United States':
+      return GOOGLE_TRENDS_US_TABLE
+    return GOOGLE_TRENDS_INTERNATIONAL_TABLE
+
+  def __get_google_trends_latest_refresh_date(
+      self,
+      table: str
+      ) -> datetime.date:
+    """Gets the latest refresh date of a Google Trends table.
+
+    Only the refresh_date column is scanned, so this query is much cheaper
+    than reading the top terms themselves. The date is reused for
+    GOOGLE_TRENDS_REFRESH_DATE_TTL seconds without querying it again.
+
+    Args:
+      table (str): The fully qualified Google Trends table.
+
+    Returns:
+      datetime.date: The latest refresh date.
+    """
+    if table in self.google_trends_refresh_dates:
+      refresh_date, checked_at = self.google_trends_refresh_dates[table]
+      if time.time() - checked_at < GOOGLE_TRENDS_REFRESH_DATE_TTL:
+        return refresh_date
+
+    query = f"""
+      SELECT
+        MAX(refresh_date) AS refresh_date
+      FROM
+        `{table}`
+    """
+    result = self.bigquery_helper.run_query(query)
+    refresh_date = result[0]['refresh_date']
+    self.google_trends_refresh_dates[table] = (refresh_date, time.time())
+    return refresh_date
+
   def __get_associative_terms_and_descriptions_from_gt(
       self
       ) -> tuple[list[str], list[str]]:
     """Gets the associative terms and descriptions from Google Trends.
 
+    Top terms only change once a day, so they are cached per country, refresh
+    date and limit. The full query only runs when the latest refresh date is
+    not in the cache yet, and the latest refresh date is itself cached for a
+    few minutes, so a cache hit makes no BigQuery call.
+
     Returns:
       tuple(list(str), list(str)): A tuple with a list of
       associative terms and a list of associative terms descriptions.
     """
     logging.info(' Getting associative terms and descriptions from gt')
 
+    table = self.__get_google_trends_table()
+    refresh_date = self.__get_google_trends_latest_refresh_date(table)
+    cache_key = (
+        self.config['country'],
+        refresh_date,
+        self.body_params['second_term_source_config']['limit']
+        )
+
+    if cache_key in self.google_trends_cache:
+      logging.info(
+          ' Google Trends top terms for %s found in cache (refresh date %s)',
+          self.config['country'],
+          refresh_date
+          )
+      return list(self.google_trends_cache[cache_key]), []
+
+    params = {'refresh_date': refresh_date}
+
     limit = ""
     if self.body_params['second_term_source_config']['limit'] < 9999:
-      limit = f"LIMIT {self.body_params['second_term_source_config']['limit']}"
+      limit = 'LIMIT @limit'
+      params['limit'] = self.body_params['second_term_source_config']['limit']
 
-    if self.config["country"] == "United States":
+    if table == GOOGLE_TRENDS_US_TABLE:
       query = f"""
         SELECT
           term, ARRAY_AGG(STRUCT(rank,week,score,refresh_date) ORDER BY week DESC LIMIT 1) term_info
         FROM
-          `bigquery-public-data.google_trends.top_terms`
+          `{table}`
         WHERE
-          refresh_date =
-            (SELECT
-              MAX(refresh_date)
-            FROM
-              `bigquery-public-data.google_trends.top_terms`
-            )
+          refresh_date = @refresh_date
         GROUP BY
           term
         ORDER BY
@@ -313,19 +727,15 @@ class ContentGeneratorService:
         {limit}
       """
     else:
+      params['country'] = self.config['country']
       query = f"""
               SELECT
                   term, ARRAY_AGG(STRUCT(rank,week,country_name,country_code,score,refresh_date) ORDER BY week DESC LIMIT 1) x
               FROM
-                  `bigquery-public-data.google_trends.international_top_terms`
+                  `{table}`
               WHERE
-                  refresh_date =
-                      (SELECT
-                          MAX(refresh_date)
-                      FROM
-                      `bigquery-public-data.google_trends.international_top_terms`
-                      )
-                  AND country_name = '{self.config['country']}'
+                  refresh_date = @refresh_date
+                  AND country_name = @country
               GROUP BY
                   term
               ORDER BY
@@ -334,11 +744,17 @@ class ContentGeneratorService:
               """
     top_terms = {}
 
-    result = self.bigquery_helper.run_query(query)
+    result = self.bigquery_helper.run_query(query, params)
     for row in result:
       if row[0] not in top_terms:
         top_terms[row[0]] = row[1][0]
 
+    self.google_trends_cache = {
+        key: terms for key, terms in self.google_trends_cache.items()
+        if key[1] == refresh_date
+        }
+    self.google_trends_cache[cache_key] = list(top_terms.keys())
+
     return list(top_terms.keys()), []
 
   def __get_associative_terms_and_descriptions_from_ss(
@@ -517,10 +933,11 @@ class ContentGeneratorService:
     self.entries = []
 
     (terms, descriptions, skus,
-     urls, image_urls) = self.__get_first_term_info()
+     urls, image_urls, priorities) = self.__get_first_term_info()
 
     try:
-      if (self.body_params['url_validation'] == 'REMOVE_BROKEN_URLS'
+      if not self.dry_run and (
+          self.body_params['url_validation'] == 'REMOVE_BROKEN_URLS'
           or self.body_params['url_validation'] == 'USE_DEFAULT_URL'):
         urls = self.__check_and_replace_urls(urls)
     except KeyError as _:
@@ -531,7 +948,7 @@ class ContentGeneratorService:
       descriptions = self.__remove_double_quotes(descriptions)
 
     try:
-      if self.body_params['enable_feature_extraction']:
+      if self.body_params['enable_feature_extraction'] and not self.dry_run:
         descriptions = self.__extract_main_features(descriptions)
     except KeyError as _:
       pass
@@ -544,6 +961,29 @@ class ContentGeneratorService:
     if associative_terms_descriptions:
       associative_terms_descriptions = self.__remove_double_quotes(associative_terms_descriptions)
 
+    id_namespace = Entry.get_id_namespace({
+        'first_term_source': self.first_term_source,
+        'first_term_source_config': self.body_params['first_term_source_config'],
+        'second_term_source': self.second_term_source,
+        'second_term_source_config': self.body_params.get(
+            'second_term_source_config'
+            ),
+        # Google Trends terms are read per country
+        'country': (
+            self.config['country']
+            if self.second_term_source == SecondTermSource.GOOGLE_TRENDS
+            else None
+            ),
+        })
+
+    # Google Trends terms are sorted by rank
+    rank_associative_terms = (
+        self.second_term_source == SecondTermSource.GOOGLE_TRENDS
+        and bool(self.body_params['second_term_source_config'].get(
+            'priority_by_rank'
+            ))
+        )
+
     if associative_terms:
       for i in range(0, len(terms)):
         for j in range(0, len(associative_terms)):
@@ -555,7 +995,10 @@ class ContentGeneratorService:
                if associative_terms_descriptions and associative_terms_descriptions[j] else None),
               skus[i] if skus else None,
               urls[i] if urls else None,
-              image_urls[i] if image_urls else None
+              image_urls[i] if image_urls else None,
+              id_namespace,
+              priorities[i] if i < len(priorities) else 0.0,
+              j + 1 if rank_associative_terms else None
               )
           self.entries.append(entry)
     else:
@@ -567,28 +1010,100 @@ class ContentGeneratorService:
             None,
             skus[i] if skus else None,
             urls[i] if urls else None,
-            image_urls[i] if image_urls else None
+            image_urls[i] if image_urls else None,
+            id_namespace,
+            priorities[i] if i < len(priorities) else 0.0
             )
         self.entries.append(entry)
 
+    if priorities or rank_associative_terms:
+      # Stable, so entries with the same priority keep the source order
+      self.entries.sort(
+          key=lambda entry: (-entry.priority, entry.associative_term_rank or 0)
+          )
+      logging.info(' Entries sorted by priority')
+
+  def __to_priorities(self, values: list[object]) -> list[float]:
+    """Converts the values of a priority column to numbers.
+
+    Args:
+      values (list[object]): The values, e.g. revenue. Empty or non-numeric
+      values get a priority of 0.
+
+    Returns:
+      list(float): The priorities.
+    """
+    priorities = []
+    for value in values:
+      try:
+        priorities.append(float(value))
+      except (TypeError, ValueError) as _:
+        priorities.append(0.0)
+    return priorities
+
   def __populate_entries(self) -> None:
     """Populates each entry with headlines, descriptions and keywords.
     """
+    export_every = self.body_params.get('export_every')
     i = 0
     while i < len(self.entries):
-      if self.must_find_relationship:
-        self.__find_association(self.entries[i])
-
-      if self.entries[i].must_generate_content(self.must_find_relationship):
-        self.__generate_content(self.entries[i])
+      budget = self.__get_exhausted_budget()
+      if budget is not None:
+        logging.warning(
+            ' %s budget exhausted, skipping the last %d entries',
+            budget.capitalize(),
+            len(self.entries) - i
+            )
+        self.progress.budget_exhausted(budget, len(self.entries) - i)
+        del self.entries[i:]
+        break
+
+      with (tracing.span(
+          'entry',
+          entry_id=self.entries[i].id,
+          term=self.entries[i].term,
+          associative_term=self.entries[i].associative_term,
+          requeued=self.entries[i].has_been_cleared
+          ), self.usage.entry(self.entries[i].id)):
+        # In batch mode, associations are found before populating entries
+        if self.must_find_relationship and not self.batch_mode:
+          with (self.progress.stage('association'),
+                tracing.span('find_association')):
+            self.__find_association(self.entries[i])
+
+        if self.entries[i].must_generate_content(self.must_find_relationship):
+          with (self.progress.stage('generation'),
+                tracing.span('generate_content')):
+            self.__generate_content(self.entries[i])
 
       if self.entries[i].has_generation_errors() and not self.entries[i].has_been_cleared:
-        self.entries.remove(self.entries[i])
-        self.entries[i].clear_generated_content()
-        self.entries.append(self.entries[i])
+        # Entries are popped by index, as equal ids don't mean the same entry
+        entry = self.entries.pop(i)
+        entry.clear_generated_content()
+        self.entries.append(entry)
+        self.progress.entry_requeued()
       else:
         self.bar()
+        self.progress.entry_done()
         i = i + 1
+        if (self.on_entries_done is not None and export_every
+            and i % export_every == 0 and i < len(self.entries)):
+          self.on_entries_done(self.entries[:i])
+
+  def __get_exhausted_budget(self) -> str | None:
+    """Checks the time_budget_seconds and cost_budget body params.
+
+    Returns:
+      str | None: time or cost if its budget is exhausted, None otherwise.
+    """
+    time_budget = self.body_params.get('time_budget_seconds')
+    if time_budget is not None and time.time() - self.started_at >= time_budget:
+      return 'time'
+
+    cost_budget = self.body_params.get('cost_budget')
+    if cost_budget is not None and self.usage.get_total_cost() >= cost_budget:
+      return 'cost'
+    return None
 
   def __find_association(self, entry: Entry) -> None:
     """Tries to find a relationship between the term and the associative term for a given entry.
@@ -602,7 +1117,7 @@ class ContentGeneratorService:
         entry.associative_term
         )
     prompt = self.__get_association_prompt(entry)
-    response = self.gemini_helper.generate_dict(prompt)
+    response = self.gemini_helper.generate_dict(prompt, 'association')
 
     try:
       entry.association_reason = response['reason']
@@ -671,18 +1186,20 @@ class ContentGeneratorService:
     Returns:
       list[str]: A list of keywords.
     """
-    keywords = []
-    if 'google_ads_developer_token' in self.config and 'login_customer_id' in self.config:
-      keywords = self.keyword_suggestion_service.get_keywords([term])
+    with tracing.span('get_keywords', term=term) as span:
+      keywords = []
+      if 'google_ads_developer_token' in self.config and 'login_customer_id' in self.config:
+        keywords = self.keyword_suggestion_service.get_keywords([term])
 
-    if not keywords:
-      prompt = (
-        prompts[self.config["language"]]["KEYWORDS_GENERATION"]
-        .format(term=term)
-      )
-      keywords = self.gemini_helper.generate_text_list(prompt)
+      span.set_attribute('google_ads_keywords', len(keywords))
 
-    return keywords
+      if not keywords:
+        prompt = self.prompt_registry.get('KEYWORDS_GENERATION').render(
+            {'term': term}
+            )
+        keywords = self.gemini_helper.generate_text_list(prompt, 'keywords')
+
+      return keywords
 
   def __check_blocklists(
       self,
@@ -806,68 +1323,57 @@ class ContentGeneratorService:
     elif t == 'paths':
       max_length = 15
 
-    # Get copy generation prompt
-    prompt = self.__get_copy_generation_prompt(t, entry, num_copies)
-
-    # Generate copies
-    generated_copies = self.gemini_helper.generate_text_list(
-        prompt
+    # Get copy generation prompt, split after the part shared by the task
+    template = self.__get_copy_generation_template(t, entry)
+    prefix, prompt = template.split(
+        self.__get_prompt_values(entry, t, num_copies),
+        PROMPT_CONSTANT_FIELDS
         )
 
-    generated_copies_with_size_enforced = []
-
-    i = 0
-    while i < len(generated_copies):
-      # Remove errors
-      if 'failed' in generated_copies[i].lower() or 'error' in generated_copies[i].lower():
-        generated_copies.remove(generated_copies[i])
-        continue
-
-      # Remove extra whitespaces
-      generated_copies[i] = generated_copies[i].strip()
-
-      # Remove full stop if it is a headline
-      try:
-        generated_copies[i] = generated_copies[i][:-1] if generated_copies[i][-1] == '.' and t == 'headlines' else generated_copies[i]
-      except IndexError as _:
-        pass
-
-      # Enforce size
-      if len(generated_copies[i]) > max_length:
-        copy_with_size_enforced = self.gemini_helper.enforce_text_size(
-            generated_copies[i],
-            t
+    # Generate copies
+    with tracing.span(
+        'generate_copies',
+        copy_type=t,
+        num_copies=num_copies,
+        retries_left=retries_left
+        ):
+      if self.stream:
+        generated_copies_with_size_enforced = self.__stream_copies(
+            prompt,
+            prefix,
+            t,
+            num_copies,
+            max_length
             )
-
-        # Remove full stop if it is a headline
-        try:
-          copy_with_size_enforced = (
-              copy_with_size_enforced[:-1] if copy_with_size_enforced[-1]
-              == '.' and t == 'headlines' else copy_with_size_enforced
-              )
-        except IndexError as _:
-          pass
       else:
-        copy_with_size_enforced = generated_copies[i]
+        generated_copies = self.gemini_helper.generate_text_list(
+            prompt,
+            t,
+            cached_prefix=prefix
+            )
 
-      # Remove duplicates
-      if copy_with_size_enforced not in generated_copies_with_size_enforced:
-        generated_copies_with_size_enforced.append(copy_with_size_enforced)
+    if not self.stream:
+      generated_copies_with_size_enforced = []
+      for copy in generated_copies:
+        copy = self.__clean_copy(copy, t, max_length)
 
-      i = i + 1
+        # Remove duplicates
+        if (copy is not None
+            and copy not in generated_copies_with_size_enforced):
+          generated_copies_with_size_enforced.append(copy)
 
-    # Remove copies that are blocklisted
-    generated_copies_with_size_enforced = self.__check_blocklists(
-        t,
-        generated_copies_with_size_enforced
-        )
+      # Remove copies that are blocklisted
+      generated_copies_with_size_enforced = self.__check_blocklists(
+          t,
+          generated_copies_with_size_enforced
+          )
 
-    # Remove copies that are 2 words or less
-    if t != 'paths':
-      for copy in generated_copies_with_size_enforced:
-        copy_splitted = copy.split(' ')
-        if len(copy_splitted) <= 2:
-          generated_copies_with_size_enforced.remove(copy)
+      # Remove copies that are 2 words or less
+      if t != 'paths':
+        for copy in generated_copies_with_size_enforced:
+          copy_splitted = copy.split(' ')
+          if len(copy_splitted) <= 2:
+            generated_copies_with_size_enforced.remove(copy)
 
     # If retries still available and not enough copies, generate more
     if (
@@ -900,6 +1406,130 @@ class ContentGeneratorService:
 
     return generated_copies_with_size_enforced
 
+  def __stream_copies(
+      self,
+      prompt: str,
+      prefix: str,
+      t: str,
+      num_copies: int,
+      max_length: int
+      ) -> list[str]:
+    """Streams copies, checking each one as it arrives.
+
+    The stream is cancelled once enough candidates arrive: copies that pass
+    the blocklist and word count checks, or oversized copies. The size of
+    oversized copies is only enforced once the stream is closed, so their
+    Gemini calls don't hold the stream open.
+
+    Args:
+      prompt (str): The copy generation prompt.
+      prefix (str): The part of the prompt shared by the task.
+      t (str): The type of copies (headlines|descriptions|paths).
+      num_copies (int): The number of copies to generate.
+      max_length (int): The maximum length of a copy.
+
+    Returns:
+      list(str): The copies that passed the checks, up to num_copies.
+    """
+    candidates = []
+
+    def on_copy(copy: str) -> bool:
+      copy = self.__strip_copy(copy, t)
+      if (copy is not None
+          and copy not in candidates
+          and (len(copy) > max_length or self.__check_copy(t, copy))):
+        candidates.append(copy)
+      return len(candidates) >= num_copies
+
+    self.gemini_helper.stream_text_list(
+        prompt,
+        t,
+        on_copy,
+        cached_prefix=prefix
+        )
+
+    copies = []
+    for copy in candidates:
+      if len(copy) > max_length:
+        copy = self.__enforce_copy_size(copy, t)
+        if not self.__check_copy(t, copy):
+          continue
+      if copy not in copies:
+        copies.append(copy)
+    return copies[:num_copies]
+
+  def __check_copy(self, t: str, copy: str) -> bool:
+    """Returns whether a copy passes the blocklist and word count checks.
+
+    Args:
+      t (str): The type of copy (headlines|descriptions|paths).
+      copy (str): The copy.
+
+    Returns:
+      bool: Whether the copy passes the checks.
+    """
+    return bool(
+        self.__check_blocklists(t, [copy])
+        and (t == 'paths' or len(copy.split(' ')) > 2)
+        )
+
+  def __clean_copy(self, copy: str, t: str, max_length: int) -> str | None:
+    """Cleans a generated copy and enforces its size.
+
+    Args:
+      copy (str): The generated copy.
+      t (str): The type of copy (headlines|descriptions|paths).
+      max_length (int): The maximum length of the copy.
+
+    Returns:
+      str | None: The copy, None if it is a generation error.
+    """
+    copy = self.__strip_copy(copy, t)
+    if copy is not None and len(copy) > max_length:
+      copy = self.__enforce_copy_size(copy, t)
+    return copy
+
+  def __strip_copy(self, copy: str, t: str) -> str | None:
+    """Cleans a generated copy, without enforcing its size.
+
+    Args:
+      copy (str): The generated copy.
+      t (str): The type of copy (headlines|descriptions|paths).
+
+    Returns:
+      str | None: The copy, None if it is a generation error.
+    """
+    # Remove errors
+    if 'failed' in copy.lower() or 'error' in copy.lower():
+      return None
+
+    # Remove extra whitespaces
+    copy = copy.strip()
+
+    # Remove full stop if it is a headline
+    if copy.endswith('.') and t == 'headlines':
+      copy = copy[:-1]
+
+    return copy
+
+  def __enforce_copy_size(self, copy: str, t: str) -> str:
+    """Enforces the size of an oversized copy with Gemini.
+
+    Args:
+      copy (str): The cleaned copy.
+      t (str): The type of copy (headlines|descriptions|paths).
+
+    Returns:
+      str: The copy within its size limit.
+    """
+    copy = self.gemini_helper.enforce_text_size(copy, t)
+
+    # Remove full stop if it is a headline
+    if copy.endswith('.') and t == 'headlines':
+      copy = copy[:-1]
+
+    return copy
+
   def __extract_main_features(self, descriptions: list[str]) -> list[str]:
     """Extract main features from a given product description.
 
@@ -910,18 +1540,19 @@ class ContentGeneratorService:
       list(str): A list of main features for each product description.
     """
     logging.info(' Extracting main features from descriptions...')
+    template = self.prompt_registry.get('EXTRACT_MAIN_FEATURES')
     with alive_bar(len(descriptions)) as feature_extraction_progress_bar:
       main_features_for_all_descriptions = []
       for description in descriptions:
-        prompt = (
-          prompts[self.config["language"]]["EXTRACT_MAIN_FEATURES"]
-          .replace("{description}", description)
-        )
+        prompt = template.render({'description': description})
         try:
           main_features = self.gemini_helper.run_prompt(
-              prompt
+              prompt,
+              'feature_extraction'
               )
           main_features_for_all_descriptions.append(main_features)
+        except circuit_breaker.CircuitOpenError:
+          raise
         except:
           main_features_for_all_descriptions.append(description)
         feature_extraction_progress_bar()
@@ -936,207 +1567,60 @@ class ContentGeneratorService:
     Returns:
       str: A text prompt for term-associative_term association.
     """
-    if (
-        entry.term_description is not None
-        and entry.associative_term_description is not None
-        ):
-      first_part = (
-          prompts[self.config['language']]
-          ['ASSOCIATION']['WITH_BOTH_DESCRIPTIONS']
-          ).format(
-              term=entry.term,
-              term_description=entry.term_description,
-              associative_term=entry.associative_term,
-              associative_term_description=entry.associative_term_description
-              )
-    elif (
-        entry.term_description is not None
-        and entry.associative_term_description is None
-        ):
-      first_part = (
-          prompts[self.config['language']]['ASSOCIATION']
-          ['WITH_TERM_DESCRIPTION']
-          ).format(
-              term=entry.term,
-              term_description=entry.term_description,
-              associative_term=entry.associative_term
-              )
-    elif (
-        entry.term_description is None
-        and entry.associative_term_description is not None
-        ):
-      first_part = (
-          prompts[self.config['language']]['ASSOCIATION']
-          ['WITH_ASSOCIATIVE_TERM_DESCRIPTION']
-          ).format(
-              term=entry.term,
-              associative_term=entry.associative_term,
-              associative_term_description=entry.associative_term_description
-              )
-    elif (
-        entry.term_description is None
-        and entry.associative_term_description is None
-        ):
-      first_part = (
-          prompts[self.config['language']]['ASSOCIATION']
-          ['WITHOUT_DESCRIPTIONS']
-          ).format(
-              term=entry.term,
-              associative_term=entry.associative_term
-              )
-
-    second_part = (
-        prompts[self.config['language']]['ASSOCIATION']
-        ['COMMON_PART']
-        ).format(
-            term=entry.term,
-            associative_term=entry.associative_term
-            )
-
-    return first_part + second_part
+    template = self.prompt_registry.get_association_template(
+        entry.term_description is not None,
+        entry.associative_term_description is not None
+        )
+    return template.render(self.__get_prompt_values(entry))
 
-  def __get_copy_generation_prompt(
+  def __get_copy_generation_template(
       self,
       t: str,
-      entry: Entry,
-      number_of_copies: int
-      ) -> str:
-    """Generates a text prompt for content generation.
+      entry: Entry
+      ) -> PromptTemplate:
+    """Returns the content generation template of an entry.
 
     Args:
       t (str): The type of content to generate
       (e.g., 'headlines', 'descriptions').
-      entry (Entry): The entry to retrieve the info to generate prompt.
-      number_of_copies (int): number of copies to generate
+      entry (Entry): The entry to generate content for.
 
     Returns:
-      str: A text prompt for content generation.
-
-    Raises:
-      ValueError: If the type is not supported.
+      PromptTemplate: The template variant for the type and entry.
     """
-    if t == 'headlines':
-      length = 30
-    elif t == 'descriptions':
-      length = 90
-    elif t == 'paths':
-      length = 15
-      if entry.term_description:
-        return prompts[self.config['language']]['GENERATION']['PATHS_WITH_TERM_DESCRIPTION'].format(
-                  n=number_of_copies,
-                  length=length,
-                  term=entry.term,
-                  term_description=entry.term_description,
-                  )
-      else:
-        return prompts[self.config['language']]['GENERATION']['PATHS_WITHOUT_TERM_DESCRIPTION'].format(
-                  n=number_of_copies,
-                  length=length,
-                  term=entry.term,
-                  )
-    else:
-      raise ValueError("Only types supported: 'headlines' and 'descriptions'")
+    return self.prompt_registry.get_copy_generation_template(
+        t,
+        entry.has_associative_term(),
+        self.must_find_relationship,
+        bool(entry.term_description),
+        bool(entry.associative_term_description)
+        )
 
-    if entry.has_associative_term() and not self.must_find_relationship:
-      return (
-          prompts[self.config['language']]['GENERATION']
-          ['WITH_ASSOCIATIVE_TERM']['WITHOUT_RELATIONSHIP_AND_DESCRIPTIONS']
-          ).format(
-              n=number_of_copies,
-              length=length,
-              term=entry.term,
-              associative_term=entry.associative_term,
-              )
+  def __get_prompt_values(
+      self,
+      entry: Entry,
+      t: str | None = None,
+      number_of_copies: int | None = None
+      ) -> dict[str, Any]:
+    """Returns the values of the prompt template fields for an entry.
 
-    if not entry.has_associative_term():
-      if not entry.term_description:
-        return (
-            prompts[self.config['language']]['GENERATION']
-            ['WITHOUT_ASSOCIATIVE_TERM']['WITHOUT_DESCRIPTION']
-            ).format(
-                n=number_of_copies,
-                length=length,
-                term=entry.term,
-                location=self.config['country'],
-                company=self.config['advertiser']
-                )
-      else:
-        return (
-            prompts[self.config['language']]['GENERATION']
-            ['WITHOUT_ASSOCIATIVE_TERM']['WITH_DESCRIPTION']
-            ).format(
-                n=number_of_copies,
-                length=length,
-                term=entry.term,
-                term_description=entry.term_description,
-                location=self.config['country'],
-                company=self.config['advertiser']
-                )
-    elif (
-        entry.term_description
-        and entry.associative_term_description
-        ):
-      return (
-          prompts[self.config['language']]['GENERATION']
-          ['WITH_ASSOCIATIVE_TERM']['WITH_BOTH_DESCRIPTIONS']
-          ).format(
-              n=number_of_copies,
-              length=length,
-              term=entry.term,
-              term_description=entry.term_description,
-              associative_term=entry.associative_term,
-              associative_term_description=entry.associative_term_description,
-              location=self.config['country'],
-              company=self.config['advertiser'],
-              association_reason=entry.association_reason
-              )
-    elif (
-        entry.term_description
-        and not entry.associative_term_description
-        ):
-      return (
-          prompts[self.config['language']]['GENERATION']
-          ['WITH_ASSOCIATIVE_TERM']['WITH_TERM_DESCRIPTION']
-          ).format(
-              n=number_of_copies,
-              length=length,
-              term=entry.term,
-              term_description=entry.term_description,
-              associative_term=entry.associative_term,
-              location=self.config['country'],
-              company=self.config['advertiser'],
-              association_reason=entry.association_reason
-              )
-    elif (
-        not entry.term_description and
-        entry.associative_term_description
-        ):
-      return (
-          prompts[self.config['language']]['GENERATION']
-          ['WITH_ASSOCIATIVE_TERM']['WITH_ASSOCIATIVE_TERM_DESCRIPTION']
-          ).format(
-              n=number_of_copies,
-              length=length,
-              term=entry.term,
-              associative_term=entry.associative_term,
-              associative_term_description=entry.associative_term_description,
-              location=self.config['country'],
-              company=self.config['advertiser'],
-              association_reason=entry.association_reason
-              )
-    elif (
-        not entry.term_description and
-        not entry.associative_term_description
-        ):
-      return (
-          prompts[self.config['language']]['GENERATION']
-          ['WITH_ASSOCIATIVE_TERM']['WITHOUT_DESCRIPTIONS']
-          ).format(
-              n=number_of_copies,
-              length=length,
-              term=entry.term,
-              associative_term=entry.associative_term,
-              location=self.config['country'],
-              company=self.config['advertiser'],
-              association_reason=entry.association_reason
-              )
+    Args:
+      entry (Entry): The entry to retrieve the info to generate prompt.
+      t (str | None): The type of content to generate, if any.
+      number_of_copies (int | None): number of copies to generate, if any.
+
+    Returns:
+      dict[str, Any]: The value of each field.
+    """
+    return {
+        'n': number_of_copies,
+        'length': COPY_LENGTHS.get(t),
+        'term': entry.term,
+        # Some templates without descriptions still reference them
+        'term_description': entry.term_description or '',
+        'associative_term': entry.associative_term,
+        'associative_term_description': entry.associative_term_description or '',
+        'association_reason': entry.association_reason,
+        'location': self.config.get('country'),
+        'company': self.config.get('advertiser'),
+    }
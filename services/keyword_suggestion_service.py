@@ -22,12 +22,19 @@ import logging
 import time
 
 from google.ads.googleads.client import GoogleAdsClient
+from utils import cassette
+from utils import circuit_breaker
+from utils import metrics
+from utils import tracing
 from utils.authentication_helper import Authenticator
+from utils.retry_policy import RetryPolicy
 
 # Logger config
 logging.basicConfig()
 logging.root.setLevel(logging.INFO)
 
+RETRIES = 5
+
 
 class KeywordSuggestionService():
   """A service for generating keyword suggestions using the Google Ads API.
@@ -47,6 +54,10 @@ class KeywordSuggestionService():
         self.config['google_ads_developer_token'],
         login_customer_id=self.config['login_customer_id']
         )
+    self.retry_policy = RetryPolicy(
+        RETRIES,
+        self.config.get('google_ads_deadline_seconds')
+        )
 
   def get_keywords(self, terms) -> list[str]:
     """Retrieve keyword suggestions for a list of terms.
@@ -90,8 +101,9 @@ class KeywordSuggestionService():
         ):
       location_id = location_ids[self.config['country']]
 
+    retry = self.retry_policy.start()
     try:
-      for _ in range(5):
+      while True:
         try:
           client = self.client
           keyword_plan_idea_service = client.get_service(
@@ -123,20 +135,40 @@ class KeywordSuggestionService():
           # we need to initialize a KeywordSeed obj and set 'keywords' field
           # to be a list of StringValue objects.
           request.keyword_seed.keywords.extend(terms)
-          keyword_ideas = keyword_plan_idea_service.generate_keyword_ideas(
-              request=request
-              )
-
-          list_of_ideas = []
-
-          for idea in keyword_ideas:
-            list_of_ideas.append(idea.text)
+          # The deadline of the call bounds the timeout of each attempt
+          timeout = retry.remaining_seconds()
+          with (circuit_breaker.guard('google_ads'),
+                metrics.track('google_ads', 'keyword_ideas'),
+                tracing.span('google_ads.keyword_ideas', terms=len(terms))):
+            list_of_ideas = cassette.call(
+                'google_ads',
+                [customer_id, language_rn, location_rns, terms],
+                lambda: [
+                    idea.text for idea in
+                    keyword_plan_idea_service.generate_keyword_ideas(
+                        request=request,
+                        **({'timeout': timeout} if timeout is not None else {})
+                        )
+                    ]
+                )
+          metrics.count_bytes('google_ads', 'received', list_of_ideas)
 
           return list_of_ideas[:10]
+        except circuit_breaker.CircuitOpenError:
+          raise
         except Exception as e:
-          if 'Quota exceeded' in str(e) or 'quota' in str(e).lower():
-            time.sleep(70)
-          continue
+          delay = retry.next_delay(e)
+          if delay is None:
+            raise
+          logging.warning(
+              ' Google Ads %s error, retrying in %.1fs: %s',
+              retry.error_class,
+              delay,
+              str(e)
+              )
+          time.sleep(delay)
+    except circuit_breaker.CircuitOpenError:
+      raise
     except Exception as e:
       logging.error(' Error in get_keywords: %s', str(e))
 
@@ -0,0 +1,90 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the record and replay of the external service calls."""
+
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import zlib
+
+from utils import cassette
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Records two calls, then stops without closing the cassette, like a killed
+# server
+RECORD_SCRIPT = """
+import datetime
+import os
+import sys
+from utils import cassette
+
+cassette.init_cassette({'cassette': {'mode': 'record', 'path': sys.argv[1]}})
+cassette.call('gemini', ['copy', 'shoes'], lambda: ['Buy shoes'])
+cassette.call('bigquery', 'SELECT 1', lambda: {'day': datetime.date(2024, 1, 2)})
+os._exit(0)
+"""
+
+
+class CassetteTest(unittest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.path = os.path.join(tempfile.mkdtemp(), 'cassette.jsonl.gz')
+    self.addCleanup(cassette.init_cassette, {})
+
+  def test_replays_after_recording_process_stops(self):
+    subprocess.run(
+        [sys.executable, '-c', RECORD_SCRIPT, self.path],
+        cwd=ROOT,
+        check=True
+        )
+
+    cassette.init_cassette({'cassette': {'mode': 'replay', 'path': self.path}})
+
+    self.assertEqual(
+        cassette.call('gemini', ['copy', 'shoes'], self.fail),
+        ['Buy shoes']
+        )
+    self.assertEqual(
+        cassette.call('bigquery', 'SELECT 1', self.fail),
+        {'day': datetime.date(2024, 1, 2)}
+        )
+    with self.assertRaises(cassette.CassetteMissError):
+      cassette.call('gemini', ['copy', 'socks'], self.fail)
+
+  def test_replays_complete_records_of_truncated_file(self):
+    records = [
+        {'service': 'gemini', 'key': key, 'seconds': 0, 'response': key}
+        for key in ('a', 'b')
+    ]
+    # A single gzip stream cut off in its last line, without its trailer
+    lines = ''.join(json.dumps(record) + '\n' for record in records)
+    compressor = zlib.compressobj(wbits=31)
+    data = compressor.compress((lines + '{"service": "gem').encode())
+    with open(self.path, 'wb') as f:
+      f.write(data + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    records = cassette._read_records(self.path)
+
+    self.assertEqual([record['key'] for record in records], ['a', 'b'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,117 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the circuit breakers of the external services."""
+
+import time
+import unittest
+
+from google.api_core import exceptions
+
+from utils import circuit_breaker
+
+
+def _fail(service: str, error: Exception) -> None:
+  """Makes a call to a service that raises the given error."""
+  try:
+    with circuit_breaker.guard(service):
+      raise error
+  except type(error):
+    pass
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.addCleanup(circuit_breaker.init_circuit_breakers, {})
+
+  def _init(self, **settings) -> None:
+    """Sets the breaker settings, opening after 2 failures in 2 calls."""
+    circuit_breaker.init_circuit_breakers({
+        'circuit_breaker': {
+            'window_size': 2,
+            'min_calls': 2,
+            'open_seconds': 0.2,
+            **settings,
+        }
+    })
+
+  def test_default_mode_only_records(self):
+    self._init()
+    for _ in range(2):
+      _fail('gemini', exceptions.ServiceUnavailable('down'))
+
+    circuits = circuit_breaker.get_open_circuits()
+    self.assertEqual(circuits['gemini']['state'], circuit_breaker.OPEN)
+    self.assertEqual(circuits['gemini']['mode'], circuit_breaker.RECORD)
+    with circuit_breaker.guard('gemini'):
+      pass
+
+  def test_record_mode_closes_after_a_successful_probe(self):
+    self._init()
+    for _ in range(2):
+      _fail('gemini', exceptions.ServiceUnavailable('down'))
+    time.sleep(0.25)
+
+    with circuit_breaker.guard('gemini'):
+      pass
+
+    self.assertEqual(circuit_breaker.get_open_circuits(), {})
+
+  def test_fail_mode_raises_while_open(self):
+    self._init(mode=circuit_breaker.FAIL)
+    for _ in range(2):
+      _fail('sheets', exceptions.ServiceUnavailable('down'))
+
+    with self.assertRaises(circuit_breaker.CircuitOpenError):
+      with circuit_breaker.guard('sheets'):
+        pass
+
+  def test_pause_mode_waits_until_half_open(self):
+    self._init(mode=circuit_breaker.PAUSE)
+    for _ in range(2):
+      _fail('bigquery', exceptions.ServiceUnavailable('down'))
+
+    start = time.time()
+    with circuit_breaker.guard('bigquery'):
+      pass
+
+    self.assertGreaterEqual(time.time() - start, 0.15)
+    self.assertEqual(circuit_breaker.get_open_circuits(), {})
+
+  def test_quota_errors_do_not_open_the_circuit(self):
+    self._init(mode=circuit_breaker.FAIL)
+    for _ in range(4):
+      _fail('gemini', exceptions.ResourceExhausted('quota'))
+
+    self.assertEqual(circuit_breaker.get_open_circuits(), {})
+
+  def test_per_service_settings_override_the_defaults(self):
+    self._init(services={'google_ads': {'mode': circuit_breaker.FAIL}})
+
+    self.assertEqual(
+        circuit_breaker.get('google_ads').mode, circuit_breaker.FAIL
+        )
+    self.assertEqual(circuit_breaker.get('gemini').mode, circuit_breaker.RECORD)
+
+  def test_off_mode_records_nothing(self):
+    self._init(mode=circuit_breaker.OFF)
+    for _ in range(4):
+      _fail('gemini', exceptions.ServiceUnavailable('down'))
+
+    self.assertEqual(circuit_breaker.get_open_circuits(), {})
+
+
+if __name__ == '__main__':
+  unittest.main()
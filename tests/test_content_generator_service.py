@@ -0,0 +1,176 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the entry priorities and budgets of the content generation."""
+
+import time
+import unittest
+from unittest import mock
+
+from services.content_generator_service import ContentGeneratorService
+from utils.entry import Entry
+from utils.enums import FirstTermSource
+from utils.enums import SecondTermSource
+from utils.task_progress import TaskProgress
+
+SHEET_COLUMNS = {
+    'A': ['shoes', 'bags', 'hats', 'socks'],
+    'D': ['10', '', '250.5', '10'],
+}
+
+
+def _service() -> ContentGeneratorService:
+  """Returns a service without clients, reading SHEET_COLUMNS."""
+  service = ContentGeneratorService.__new__(ContentGeneratorService)
+  service.config = {'country': 'United States'}
+  service.sheets_helper = mock.Mock()
+  service.sheets_helper.read_column_from_row.side_effect = (
+      lambda sheet_id, sheet_name, column, starting_row, limit:
+      SHEET_COLUMNS[column][:limit]
+      )
+  service.first_term_source = FirstTermSource.SPREADSHEET
+  service.second_term_source = SecondTermSource.NONE
+  service.must_find_relationship = False
+  service.batch_mode = False
+  service.dry_run = True
+  service.on_entries_done = None
+  return service
+
+
+class PriorityTest(unittest.TestCase):
+
+  def _generate_base_entries(
+      self,
+      first_term_source_config: dict[str, object]
+      ) -> list[Entry]:
+    service = _service()
+    service.body_params = {
+        'first_term_source_config': {
+            'spreadsheet_id': 'sheet-id',
+            'sheet_name': 'Products',
+            'starting_row': 2,
+            'term_column': 'A',
+            'limit': 10,
+            **first_term_source_config,
+        }
+    }
+    service._ContentGeneratorService__generate_base_entries()
+    return service.entries
+
+  def test_entries_are_sorted_by_priority(self):
+    entries = self._generate_base_entries({'priority_column': 'D'})
+
+    self.assertEqual(
+        [entry.term for entry in entries], ['Hats', 'Shoes', 'Socks', 'Bags']
+        )
+    self.assertEqual(
+        [entry.priority for entry in entries], [250.5, 10.0, 10.0, 0.0]
+        )
+
+  def test_entries_keep_the_source_order_without_priorities(self):
+    entries = self._generate_base_entries({})
+
+    self.assertEqual(
+        [entry.term for entry in entries], ['Shoes', 'Bags', 'Hats', 'Socks']
+        )
+
+
+class BudgetTest(unittest.TestCase):
+
+  def setUp(self):
+    self.service = _service()
+    self.service.entries = [Entry(term) for term in SHEET_COLUMNS['A']]
+    self.service.started_at = time.time()
+    self.service.progress = TaskProgress()
+    self.service.usage = mock.MagicMock()
+    self.service.usage.get_total_cost.return_value = 0.0
+    self.service.bar = mock.Mock()
+
+    def generate_content(entry):
+      entry.headlines = ['Buy ' + entry.term]
+
+    patcher = mock.patch.object(
+        ContentGeneratorService,
+        '_ContentGeneratorService__generate_content',
+        side_effect=generate_content
+        )
+    self.generate_content = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _populate_entries(self, **body_params) -> None:
+    self.service.body_params = body_params
+    self.service._ContentGeneratorService__populate_entries()
+
+  def test_entries_are_populated_without_budgets(self):
+    self._populate_entries()
+
+    self.assertEqual(len(self.service.entries), 4)
+    self.assertEqual(self.generate_content.call_count, 4)
+    self.assertIsNone(self.service.progress.budget_exhausted_by)
+
+  def test_exhausted_cost_budget_skips_the_remaining_entries(self):
+    self.service.usage.get_total_cost.side_effect = [0.0, 0.6, 1.2, 1.8]
+
+    self._populate_entries(cost_budget=1.0)
+
+    self.assertEqual(
+        [entry.term for entry in self.service.entries], ['shoes', 'bags']
+        )
+    self.assertEqual(self.service.progress.budget_exhausted_by, 'cost')
+    self.assertEqual(self.service.progress.entries_skipped, 2)
+
+  def test_exhausted_time_budget_skips_the_remaining_entries(self):
+    self.service.started_at = time.time() - 60
+
+    self._populate_entries(time_budget_seconds=30)
+
+    self.assertEqual(self.service.entries, [])
+    self.generate_content.assert_not_called()
+    self.assertEqual(self.service.progress.budget_exhausted_by, 'time')
+    self.assertEqual(self.service.progress.entries_skipped, 4)
+
+
+class PlanContentTest(unittest.TestCase):
+
+  def test_plan_does_not_replace_the_state_of_a_running_task(self):
+    service = _service()
+    service.dry_run = False
+    service.body_params = {'num_headlines': 3}
+    service.entries = [Entry('Shoes')]
+
+    def plan_content(planner, *args):
+      planner.body_params = {'dry_run': True}
+      planner.dry_run = True
+      planner.entries = []
+      return {'entries': 0}
+
+    with mock.patch.object(
+        ContentGeneratorService,
+        '_ContentGeneratorService__plan_content',
+        autospec=True,
+        side_effect=plan_content
+        ):
+      plan = service.plan_content(
+          FirstTermSource.BIG_QUERY, SecondTermSource.NONE, False, {}
+          )
+
+    self.assertEqual(plan, {'entries': 0})
+    self.assertFalse(service.dry_run)
+    self.assertEqual(service.body_params, {'num_headlines': 3})
+    self.assertEqual([entry.term for entry in service.entries], ['Shoes'])
+    self.assertEqual(service.first_term_source, FirstTermSource.SPREADSHEET)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,113 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the context caches of shared prompt prefixes."""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from utils import context_cache
+from utils.context_cache import LocalContextCache
+
+
+class SlowLocalContextCache(LocalContextCache):
+  """Local cache that takes a while to cache a prefix, like Vertex AI."""
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.created = 0
+
+  def _create_model(self, prefix):
+    self.created += 1
+    time.sleep(0.1)
+    return super()._create_model(prefix)
+
+
+class ContextCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cache = SlowLocalContextCache(
+        None, 'gemini', len, min_tokens=10, ttl_seconds=100
+        )
+
+  def test_short_prefix_is_not_cached(self):
+    self.assertIsNone(self.cache.get_model('short'))
+    self.assertEqual(self.cache.created, 0)
+    self.assertEqual(self.cache.skipped, 1)
+
+  def test_prefix_is_cached_once(self):
+    model = self.cache.get_model('a long shared prefix')
+
+    self.assertIs(self.cache.get_model('a long shared prefix'), model)
+    self.assertEqual(self.cache.created, 1)
+    self.assertEqual(self.cache.hits, 2)
+
+  def test_expired_prefix_is_cached_again(self):
+    now = time.time()
+    with mock.patch.object(context_cache.time, 'time', return_value=now):
+      model = self.cache.get_model('a long shared prefix')
+    with mock.patch.object(
+        context_cache.time, 'time', return_value=now + 95
+        ):
+      refreshed_model = self.cache.get_model('a long shared prefix')
+
+    self.assertIsNot(refreshed_model, model)
+    self.assertEqual(self.cache.created, 2)
+
+  def test_concurrent_requests_cache_the_prefix_once(self):
+    models = []
+    threads = [
+        threading.Thread(
+            target=lambda: models.append(
+                self.cache.get_model('a long shared prefix')
+                )
+            )
+        for _ in range(5)
+    ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(self.cache.created, 1)
+    self.assertEqual(len(set(map(id, models))), 1)
+
+  def test_other_prefixes_are_not_blocked_while_caching(self):
+    thread = threading.Thread(
+        target=self.cache.get_model, args=('a long shared prefix',)
+        )
+    thread.start()
+    time.sleep(0.02)
+    start = time.time()
+    self.cache.get_model('short')
+    elapsed = time.time() - start
+    thread.join()
+
+    self.assertLess(elapsed, 0.05)
+
+  def test_failed_cache_releases_waiting_requests(self):
+    with mock.patch.object(
+        LocalContextCache, '_create_model', side_effect=RuntimeError('down')
+        ):
+      with self.assertRaises(RuntimeError):
+        self.cache.get_model('a long shared prefix')
+
+    self.assertEqual(self.cache.creating, {})
+    self.assertIsNotNone(self.cache.get_model('a long shared prefix'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,106 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the entry ids."""
+
+import unittest
+
+from utils.entry import Entry
+
+
+def _source_config(
+    first_term_source_config: dict[str, object],
+    second_term_source_config: dict[str, object] | None = None
+    ) -> dict[str, object]:
+  """Returns the source config of a task reading the given configs."""
+  return {
+      'first_term_source': 'spreadsheet',
+      'first_term_source_config': first_term_source_config,
+      'second_term_source': 'google_trends',
+      'second_term_source_config': second_term_source_config or {'limit': 10},
+      'country': 'United States',
+  }
+
+
+class EntryIdTest(unittest.TestCase):
+
+  def setUp(self):
+    self.first_term_source_config = {
+        'spreadsheet_id': 'sheet-1',
+        'sheet_name': 'Products',
+        'starting_row': 2,
+        'term_column': 'A',
+        'limit': 100,
+    }
+
+  def _id(self, source_config: dict[str, object]) -> str:
+    """Returns the id of the same entry read with the given source config."""
+    return Entry(
+        'Shoes',
+        associative_term='Running',
+        sku='123',
+        id_namespace=Entry.get_id_namespace(source_config)
+        ).id
+
+  def test_id_is_the_same_across_runs(self):
+    self.assertEqual(
+        self._id(_source_config(self.first_term_source_config)),
+        self._id(_source_config(dict(self.first_term_source_config)))
+        )
+
+  def test_id_survives_a_limit_or_starting_row_change(self):
+    changed_config = dict(
+        self.first_term_source_config,
+        limit=500,
+        starting_row=10,
+        priority_column='C'
+        )
+
+    self.assertEqual(
+        self._id(_source_config(self.first_term_source_config)),
+        self._id(_source_config(changed_config))
+        )
+    self.assertEqual(
+        self._id(_source_config(
+            self.first_term_source_config, {'limit': 10}
+            )),
+        self._id(_source_config(
+            self.first_term_source_config,
+            {'limit': 50, 'priority_by_rank': True}
+            ))
+        )
+
+  def test_id_changes_with_the_sheet_read(self):
+    other_sheet_config = dict(
+        self.first_term_source_config, sheet_name='Other products'
+        )
+
+    self.assertNotEqual(
+        self._id(_source_config(self.first_term_source_config)),
+        self._id(_source_config(other_sheet_config))
+        )
+
+  def test_id_changes_with_the_country(self):
+    other_country_config = dict(
+        _source_config(self.first_term_source_config), country='Germany'
+        )
+
+    self.assertNotEqual(
+        self._id(_source_config(self.first_term_source_config)),
+        self._id(other_country_config)
+        )
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,131 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the columnar feed validator.
+
+The expected messages and fixes are those of the row by row validator it
+replaced, so any change in the results of the columnar rules shows up here.
+"""
+
+import unittest
+from unittest import mock
+
+from output_writers import feed_validator
+from output_writers.models.sa360_feed_row import SA360FeedRow
+from output_writers.sa360_feed_destination import SA360FeedDestination
+
+EXPECTED_ERRORS = [
+    'Id 1 - descriptions list should have min 3 and max 4 elements.',
+    'Id 2 - The URL not a url should be a valid URL.',
+    'Id 2 - The following headlines: Hi should have min 5 and max 30 '
+    'characters.',
+    'Id 2 - The following headlines: ALL CAPS HEADLINE contain all words in '
+    'uppercase.',
+    'Id 2 - Duplicate descriptions found: Same text.',
+    'Id 2 - The following descriptions: SHOUTY DESCRIPTION HERE contain all '
+    'words in uppercase.',
+    'Id 3 - headlines list should have min 3 and max 15 elements.',
+    'Id 3 - The following headlines: A headline that is far too long for the '
+    'limit should have min 5 and max 30 characters.',
+    'Id 3 - descriptions list should have min 3 and max 4 elements.',
+    'Id 3 - The following descriptions: ' + 'x' * 100 +
+    ' should have min 5 and max 90 characters.',
+    'Id 4 - headlines list should have min 3 and max 15 elements.',
+    'Id 4 - descriptions list should have min 3 and max 4 elements.',
+]
+
+
+def _row(
+    row_id: str,
+    url: str,
+    headlines: list[str],
+    descriptions: list[str]
+    ) -> SA360FeedRow:
+  """Returns a feed row with the given id, URL, headlines and descriptions."""
+  return SA360FeedRow(
+      row_id=row_id,
+      publish='',
+      trend='',
+      term='shoes',
+      relationship='',
+      reason='',
+      sku='',
+      keywords=[],
+      url=url,
+      headlines=headlines,
+      descriptions=descriptions,
+      paths=[],
+      campaign_id='',
+      ad_group_id=''
+      )
+
+
+class FeedValidatorTest(unittest.TestCase):
+
+  def setUp(self):
+    self.rows = [
+        _row(
+            '1',
+            'https://example.com/shoes',
+            ['Running shoes', 'Trail shoes', 'Shoes on sale'],
+            ['Comfortable running shoes for every day.', 'Light and durable.']
+            ),
+        _row(
+            '2',
+            'not a url',
+            ['ALL CAPS HEADLINE', 'Hi', "It's [new]"],
+            ['SHOUTY DESCRIPTION HERE', 'Same text', 'Same text']
+            ),
+        _row(
+            '3',
+            '',
+            ['A headline that is far too long for the limit'],
+            ['x' * 100]
+            ),
+        _row(
+            '4',
+            'https://example.com/bags',
+            ['Bag %d' % i for i in range(16)],
+            ['Only one']
+            ),
+    ]
+    self.destination = SA360FeedDestination.__new__(SA360FeedDestination)
+    self.destination.config = {}
+
+  def test_validate_returns_the_messages_of_the_row_validator(self):
+    self.assertEqual(self.destination.validate(self.rows), EXPECTED_ERRORS)
+
+  def test_validate_replaces_quotes_and_brackets_in_place(self):
+    self.destination.validate(self.rows)
+
+    self.assertEqual(
+        self.rows[1].headlines, ['ALL CAPS HEADLINE', 'Hi', 'It"s {new}']
+        )
+    self.assertEqual(
+        self.rows[0].headlines,
+        ['Running shoes', 'Trail shoes', 'Shoes on sale']
+        )
+
+  def test_validate_with_workers_returns_the_same_messages(self):
+    self.destination.config = {'validation_workers': 2}
+
+    with mock.patch.object(feed_validator, 'PARALLEL_MIN_ROWS', 1):
+      self.assertEqual(self.destination.validate(self.rows), EXPECTED_ERRORS)
+
+  def test_validate_without_rows_returns_no_messages(self):
+    self.assertEqual(self.destination.validate([]), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
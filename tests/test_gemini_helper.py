@@ -0,0 +1,114 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the Gemini calls with a timeout.
+
+They use the SDK internals of the pinned google-cloud-aiplatform version, so
+these tests fail if an SDK upgrade changes them.
+"""
+
+import unittest
+from unittest import mock
+
+from google.cloud.aiplatform_v1beta1 import types as gapic_types
+import vertexai
+from vertexai.generative_models import GenerativeModel
+
+from utils import gemini_helper
+from utils.context_cache import LocalCachedModel
+
+
+def _response(text: str) -> gapic_types.GenerateContentResponse:
+  """Returns a prediction service response with the given text."""
+  return gapic_types.GenerateContentResponse(
+      candidates=[
+          gapic_types.Candidate(
+              content=gapic_types.Content(
+                  role='model',
+                  parts=[gapic_types.Part(text=text)]
+                  ),
+              finish_reason=gapic_types.Candidate.FinishReason.STOP
+              )
+      ]
+      )
+
+
+class GenerateContentTest(unittest.TestCase):
+
+  def setUp(self):
+    vertexai.init(project='test-project', location='us-central1')
+    self.model = GenerativeModel('gemini-1.5-flash')
+    self.client = mock.Mock()
+    patcher = mock.patch.object(
+        GenerativeModel,
+        '_prediction_client',
+        new_callable=mock.PropertyMock,
+        return_value=self.client
+        )
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_sdk_has_the_internals_used_for_timeouts(self):
+    for attribute in gemini_helper.SDK_TIMEOUT_ATTRIBUTES:
+      self.assertTrue(hasattr(self.model, attribute), attribute)
+
+  def test_call_is_sent_with_the_timeout(self):
+    self.client.generate_content.return_value = _response('["Buy shoes"]')
+
+    response = gemini_helper._generate_content(self.model, 'Headlines', 12.5)
+
+    self.assertEqual(response.text, '["Buy shoes"]')
+    _, kwargs = self.client.generate_content.call_args
+    self.assertEqual(kwargs['timeout'], 12.5)
+    self.assertTrue(kwargs['request'].model.endswith('gemini-1.5-flash'))
+    self.assertEqual(
+        kwargs['request'].contents[0].parts[0].text, 'Headlines'
+        )
+
+  def test_stream_is_sent_with_the_timeout(self):
+    self.client.stream_generate_content.return_value = iter(
+        [_response('["Buy'), _response(' shoes"]')]
+        )
+
+    chunks = gemini_helper._generate_content(
+        self.model, 'Headlines', 3, stream=True
+        )
+
+    self.assertEqual(''.join(chunk.text for chunk in chunks), '["Buy shoes"]')
+    _, kwargs = self.client.stream_generate_content.call_args
+    self.assertEqual(kwargs['timeout'], 3)
+
+  def test_call_without_timeout_uses_the_public_method(self):
+    with mock.patch.object(
+        GenerativeModel, 'generate_content', return_value='response'
+        ) as generate_content:
+      response = gemini_helper._generate_content(self.model, 'Headlines')
+
+    self.assertEqual(response, 'response')
+    generate_content.assert_called_once()
+    self.client.generate_content.assert_not_called()
+
+  def test_model_without_the_internals_is_called_without_timeout(self):
+    model = mock.Mock(spec=['generate_content'])
+    cached_model = LocalCachedModel(model, 'Prefix. ', 2)
+
+    gemini_helper._generate_content(cached_model, 'Headlines', 5)
+
+    args, kwargs = model.generate_content.call_args
+    self.assertEqual(args, ('Prefix. Headlines',))
+    self.assertNotIn('timeout', kwargs)
+
+
+if __name__ == '__main__':
+  unittest.main()
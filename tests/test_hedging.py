@@ -0,0 +1,120 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the hedged requests."""
+
+import threading
+import time
+import unittest
+
+from utils.hedging import HedgingPolicy
+
+
+class SlowThenFastCall:
+  """Call whose first attempt is slow and whose next attempts are fast."""
+
+  def __init__(self, slow_seconds: float):
+    self.slow_seconds = slow_seconds
+    self.lock = threading.Lock()
+    self.attempts = 0
+    self.timeouts = []
+
+  def __call__(self, timeout: float | None) -> str:
+    with self.lock:
+      self.attempts += 1
+      attempt = self.attempts
+      self.timeouts.append(timeout)
+    if attempt == 1:
+      time.sleep(self.slow_seconds)
+      return 'primary'
+    return 'hedge'
+
+
+class HedgingPolicyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.policy = HedgingPolicy({
+        'min_samples': 3,
+        'max_extra_fraction': 1,
+        'max_burst': 1,
+        'attempt_timeout_seconds': 30,
+    })
+
+  def _record_latencies(self, seconds: float, count: int = 3) -> None:
+    for _ in range(count):
+      self.policy.record_latency('headlines', seconds)
+
+  def test_calls_are_not_hedged_without_enough_latencies(self):
+    self._record_latencies(0.01, 2)
+    call = SlowThenFastCall(0.1)
+
+    self.assertIsNone(self.policy.get_hedge_delay('headlines'))
+    self.assertEqual(self.policy.call('headlines', call), 'primary')
+    self.assertEqual(call.attempts, 1)
+
+  def test_hedge_delay_is_the_latency_percentile(self):
+    for seconds in range(1, 11):
+      self.policy.record_latency('keywords', seconds)
+
+    self.assertEqual(self.policy.get_hedge_delay('keywords'), 9)
+    self.assertIsNone(self.policy.get_hedge_delay('headlines'))
+
+  def test_slow_call_is_hedged_and_the_first_response_wins(self):
+    self._record_latencies(0.01)
+    call = SlowThenFastCall(0.3)
+    discarded = []
+
+    result = self.policy.call(
+        'headlines', call, on_discarded=discarded.append
+        )
+
+    self.assertEqual(result, 'hedge')
+    self.assertEqual(call.attempts, 2)
+    time.sleep(0.4)
+    self.assertEqual(discarded, ['primary'])
+
+  def test_duplicates_are_capped_by_the_budget(self):
+    self._record_latencies(0.01)
+    self.policy.max_extra_fraction = 0.5
+
+    first_call = SlowThenFastCall(0.1)
+    second_call = SlowThenFastCall(0.1)
+    self.assertEqual(self.policy.call('headlines', first_call), 'primary')
+    self.assertEqual(self.policy.call('headlines', second_call), 'hedge')
+
+    self.assertEqual(first_call.attempts, 1)
+    self.assertEqual(second_call.attempts, 2)
+
+  def test_attempts_are_bounded_by_the_call_timeout(self):
+    call = SlowThenFastCall(0)
+
+    self.policy.call('headlines', call, timeout=5)
+    self.policy.call('headlines', call)
+
+    self.assertLessEqual(call.timeouts[0], 5)
+    self.assertEqual(call.timeouts[1], 30)
+
+  def test_error_of_the_primary_is_raised_if_every_call_fails(self):
+    self._record_latencies(0.01)
+
+    def fail(timeout):
+      time.sleep(0.05)
+      raise TimeoutError(f'timed out after {timeout}s')
+
+    with self.assertRaises(TimeoutError):
+      self.policy.call('headlines', fail)
+
+
+if __name__ == '__main__':
+  unittest.main()
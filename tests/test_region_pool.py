@@ -0,0 +1,109 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the pool of Vertex AI regions."""
+
+import collections
+import unittest
+
+from utils import region_pool
+
+
+class CreateRegionPoolTest(unittest.TestCase):
+
+  def test_default_pool_has_one_region(self):
+    pool = region_pool.create_region_pool({})
+
+    self.assertEqual(pool.regions, [region_pool.DEFAULT_REGION])
+
+  def test_list_of_regions_has_default_weights(self):
+    pool = region_pool.create_region_pool(
+        {'gemini_regions': ['us-central1', 'europe-west1']}
+        )
+
+    self.assertEqual(pool.default_region, 'us-central1')
+    self.assertEqual(
+        pool.weights, {'us-central1': 1, 'europe-west1': 1}
+        )
+
+  def test_unsupported_routing_is_rejected(self):
+    with self.assertRaises(ValueError):
+      region_pool.create_region_pool({'gemini_region_routing': 'random'})
+
+  def test_non_positive_or_non_numeric_weights_are_rejected(self):
+    for weight in (0, -1, 'heavy', None, True):
+      with self.subTest(weight=weight):
+        with self.assertRaisesRegex(ValueError, 'europe-west1'):
+          region_pool.create_region_pool({
+              'gemini_regions': {
+                  'us-central1': {'weight': 1},
+                  'europe-west1': {'weight': weight},
+              },
+              'gemini_region_routing': region_pool.LEAST_LOADED,
+          })
+
+
+class RegionPoolTest(unittest.TestCase):
+
+  def test_round_robin_follows_the_weights(self):
+    pool = region_pool.RegionPool(
+        {'us-central1': {'weight': 3}, 'europe-west1': {'weight': 1}}
+        )
+
+    regions = []
+    for _ in range(8):
+      with pool.use('gemini') as region:
+        regions.append(region)
+
+    self.assertEqual(
+        collections.Counter(regions), {'us-central1': 6, 'europe-west1': 2}
+        )
+    # Smooth round robin interleaves the regions
+    self.assertNotEqual(regions[:4], ['us-central1'] * 3 + ['europe-west1'])
+
+  def test_least_loaded_picks_the_region_with_fewer_calls_per_weight(self):
+    pool = region_pool.RegionPool(
+        {'us-central1': {'weight': 2}, 'europe-west1': {'weight': 1}},
+        region_pool.LEAST_LOADED
+        )
+
+    regions = [pool.acquire('gemini') for _ in range(3)]
+
+    self.assertEqual(
+        collections.Counter(regions), {'us-central1': 2, 'europe-west1': 1}
+        )
+    pool.release('us-central1')
+    self.assertEqual(pool.acquire('gemini'), 'us-central1')
+
+  def test_region_with_exhausted_quota_is_skipped(self):
+    pool = region_pool.RegionPool(
+        {'us-central1': {}, 'europe-west1': {}}
+        )
+    pool.mark_quota_exhausted('gemini', 'us-central1', 60)
+
+    for _ in range(3):
+      with pool.use('gemini') as region:
+        self.assertEqual(region, 'europe-west1')
+    self.assertTrue(pool.is_available('gemini'))
+
+    pool.mark_quota_exhausted('gemini', 'europe-west1', 30)
+    self.assertFalse(pool.is_available('gemini'))
+    # The region whose cooldown ends first is used anyway
+    with pool.use('gemini') as region:
+      self.assertEqual(region, 'europe-west1')
+    self.assertTrue(pool.is_available('other-model'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,147 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the retry policy shared by the external service calls."""
+
+import types
+import unittest
+from unittest import mock
+
+from google.api_core import exceptions
+from google.protobuf import duration_pb2
+from google.rpc import error_details_pb2
+
+from utils import retry_policy
+
+
+class ClassifyErrorTest(unittest.TestCase):
+
+  def test_errors_are_classified_by_type(self):
+    cases = [
+        (exceptions.ResourceExhausted('quota'), retry_policy.QUOTA),
+        (exceptions.ServiceUnavailable('down'), retry_policy.TRANSIENT),
+        (exceptions.DeadlineExceeded('slow'), retry_policy.TRANSIENT),
+        (ConnectionError('reset'), retry_policy.TRANSIENT),
+        (exceptions.InvalidArgument('bad'), retry_policy.PERMANENT),
+        (exceptions.NotFound('gone'), retry_policy.PERMANENT),
+        (ValueError('not a list'), retry_policy.PARSE),
+        (RuntimeError('unknown'), retry_policy.OTHER),
+    ]
+    for error, error_class in cases:
+      with self.subTest(error=error):
+        self.assertEqual(retry_policy.classify_error(error), error_class)
+
+  def test_http_errors_are_classified_by_status(self):
+    def http_error(status_code):
+      error = Exception('API error')
+      error.response = types.SimpleNamespace(status_code=status_code)
+      return error
+
+    self.assertEqual(
+        retry_policy.classify_error(http_error(429)), retry_policy.QUOTA
+        )
+    self.assertEqual(
+        retry_policy.classify_error(http_error(503)), retry_policy.TRANSIENT
+        )
+    self.assertEqual(
+        retry_policy.classify_error(http_error(403)), retry_policy.PERMANENT
+        )
+
+  def test_untyped_errors_are_classified_by_message(self):
+    self.assertEqual(
+        retry_policy.classify_error(Exception('Quota exceeded')),
+        retry_policy.QUOTA
+        )
+    self.assertEqual(
+        retry_policy.classify_error(Exception('The response was blocked')),
+        retry_policy.BLOCKED
+        )
+
+
+class GetRetryAfterTest(unittest.TestCase):
+
+  def test_retry_info_delay_is_used(self):
+    retry_info = error_details_pb2.RetryInfo(
+        retry_delay=duration_pb2.Duration(seconds=7, nanos=500000000)
+        )
+    error = exceptions.ResourceExhausted('quota', details=[retry_info])
+
+    self.assertEqual(retry_policy.get_retry_after(error), 7.5)
+
+  def test_retry_after_header_is_used(self):
+    error = Exception('Too many requests')
+    error.response = types.SimpleNamespace(headers={'Retry-After': '12'})
+
+    self.assertEqual(retry_policy.get_retry_after(error), 12.0)
+
+  def test_errors_without_delay_have_none(self):
+    self.assertIsNone(retry_policy.get_retry_after(RuntimeError('boom')))
+
+
+class RetryStateTest(unittest.TestCase):
+
+  def test_permanent_errors_are_not_retried(self):
+    retry = retry_policy.RetryPolicy().start()
+
+    self.assertIsNone(retry.next_delay(exceptions.InvalidArgument('bad')))
+    self.assertEqual(retry.error_class, retry_policy.PERMANENT)
+
+  def test_attempts_are_capped(self):
+    retry = retry_policy.RetryPolicy(max_attempts=3).start()
+    error = exceptions.ServiceUnavailable('down')
+
+    self.assertIsNotNone(retry.next_delay(error))
+    self.assertIsNotNone(retry.next_delay(error))
+    self.assertIsNone(retry.next_delay(error))
+    self.assertEqual(retry.attempts, 3)
+
+  def test_backoff_is_exponential_with_full_jitter(self):
+    retry = retry_policy.RetryPolicy(
+        max_attempts=10,
+        backoff_seconds={retry_policy.TRANSIENT: (1, 5)}
+        ).start()
+    error = exceptions.ServiceUnavailable('down')
+
+    with mock.patch.object(
+        retry_policy.random, 'uniform', side_effect=lambda a, b: b
+        ) as uniform:
+      delays = [retry.next_delay(error) for _ in range(5)]
+
+    self.assertEqual(delays, [1, 2, 4, 5, 5])
+    self.assertTrue(all(args[0] == 0 for args, _ in uniform.call_args_list))
+
+  def test_server_retry_delay_overrides_the_backoff(self):
+    retry = retry_policy.RetryPolicy().start()
+    error = Exception('quota')
+    error.response = types.SimpleNamespace(headers={'Retry-After': '30'})
+
+    delay = retry.next_delay(error)
+
+    self.assertGreaterEqual(delay, 30)
+    self.assertLessEqual(delay, 30 * (1 + retry_policy.RETRY_AFTER_JITTER))
+
+  def test_retries_past_the_deadline_are_not_made(self):
+    retry = retry_policy.RetryPolicy(deadline_seconds=10).start()
+    error = Exception('quota')
+    error.response = types.SimpleNamespace(headers={'Retry-After': '30'})
+
+    self.assertLessEqual(retry.remaining_seconds(), 10)
+    self.assertIsNone(retry.next_delay(error))
+
+  def test_calls_without_deadline_have_no_remaining_seconds(self):
+    self.assertIsNone(retry_policy.RetryPolicy().start().remaining_seconds())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,142 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the incremental sheet exports."""
+
+import unittest
+from unittest import mock
+
+from utils.sheet_helper import GoogleSheetsHelper
+
+HEADER = ['Id', 'Term', 'Headlines', 'Active']
+
+
+class SyncRowsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.helper = GoogleSheetsHelper.__new__(GoogleSheetsHelper)
+    self.helper.client = mock.Mock()
+    self.helper.spreadsheets = {}
+    self.worksheet = (
+        self.helper.client.open_by_key.return_value.worksheet.return_value
+        )
+    self.write_ranges_to_sheet = self._patch('write_ranges_to_sheet')
+    self.write_data_to_sheet = self._patch('write_data_to_sheet')
+    self.create_or_clear_sheet = self._patch('create_or_clear_sheet')
+    self.delete_rows = self._patch('_GoogleSheetsHelper__delete_rows')
+
+  def _patch(self, method: str) -> mock.Mock:
+    """Replaces a method of the helper that calls the Sheets API."""
+    patcher = mock.patch.object(GoogleSheetsHelper, method)
+    self.addCleanup(patcher.stop)
+    return patcher.start()
+
+  def _sync(self, existing, feed):
+    """Syncs a feed, keyed by term, over a sheet with the existing values."""
+    self.worksheet.get_all_values.return_value = existing
+    return self.helper.sync_rows(
+        'sheet-id',
+        'Feed',
+        feed,
+        key_columns=['Term'],
+        ignore_columns=['Id']
+        )
+
+  def test_only_changed_and_inserted_rows_are_written(self):
+    existing = [
+        HEADER,
+        ['1', 'Shoes', '["Buy shoes"]', 'TRUE'],
+        ['2', 'Bags', '["Buy bags"]', ''],
+        ['3', 'Hats', '["Buy hats"]', ''],
+        ['4', 'Socks', '["Buy socks"]', ''],
+    ]
+    feed = [
+        HEADER,
+        # Only the ignored id changed
+        ['10', 'Shoes', '["Buy shoes"]', True],
+        ['11', 'Bags', '["New bags"]', None],
+        ['12', 'Coats', '["Buy coats"]'],
+    ]
+
+    stats = self._sync(existing, feed)
+
+    self.assertEqual(
+        stats, {'inserted': 1, 'changed': 1, 'removed': 2, 'unchanged': 1}
+        )
+    _, _, write_plan = self.write_ranges_to_sheet.call_args.args
+    self.assertEqual(write_plan, [
+        ('A3', [['11', 'Bags', '["New bags"]', '']]),
+        # The inserted row takes the place of the first removed row
+        ('A4', [['12', 'Coats', '["Buy coats"]', '']]),
+    ])
+    self.delete_rows.assert_called_once()
+    _, _, row_numbers = self.delete_rows.call_args.args
+    self.assertEqual(row_numbers, [5])
+    self.write_data_to_sheet.assert_not_called()
+
+  def test_inserted_rows_are_appended_when_no_row_was_removed(self):
+    existing = [HEADER, ['1', 'Shoes', '["Buy shoes"]', '']]
+    feed = [
+        HEADER,
+        ['1', 'Shoes', '["Buy shoes"]', ''],
+        ['2', 'Bags', '["Buy bags"]', ''],
+    ]
+
+    stats = self._sync(existing, feed)
+
+    self.assertEqual(
+        stats, {'inserted': 1, 'changed': 0, 'removed': 0, 'unchanged': 1}
+        )
+    _, _, write_plan = self.write_ranges_to_sheet.call_args.args
+    self.assertEqual(write_plan, [('A3', [['2', 'Bags', '["Buy bags"]', '']])])
+    self.delete_rows.assert_not_called()
+
+  def test_duplicate_keys_are_matched_in_order(self):
+    existing = [
+        HEADER,
+        ['1', 'Shoes', '["First"]', ''],
+        ['2', 'Shoes', '["Second"]', ''],
+    ]
+    feed = [
+        HEADER,
+        ['1', 'Shoes', '["First"]', ''],
+        ['2', 'Shoes', '["Changed"]', ''],
+    ]
+
+    stats = self._sync(existing, feed)
+
+    self.assertEqual(
+        stats, {'inserted': 0, 'changed': 1, 'removed': 0, 'unchanged': 1}
+        )
+    _, _, write_plan = self.write_ranges_to_sheet.call_args.args
+    self.assertEqual(write_plan, [('A3', [['2', 'Shoes', '["Changed"]', '']])])
+
+  def test_changed_header_rewrites_the_sheet(self):
+    existing = [['Id', 'Term'], ['1', 'Shoes']]
+    feed = [HEADER, ['1', 'Shoes', '["Buy shoes"]', '']]
+
+    stats = self._sync(existing, feed)
+
+    self.assertEqual(
+        stats, {'inserted': 1, 'changed': 0, 'removed': 0, 'unchanged': 0}
+        )
+    self.create_or_clear_sheet.assert_called_once_with('sheet-id', 'Feed')
+    self.write_data_to_sheet.assert_called_once_with(
+        'sheet-id', 'Feed', 'A1', feed
+        )
+    self.write_ranges_to_sheet.assert_not_called()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,386 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Gemini batch prediction runners.
+
+Prompts are written to a JSONL file in the Vertex AI batch prediction format
+and the predictions are read back from the JSONL files of the job output.
+VertexBatchPredictionRunner submits a Vertex AI batch prediction job through
+Cloud Storage, and LocalBatchPredictionRunner runs the same files through a
+model in a local directory, for tests and offline runs.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+import types
+import uuid
+from typing import Any
+
+from google.cloud import storage
+from vertexai.batch_prediction import BatchPredictionJob
+
+BATCH_POLL_SECONDS = 30
+INPUT_FILE = 'input.jsonl'
+OUTPUT_FILE = 'predictions.jsonl'
+
+
+def to_request_line(
+    prompt: str,
+    generation_config: dict[str, Any],
+    safety_settings: list[dict[str, str]]
+    ) -> str:
+  """Returns the JSONL line of a prompt in the batch prediction input.
+
+  Args:
+    prompt (str): The prompt.
+    generation_config (dict[str, Any]): The generation config, with snake
+    case keys.
+    safety_settings (list[dict[str, str]]): The category and threshold of
+    each safety setting.
+
+  Returns:
+    str: The JSON line.
+  """
+  return json.dumps({
+      'request': {
+          'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+          'generationConfig': {
+              _to_camel_case(key): value
+              for key, value in generation_config.items()
+          },
+          'safetySettings': safety_settings,
+      }
+  })
+
+
+def parse_prediction(
+    record: dict[str, Any]
+    ) -> tuple[str, str | None, Any]:
+  """Parses a line of the batch prediction output.
+
+  Args:
+    record (dict[str, Any]): The parsed JSON line.
+
+  Returns:
+    tuple[str, str | None, Any]: The prompt, the response text or None if
+    the request failed, and the usage metadata, with the attributes of the
+    usage_metadata of an online response.
+  """
+  prompt = ''.join(
+      part.get('text', '')
+      for content in record['request']['contents']
+      for part in content['parts']
+      )
+
+  try:
+    candidate = record['response']['candidates'][0]
+    text = ''.join(part['text'] for part in candidate['content']['parts'])
+  except (KeyError, IndexError, TypeError):
+    logging.error(' Batch prediction failed: %s', record.get('status'))
+    return prompt, None, None
+
+  usage = record['response'].get('usageMetadata', {})
+  usage_metadata = types.SimpleNamespace(
+      prompt_token_count=usage.get('promptTokenCount', 0),
+      candidates_token_count=usage.get('candidatesTokenCount', 0),
+      cached_content_token_count=usage.get('cachedContentTokenCount', 0)
+      )
+  return prompt, text, usage_metadata
+
+
+def _to_camel_case(key: str) -> str:
+  """Converts a snake case key to camel case, e.g. top_p to topP."""
+  first, *rest = key.split('_')
+  return first + ''.join(word.capitalize() for word in rest)
+
+
+class BatchPredictionRunner:
+  """Runs prompts as a batch and returns the output records."""
+
+  def __init__(
+      self,
+      model_name: str,
+      generation_config: dict[str, Any],
+      safety_settings: list[dict[str, str]]
+      ):
+    """Init method for BatchPredictionRunner.
+
+    Args:
+      model_name (str): The model that serves the requests.
+      generation_config (dict[str, Any]): The generation config.
+      safety_settings (list[dict[str, str]]): The category and threshold of
+      each safety setting.
+    """
+    self.model_name = model_name
+    self.generation_config = generation_config
+    self.safety_settings = safety_settings
+
+  def run(self, prompts: list[str]) -> list[dict[str, Any]]:
+    """Runs prompts as a batch. Sub-classes must implement this method.
+
+    Args:
+      prompts (list[str]): The prompts.
+
+    Returns:
+      list[dict[str, Any]]: The output records, in any order.
+    """
+    raise NotImplementedError
+
+  def _get_input(self, prompts: list[str]) -> str:
+    """Returns the JSONL input of the prompts.
+
+    Args:
+      prompts (list[str]): The prompts.
+
+    Returns:
+      str: One request per line.
+    """
+    return ''.join(
+        to_request_line(
+            prompt,
+            self.generation_config,
+            self.safety_settings
+            ) + '\n'
+        for prompt in prompts
+        )
+
+
+class VertexBatchPredictionRunner(BatchPredictionRunner):
+  """Runs prompts as a Vertex AI batch prediction job."""
+
+  def __init__(
+      self,
+      model_name: str,
+      generation_config: dict[str, Any],
+      safety_settings: list[dict[str, str]],
+      project_id: str,
+      gcs_uri: str,
+      poll_seconds: int = BATCH_POLL_SECONDS
+      ):
+    """Init method for VertexBatchPredictionRunner.
+
+    Args:
+      model_name (str): The model that serves the requests.
+      generation_config (dict[str, Any]): The generation config.
+      safety_settings (list[dict[str, str]]): The category and threshold of
+      each safety setting.
+      project_id (str): The Cloud Storage project.
+      gcs_uri (str): The gs:// folder of the job inputs and outputs.
+      poll_seconds (int): The seconds between job status checks.
+    """
+    super().__init__(model_name, generation_config, safety_settings)
+    self.project_id = project_id
+    self.gcs_uri = gcs_uri.rstrip('/')
+    self.poll_seconds = poll_seconds
+
+  def run(self, prompts: list[str]) -> list[dict[str, Any]]:
+    """Uploads the prompts, runs the job and downloads its output.
+
+    Args:
+      prompts (list[str]): The prompts.
+
+    Returns:
+      list[dict[str, Any]]: The output records, in any order.
+
+    Raises:
+      RuntimeError: If the job fails.
+    """
+    client = storage.Client(project=self.project_id)
+    job_uri = f'{self.gcs_uri}/{uuid.uuid4().hex}'
+    input_uri = f'{job_uri}/{INPUT_FILE}'
+    storage.Blob.from_string(input_uri, client=client).upload_from_string(
+        self._get_input(prompts),
+        content_type='application/jsonl'
+        )
+
+    job = BatchPredictionJob.submit(
+        source_model=self.model_name,
+        input_dataset=input_uri,
+        output_uri_prefix=f'{job_uri}/output'
+        )
+    logging.info(
+        ' Batch prediction job %s submitted with %d requests',
+        job.resource_name,
+        len(prompts)
+        )
+    while not job.has_ended:
+      time.sleep(self.poll_seconds)
+      job.refresh()
+
+    if not job.has_succeeded:
+      raise RuntimeError(
+          f'Batch prediction job {job.resource_name} failed: {job.error}'
+          )
+
+    bucket_name, _, prefix = job.output_location.removeprefix(
+        'gs://'
+        ).partition('/')
+    records = []
+    for blob in client.list_blobs(bucket_name, prefix=prefix):
+      if blob.name.endswith('.jsonl'):
+        records.extend(
+            json.loads(line)
+            for line in blob.download_as_text().splitlines()
+            if line.strip()
+            )
+    return records
+
+
+class LocalBatchPredictionRunner(BatchPredictionRunner):
+  """Runs the batch prediction files through a model in a local directory."""
+
+  def __init__(
+      self,
+      model_name: str,
+      generation_config: dict[str, Any],
+      safety_settings: list[dict[str, str]],
+      model: Any,
+      directory: str | None = None
+      ):
+    """Init method for LocalBatchPredictionRunner.
+
+    Args:
+      model_name (str): The model that serves the requests.
+      generation_config (dict[str, Any]): The generation config.
+      safety_settings (list[dict[str, str]]): The category and threshold of
+      each safety setting.
+      model (Any): The model that generates each prediction.
+      directory (str | None): The folder of the job files, a temporary
+      folder if None.
+    """
+    super().__init__(model_name, generation_config, safety_settings)
+    self.model = model
+    self.directory = directory
+
+  def run(self, prompts: list[str]) -> list[dict[str, Any]]:
+    """Writes the input file, generates the output file and reads it back.
+
+    Args:
+      prompts (list[str]): The prompts.
+
+    Returns:
+      list[dict[str, Any]]: The output records.
+    """
+    job_dir = os.path.join(
+        self.directory or tempfile.gettempdir(),
+        uuid.uuid4().hex
+        )
+    os.makedirs(job_dir)
+    input_path = os.path.join(job_dir, INPUT_FILE)
+    output_path = os.path.join(job_dir, OUTPUT_FILE)
+
+    with open(input_path, 'w') as f:
+      f.write(self._get_input(prompts))
+
+    with open(input_path) as input_file, open(output_path, 'w') as output_file:
+      for line in input_file:
+        output_file.write(json.dumps(self.__predict(json.loads(line))) + '\n')
+
+    with open(output_path) as f:
+      return [json.loads(line) for line in f]
+
+  def __predict(self, record: dict[str, Any]) -> dict[str, Any]:
+    """Generates the output record of an input record.
+
+    Args:
+      record (dict[str, Any]): The input record.
+
+    Returns:
+      dict[str, Any]: The record with the response, or the error status.
+    """
+    prompt = ''.join(
+        part['text']
+        for content in record['request']['contents']
+        for part in content['parts']
+        )
+    try:
+      response = self.model.generate_content(prompt)
+      usage_metadata = getattr(response, 'usage_metadata', None)
+      return {
+          **record,
+          'status': '',
+          'response': {
+              'candidates': [{
+                  'content': {'role': 'model', 'parts': [{'text': response.text}]}
+              }],
+              'usageMetadata': {
+                  'promptTokenCount': getattr(
+                      usage_metadata, 'prompt_token_count', 0
+                      ),
+                  'candidatesTokenCount': getattr(
+                      usage_metadata, 'candidates_token_count', 0
+                      ),
+              },
+          },
+      }
+    except Exception as e:
+      return {**record, 'status': str(e)}
+
+
+def create_batch_runner(
+    config: dict[str, Any],
+    model: Any,
+    model_name: str,
+    generation_config: dict[str, Any],
+    safety_settings: list[dict[str, str]]
+    ) -> BatchPredictionRunner:
+  """Creates the runner set in the batch_prediction config key.
+
+  Args:
+    config (dict[str, Any]): A dictionary containing configuration parameters.
+    model (Any): The model used by the local runner.
+    model_name (str): The model name.
+    generation_config (dict[str, Any]): The generation config.
+    safety_settings (list[dict[str, str]]): The category and threshold of
+    each safety setting.
+
+  Returns:
+    BatchPredictionRunner: The runner, vertex by default.
+
+  Raises:
+    ValueError: If the batch_prediction config key is not supported, or the
+    Cloud Storage folder of the vertex runner is missing.
+  """
+  runner_type = config.get('batch_prediction', 'vertex')
+
+  if runner_type == 'vertex':
+    if not config.get('batch_prediction_gcs_uri'):
+      raise ValueError(
+          'Missing batch_prediction_gcs_uri config, the gs:// folder of the '
+          'batch prediction files.'
+          )
+    return VertexBatchPredictionRunner(
+        model_name,
+        generation_config,
+        safety_settings,
+        config['project_id'],
+        config['batch_prediction_gcs_uri'],
+        config.get('batch_prediction_poll_seconds', BATCH_POLL_SECONDS)
+        )
+  elif runner_type == 'local':
+    return LocalBatchPredictionRunner(
+        model_name,
+        generation_config,
+        safety_settings,
+        model,
+        config.get('batch_prediction_dir')
+        )
+
+  raise ValueError(
+      f'Unsupported batch_prediction: {runner_type}. '
+      'Supported values are vertex and local.'
+      )
@@ -18,9 +18,15 @@ This module contains all the methods for
 working with BigQuery.
 """
 
+import datetime
 import logging
+from typing import Any
 
 from google.cloud import bigquery
+from utils import cassette
+from utils import circuit_breaker
+from utils import metrics
+from utils import tracing
 from utils.authentication_helper import Authenticator
 
 # Logger config
@@ -28,6 +34,32 @@ logging.basicConfig()
 logging.root.setLevel(logging.INFO)
 
 
+def _to_recorded_results(
+    results: tuple[list[bigquery.Row], int, bool]
+    ) -> list[Any]:
+  """Returns the fields and values of the rows of a query, to record them."""
+  rows, bytes_billed, cache_hit = results
+  return [
+      list(rows[0].keys()) if rows else [],
+      [list(row.values()) for row in rows],
+      bytes_billed,
+      cache_hit,
+  ]
+
+
+def _from_recorded_results(
+    record: list[Any]
+    ) -> tuple[list[bigquery.Row], int, bool]:
+  """Returns the rows of a query from their recorded fields and values."""
+  fields, values, bytes_billed, cache_hit = record
+  field_to_index = {field: i for i, field in enumerate(fields)}
+  return (
+      [bigquery.Row(tuple(row), field_to_index) for row in values],
+      bytes_billed,
+      cache_hit
+      )
+
+
 class BigQueryHelper:
   """BigQuery helper to read data from BigQuery using the specified client."""
 
@@ -44,6 +76,7 @@ class BigQueryHelper:
       credentials=creds,
       project=config['project_id']
     )
+    self.maximum_bytes_billed = config.get('maximum_bytes_billed')
 
   def read_bigquery_column(
       self,
@@ -66,26 +99,182 @@ class BigQueryHelper:
       list[str]: A list containing the values of the specified column.
     """
     query = (
-        'SELECT ' + column_name +
-        ' FROM `' + project_id + '.' + dataset_id + '.' + table_id +
-        '` LIMIT ' + str(limit)
+        'SELECT ' + self.__quote_identifier(column_name) +
+        ' FROM ' + self.__quote_identifier(
+            project_id + '.' + dataset_id + '.' + table_id
+            ) +
+        ' LIMIT @limit'
         )
 
-    rows = self.bigquery_client.query(query).result()
+    rows = self.run_query(query, {'limit': limit})
     column_values = [row[column_name] for row in rows]
 
     return column_values
 
-  def run_query(self, query: str):
+  def run_query(self, query: str, params: dict[str, Any] | None = None):
     """Runs a BigQuery query.
 
+    If a maximum_bytes_billed is configured, the query is dry-run first to
+    report the bytes it will scan, and not run if it exceeds it. Otherwise
+    it runs without a dry run.
+
     Args:
       query (str): The query to run.
+      params (dict[str, Any]): Named query parameters, referenced in the query
+      as @name.
 
     Returns:
       list: A list containing the results of the query.
+
+    Raises:
+      ValueError: If the query would scan more than maximum_bytes_billed.
     """
-    rows = self.bigquery_client.query(query).result()
-    results = [row for row in rows]
+    query_parameters = self.__get_query_parameters(params or {})
+    bytes_to_scan = None
+    if self.maximum_bytes_billed:
+      bytes_to_scan = self.__dry_run(query, query_parameters)
+      if bytes_to_scan > self.maximum_bytes_billed:
+        raise ValueError(
+            f'Query would scan {bytes_to_scan} bytes, more than the '
+            f'maximum_bytes_billed of {self.maximum_bytes_billed} bytes.'
+            )
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=query_parameters,
+        use_query_cache=True,
+        maximum_bytes_billed=self.maximum_bytes_billed
+        )
+    with (circuit_breaker.guard('bigquery'),
+          metrics.track('bigquery', 'query'),
+          tracing.span('bigquery.query', bytes_to_scan=bytes_to_scan) as span):
+      results, bytes_billed, cache_hit = cassette.call(
+          'bigquery',
+          [query, params],
+          lambda: self.__run_query_job(query, job_config),
+          _to_recorded_results,
+          _from_recorded_results
+          )
+      span.set_attributes({
+          'rows': len(results),
+          'cache_hit': cache_hit,
+          })
+    metrics.count_bytes('bigquery', 'scanned', bytes_billed)
+
+    if cache_hit:
+      logging.info(' Query results served from BigQuery cache')
 
     return results
+
+  def __run_query_job(
+      self,
+      query: str,
+      job_config: bigquery.QueryJobConfig
+      ) -> tuple[list[bigquery.Row], int, bool]:
+    """Runs a query job and waits for its rows.
+
+    Args:
+      query (str): The query to run.
+      job_config (bigquery.QueryJobConfig): The job config.
+
+    Returns:
+      tuple[list[bigquery.Row], int, bool]: The rows, the bytes billed and
+      whether the results were served from the BigQuery cache.
+    """
+    query_job = self.bigquery_client.query(query, job_config=job_config)
+    results = [row for row in query_job.result()]
+    return (
+        results,
+        query_job.total_bytes_billed or 0,
+        bool(query_job.cache_hit)
+        )
+
+  def __dry_run(
+      self,
+      query: str,
+      query_parameters: list[bigquery.ScalarQueryParameter]
+      ) -> int:
+    """Dry-runs a query to get the bytes it will scan.
+
+    Args:
+      query (str): The query to dry-run.
+      query_parameters (list[bigquery.ScalarQueryParameter]): The parameters.
+
+    Returns:
+      int: The number of bytes the query will scan.
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=query_parameters,
+        dry_run=True,
+        use_query_cache=False
+        )
+    with (circuit_breaker.guard('bigquery'),
+          metrics.track('bigquery', 'dry_run')):
+      bytes_to_scan = cassette.call(
+          'bigquery_dry_run',
+          [query, [param.to_api_repr() for param in query_parameters]],
+          lambda: self.bigquery_client.query(
+              query,
+              job_config=job_config
+              ).total_bytes_processed or 0
+          )
+    logging.info(' Query will scan %d bytes', bytes_to_scan)
+
+    return bytes_to_scan
+
+  def __get_query_parameters(
+      self,
+      params: dict[str, Any]
+      ) -> list[bigquery.ScalarQueryParameter]:
+    """Converts a dict of values to BigQuery query parameters.
+
+    Args:
+      params (dict[str, Any]): The parameter values by name.
+
+    Returns:
+      list[bigquery.ScalarQueryParameter]: The typed query parameters.
+
+    Raises:
+      ValueError: If a parameter value type is not supported.
+    """
+    query_parameters = []
+    for name, value in params.items():
+      # bool must be checked before int, as bool is a subclass of int
+      if isinstance(value, bool):
+        param_type = 'BOOL'
+      elif isinstance(value, int):
+        param_type = 'INT64'
+      elif isinstance(value, float):
+        param_type = 'FLOAT64'
+      # datetime must be checked before date, as datetime is a subclass of date
+      elif isinstance(value, datetime.datetime):
+        param_type = 'TIMESTAMP' if value.tzinfo is not None else 'DATETIME'
+      elif isinstance(value, datetime.date):
+        param_type = 'DATE'
+      elif isinstance(value, str):
+        param_type = 'STRING'
+      else:
+        raise ValueError(f'Unsupported type for query parameter {name}')
+      query_parameters.append(
+          bigquery.ScalarQueryParameter(name, param_type, value)
+          )
+
+    return query_parameters
+
+  def __quote_identifier(self, identifier: str) -> str:
+    """Quotes a column or table identifier with backticks.
+
+    Identifiers cannot be query parameters, so they are quoted instead.
+
+    Args:
+      identifier (str): The identifier to quote.
+
+    Returns:
+      str: The quoted identifier.
+
+    Raises:
+      ValueError: If the identifier contains backticks.
+    """
+    if '`' in identifier:
+      raise ValueError(f'Invalid identifier: {identifier}')
+
+    return '`' + identifier + '`'
@@ -0,0 +1,229 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record and replay of the external service calls.
+
+In record mode, the response and latency of each successful call to Gemini,
+BigQuery, Google Sheets and Google Ads are appended to a gzipped JSONL file,
+keyed by a hash of the request. In replay mode, the calls are served from the
+file without calling the services, optionally waiting their recorded
+latency, so a recorded run can be replayed offline with identical outputs.
+A request made several times is replayed in the recorded order, repeating
+the last response.
+
+The cassette is configured with the cassette config key: mode (off, record
+or replay), path and simulate_latency.
+
+Each record is written as its own gzip member, so the file stays readable
+when the server is stopped while recording. The records of a truncated last
+member are skipped on replay.
+"""
+
+import atexit
+import collections
+import datetime
+import decimal
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+import zlib
+from typing import Any, Callable
+
+OFF = 'off'
+RECORD = 'record'
+REPLAY = 'replay'
+MODES = (OFF, RECORD, REPLAY)
+
+DEFAULT_PATH = 'cassette.jsonl.gz'
+
+_mode = OFF
+_simulate_latency = False
+_file = None
+_responses = {}
+_lock = threading.Lock()
+
+
+class CassetteMissError(Exception):
+  """Raised in replay mode when a request was not recorded."""
+
+  def __init__(self, service: str, key: str):
+    """Init method for CassetteMissError.
+
+    Args:
+      service (str): The service of the request.
+      key (str): The hash of the request.
+    """
+    super().__init__(f'Request {key} to {service} not found in the cassette')
+    self.service = service
+    self.key = key
+
+
+def init_cassette(config: dict[str, Any]) -> None:
+  """Opens the cassette of the cassette config key.
+
+  Args:
+    config (dict[str, Any]): A dictionary containing configuration parameters.
+
+  Raises:
+    ValueError: If the mode is not supported.
+  """
+  global _mode, _simulate_latency, _file, _responses
+  settings = config.get('cassette') or {}
+  mode = settings.get('mode', OFF)
+  if mode not in MODES:
+    raise ValueError(
+        f'Unsupported cassette mode: {mode}. '
+        f'Supported values are {", ".join(MODES)}.'
+        )
+  path = settings.get('path', DEFAULT_PATH)
+
+  close_cassette()
+  with _lock:
+    _mode = mode
+    _simulate_latency = bool(settings.get('simulate_latency'))
+    _responses = collections.defaultdict(collections.deque)
+
+    if mode == RECORD:
+      _file = open(path, 'wb')
+      logging.info(' Recording external calls to %s', path)
+    elif mode == REPLAY:
+      for record in _read_records(path):
+        _responses[(record['service'], record['key'])].append(
+            (record['response'], record['seconds'])
+            )
+      logging.info(
+          ' Replaying %d distinct recorded requests from %s',
+          len(_responses),
+          path
+          )
+
+
+@atexit.register
+def close_cassette() -> None:
+  """Closes the file being recorded, if any."""
+  global _file
+  with _lock:
+    if _file is not None:
+      _file.close()
+      _file = None
+
+
+def _read_records(path: str) -> list[dict[str, Any]]:
+  """Reads the records of a cassette, up to a truncated end if any.
+
+  Args:
+    path (str): The path of the cassette.
+
+  Returns:
+    list[dict[str, Any]]: The complete records.
+  """
+  records = []
+  with gzip.open(path, 'rt', encoding='utf-8') as f:
+    try:
+      for line in f:
+        # A line without its newline was cut off while being written
+        if line.endswith('\n'):
+          records.append(json.loads(line, object_hook=_decode_value))
+    except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+      logging.warning(
+          ' Cassette %s is truncated, replaying its %d complete records: %s',
+          path,
+          len(records),
+          e
+          )
+  return records
+
+
+def call(
+    service: str,
+    request: Any,
+    fn: Callable[[], Any],
+    encode: Callable[[Any], Any] | None = None,
+    decode: Callable[[Any], Any] | None = None
+    ) -> Any:
+  """Makes, records or replays a call.
+
+  Args:
+    service (str): The service, e.g. gemini.
+    request (Any): The JSON serializable values that identify the request.
+    fn (Callable[[], Any]): The call.
+    encode (Callable[[Any], Any] | None): Converts the response to JSON
+    serializable values, if it isn't.
+    decode (Callable[[Any], Any] | None): Converts the recorded values back
+    to the response.
+
+  Returns:
+    Any: The response of the call, or the recorded one.
+
+  Raises:
+    CassetteMissError: In replay mode, if the request was not recorded.
+  """
+  if _mode == OFF:
+    return fn()
+
+  key = hashlib.sha256(
+      json.dumps(request, sort_keys=True, default=str).encode()
+      ).hexdigest()[:32]
+
+  if _mode == REPLAY:
+    with _lock:
+      responses = _responses.get((service, key))
+      if not responses:
+        raise CassetteMissError(service, key)
+      response, seconds = (
+          responses.popleft() if len(responses) > 1 else responses[0]
+          )
+    if _simulate_latency:
+      time.sleep(seconds)
+    return decode(response) if decode else response
+
+  start = time.time()
+  response = fn()
+  line = json.dumps({
+      'service': service,
+      'key': key,
+      'seconds': round(time.time() - start, 3),
+      'response': encode(response) if encode else response,
+  }, default=_encode_value)
+  member = gzip.compress((line + '\n').encode('utf-8'))
+  with _lock:
+    if _file is not None:
+      _file.write(member)
+      _file.flush()
+  return response
+
+
+def _encode_value(value: Any) -> dict[str, str]:
+  """Converts the values JSON doesn't support, e.g. BigQuery dates."""
+  if isinstance(value, datetime.datetime):
+    return {'__datetime__': value.isoformat()}
+  if isinstance(value, datetime.date):
+    return {'__date__': value.isoformat()}
+  if isinstance(value, decimal.Decimal):
+    return {'__decimal__': str(value)}
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _decode_value(value: dict[str, Any]) -> Any:
+  """Converts back the values of _encode_value."""
+  if '__datetime__' in value:
+    return datetime.datetime.fromisoformat(value['__datetime__'])
+  if '__date__' in value:
+    return datetime.date.fromisoformat(value['__date__'])
+  if '__decimal__' in value:
+    return decimal.Decimal(value['__decimal__'])
+  return value
@@ -0,0 +1,295 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Circuit breakers of the external services.
+
+Each service (gemini, google_ads, sheets, bigquery) has a breaker that
+counts its failed calls in a window of recent calls. When the failure rate
+reaches a threshold the circuit opens: calls wait until it half-opens (pause
+mode), raise CircuitOpenError (fail mode) or still go through (record mode,
+the default, which only reports the state of the circuit). After
+open_seconds a few probe calls go through, and the circuit closes if they
+succeed or opens again if they fail. Only transient and unclassified errors count as failures, as
+quota, content and request errors don't mean the service is down.
+
+Breakers are configured with the circuit_breaker config key, with the
+defaults of DEFAULT_SETTINGS and per-service overrides under services.
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+from typing import Any, Iterator
+
+from utils import retry_policy
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+PAUSE = 'pause'
+FAIL = 'fail'
+RECORD = 'record'
+OFF = 'off'
+
+DEFAULT_SETTINGS = {
+    # pause, fail, record or off. Calls are only paused or failed if opted in
+    'mode': RECORD,
+    # Failed calls over calls in the window that open the circuit
+    'failure_rate': 0.5,
+    'window_size': 20,
+    # Calls in the window before the failure rate is checked
+    'min_calls': 10,
+    # Seconds the circuit stays open before probing
+    'open_seconds': 60,
+    'half_open_probes': 1,
+    # Seconds a call waits in pause mode before failing anyway
+    'max_pause_seconds': 1800,
+}
+
+FAILURE_CLASSES = frozenset([retry_policy.TRANSIENT, retry_policy.OTHER])
+
+_settings = {}
+_breakers = {}
+_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+  """Raised when a call is not made because the circuit of its service is open."""
+
+  def __init__(self, service: str, retry_in: float):
+    """Init method for CircuitOpenError.
+
+    Args:
+      service (str): The service of the circuit.
+      retry_in (float): The seconds until the circuit half-opens.
+    """
+    super().__init__(
+        f'Circuit open for {service}: too many failed calls, '
+        f'retrying in {retry_in:.0f}s'
+        )
+    self.service = service
+    self.retry_in = retry_in
+
+
+class CircuitBreaker:
+  """Circuit breaker of a service."""
+
+  def __init__(self, service: str, settings: dict[str, Any]):
+    """Init method for CircuitBreaker.
+
+    Args:
+      service (str): The service, e.g. gemini.
+      settings (dict[str, Any]): The settings of DEFAULT_SETTINGS.
+    """
+    self.service = service
+    self.mode = settings['mode']
+    self.failure_rate = settings['failure_rate']
+    self.min_calls = settings['min_calls']
+    self.open_seconds = settings['open_seconds']
+    self.half_open_probes = settings['half_open_probes']
+    self.max_pause_seconds = settings['max_pause_seconds']
+    self.updated = threading.Condition()
+    self.state = CLOSED
+    self.results = collections.deque(maxlen=settings['window_size'])
+    self.opened_at = 0.0
+    self.times_opened = 0
+    self.probes = 0
+
+  @contextlib.contextmanager
+  def guard(self) -> Iterator[None]:
+    """Lets a call through if the circuit allows it and records its result.
+
+    Yields:
+      None
+
+    Raises:
+      CircuitOpenError: If the circuit is open in fail mode, or stays open
+      longer than max_pause_seconds in pause mode.
+    """
+    if self.mode == OFF:
+      yield
+      return
+
+    self.__before_call()
+    try:
+      yield
+    except Exception as e:
+      self.__record(retry_policy.classify_error(e) not in FAILURE_CLASSES)
+      raise
+    else:
+      self.__record(True)
+
+  def to_dict(self) -> dict[str, Any]:
+    """Returns the state of the circuit.
+
+    Returns:
+      dict[str, Any]: The state, mode, failure rate of the window, times
+      opened and seconds until probing if open.
+    """
+    with self.updated:
+      calls = len(self.results)
+      state = {
+          'state': self.state,
+          'mode': self.mode,
+          'calls': calls,
+          'failure_rate': (
+              round(self.results.count(False) / calls, 3) if calls else 0.0
+              ),
+          'times_opened': self.times_opened,
+      }
+      if self.state == OPEN:
+        state['half_open_in'] = round(self.__get_half_open_in(), 1)
+      return state
+
+  def __before_call(self) -> None:
+    """Waits or fails while the circuit is open, and counts probe calls."""
+    paused_since = None
+    with self.updated:
+      while True:
+        if self.state == CLOSED:
+          return
+
+        if self.state == OPEN and self.__get_half_open_in() <= 0:
+          self.state = HALF_OPEN
+          self.probes = 0
+          logging.info(' Circuit of %s half-open, probing', self.service)
+
+        if self.state == HALF_OPEN and self.probes < self.half_open_probes:
+          self.probes += 1
+          return
+
+        if self.mode == RECORD:
+          return
+
+        now = time.time()
+        paused_since = paused_since or now
+        if (self.mode == FAIL
+            or now - paused_since >= self.max_pause_seconds):
+          raise CircuitOpenError(self.service, self.__get_half_open_in())
+
+        # Half-open circuits wait for their probes to finish
+        self.updated.wait(
+            min(
+                self.__get_half_open_in() or self.open_seconds,
+                paused_since + self.max_pause_seconds - now
+                )
+            )
+
+  def __record(self, success: bool) -> None:
+    """Records the result of a call, opening or closing the circuit.
+
+    Args:
+      success (bool): Whether the call succeeded.
+    """
+    with self.updated:
+      if self.state == HALF_OPEN:
+        self.probes = max(0, self.probes - 1)
+        if success:
+          self.state = CLOSED
+          self.results.clear()
+          logging.info(' Circuit of %s closed', self.service)
+          self.updated.notify_all()
+        else:
+          self.__open()
+        return
+
+      # Calls that started before the circuit opened
+      if self.state == OPEN:
+        return
+
+      self.results.append(success)
+      calls = len(self.results)
+      if (calls >= self.min_calls
+          and self.results.count(False) / calls >= self.failure_rate):
+        self.__open()
+
+  def __open(self) -> None:
+    """Opens the circuit. Must be called with the lock held."""
+    self.state = OPEN
+    self.opened_at = time.time()
+    self.times_opened += 1
+    self.results.clear()
+    logging.warning(
+        ' Circuit of %s open for %ds, %s mode',
+        self.service,
+        self.open_seconds,
+        self.mode
+        )
+    self.updated.notify_all()
+
+  def __get_half_open_in(self) -> float:
+    """Returns the seconds until an open circuit half-opens."""
+    return max(0.0, self.opened_at + self.open_seconds - time.time())
+
+
+def init_circuit_breakers(config: dict[str, Any]) -> None:
+  """Sets the settings of the breakers from the circuit_breaker config key.
+
+  Args:
+    config (dict[str, Any]): A dictionary containing configuration parameters.
+  """
+  global _settings
+  with _lock:
+    _settings = dict(config.get('circuit_breaker') or {})
+    _breakers.clear()
+
+
+def get(service: str) -> CircuitBreaker:
+  """Returns the breaker of a service, created on first use.
+
+  Args:
+    service (str): The service, e.g. gemini.
+
+  Returns:
+    CircuitBreaker: The breaker.
+  """
+  with _lock:
+    if service not in _breakers:
+      settings = {
+          **DEFAULT_SETTINGS,
+          **{k: v for k, v in _settings.items() if k != 'services'},
+          **_settings.get('services', {}).get(service, {}),
+      }
+      _breakers[service] = CircuitBreaker(service, settings)
+    return _breakers[service]
+
+
+def guard(service: str) -> contextlib.AbstractContextManager[None]:
+  """Guards a call to a service with its breaker.
+
+  Args:
+    service (str): The service, e.g. gemini.
+
+  Returns:
+    contextlib.AbstractContextManager[None]: The guard of the call.
+  """
+  return get(service).guard()
+
+
+def get_open_circuits() -> dict[str, dict[str, Any]]:
+  """Returns the state of the circuits that are not closed.
+
+  Returns:
+    dict[str, dict[str, Any]]: The state of each open or half-open circuit.
+  """
+  with _lock:
+    breakers = list(_breakers.values())
+  return {
+      breaker.service: state
+      for breaker in breakers
+      if (state := breaker.to_dict())['state'] != CLOSED
+      }
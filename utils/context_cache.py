@@ -0,0 +1,326 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Context caches for shared prompt prefixes.
+
+A prefix is cached once, and the requests that share it only send their
+suffix. VertexContextCache uses Vertex AI cached content, and
+LocalContextCache simulates it in memory for tests and offline runs.
+Prefixes shorter than the minimum cacheable size are not cached, and their
+requests send the whole prompt. Cached prefixes are re-created before their
+TTL runs out.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from vertexai.preview import caching
+from vertexai.preview.generative_models import GenerativeModel
+
+# Minimum tokens of a Vertex AI cached content
+VERTEX_MIN_CACHED_TOKENS = 32768
+DEFAULT_TTL_SECONDS = 3600
+# Cached prefixes are re-created after this fraction of their TTL, so no
+# request is sent with cached content that is about to expire
+REFRESH_TTL_FRACTION = 0.9
+
+
+class ContextCache:
+  """Caches prompt prefixes and returns models bound to them."""
+
+  def __init__(
+      self,
+      model_name: str,
+      token_counter: Callable[[str], int],
+      min_tokens: int,
+      ttl_seconds: int = DEFAULT_TTL_SECONDS
+      ):
+    """Init method for ContextCache.
+
+    Args:
+      model_name (str): The model the prefixes are cached for.
+      token_counter (Callable[[str], int]): Counts the tokens of a prefix.
+      min_tokens (int): The minimum tokens of a cached prefix.
+      ttl_seconds (int): The seconds each cached prefix is kept.
+    """
+    self.model_name = model_name
+    self.token_counter = token_counter
+    self.min_tokens = min_tokens
+    self.ttl_seconds = ttl_seconds
+    self.lock = threading.Lock()
+    # (model, expiry time) bound to each prefix, None models if the prefix
+    # can't be cached
+    self.models = {}
+    # Set once the prefix being cached by another thread is cached
+    self.creating = {}
+    self.hits = 0
+    self.skipped = 0
+
+  def get_model(self, prefix: str) -> Any | None:
+    """Returns a model that prepends the cached prefix to its prompts.
+
+    The prefix is cached by the first thread that needs it, without holding
+    the lock, while the other threads needing it wait. An expired prefix is
+    cached again, and the old cached content is left to expire on its own,
+    as requests may still be using it.
+
+    Args:
+      prefix (str): The prompt prefix.
+
+    Returns:
+      Any | None: The model, or None if the prefix can't be cached.
+    """
+    while True:
+      with self.lock:
+        if prefix in self.models:
+          model, expires_at = self.models[prefix]
+          if time.time() < expires_at:
+            return self.__count(model)
+
+        creating = self.creating.get(prefix)
+        if creating is None:
+          creating = threading.Event()
+          self.creating[prefix] = creating
+          break
+      creating.wait()
+
+    try:
+      model, expires_at = self.__create(prefix)
+      with self.lock:
+        self.models[prefix] = (model, expires_at)
+        return self.__count(model)
+    finally:
+      with self.lock:
+        del self.creating[prefix]
+      creating.set()
+
+  def clear(self) -> None:
+    """Deletes every cached prefix."""
+    with self.lock:
+      models = self.models
+      self.models = {}
+
+    for model, _ in models.values():
+      if model is not None:
+        self._delete_model(model)
+
+  def __create(self, prefix: str) -> tuple[Any | None, float]:
+    """Caches a prefix if it is long enough.
+
+    Args:
+      prefix (str): The prompt prefix.
+
+    Returns:
+      tuple[Any | None, float]: The model bound to the cached prefix, or None
+      if it can't be cached, and the time it must be cached again.
+    """
+    tokens = self.token_counter(prefix)
+    if tokens < self.min_tokens:
+      logging.info(
+          ' Prompt prefix not cached, %d tokens is below the minimum of %d',
+          tokens,
+          self.min_tokens
+          )
+      return None, float('inf')
+
+    # A prefix that failed to be cached is retried after the same time
+    return (
+        self._create_model(prefix),
+        time.time() + self.ttl_seconds * REFRESH_TTL_FRACTION
+        )
+
+  def __count(self, model: Any | None) -> Any | None:
+    """Counts a request using the cache, or skipping it if model is None.
+
+    Args:
+      model (Any | None): The model returned to the request.
+
+    Returns:
+      Any | None: The model.
+    """
+    if model is None:
+      self.skipped += 1
+    else:
+      self.hits += 1
+    return model
+
+  def _create_model(self, prefix: str) -> Any | None:
+    """Caches a prefix. Sub-classes must implement this method.
+
+    Args:
+      prefix (str): The prompt prefix.
+
+    Returns:
+      Any | None: A model bound to the cached prefix, or None on failure.
+    """
+    raise NotImplementedError
+
+  def _delete_model(self, model: Any) -> None:
+    """Deletes a cached prefix.
+
+    Args:
+      model (Any): The model bound to the cached prefix.
+    """
+
+
+class VertexContextCache(ContextCache):
+  """Caches prompt prefixes as Vertex AI cached content."""
+
+  def _create_model(self, prefix: str) -> Any | None:
+    """Uploads a prefix as cached content.
+
+    Args:
+      prefix (str): The prompt prefix.
+
+    Returns:
+      Any | None: A model bound to the cached content, or None on failure.
+    """
+    try:
+      cached_content = caching.CachedContent.create(
+          model_name=self.model_name,
+          contents=[prefix],
+          ttl=datetime.timedelta(seconds=self.ttl_seconds)
+          )
+    except Exception as e:
+      logging.error(' Error caching prompt prefix: %s', str(e))
+      return None
+
+    logging.info(' Prompt prefix cached as %s', cached_content.resource_name)
+    return GenerativeModel.from_cached_content(cached_content=cached_content)
+
+  def _delete_model(self, model: Any) -> None:
+    """Deletes the cached content of a model.
+
+    Args:
+      model (Any): The model bound to the cached content.
+    """
+    try:
+      model._cached_content.delete()  # pylint: disable=protected-access
+    except Exception as e:
+      logging.error(' Error deleting cached prompt prefix: %s', str(e))
+
+
+class LocalCachedModel:
+  """Stand-in of a model bound to cached content."""
+
+  def __init__(self, model: Any, prefix: str, cached_tokens: int):
+    """Init method for LocalCachedModel.
+
+    Args:
+      model (Any): The model that serves the requests.
+      prefix (str): The cached prefix.
+      cached_tokens (int): The tokens of the prefix.
+    """
+    self.model = model
+    self.prefix = prefix
+    self.cached_tokens = cached_tokens
+    self.requests = 0
+
+  def generate_content(self, contents: str, **kwargs: Any) -> Any:
+    """Sends the prefix and the contents to the underlying model.
+
+    Args:
+      contents (str): The prompt suffix.
+      **kwargs (Any): The generation arguments.
+
+    Returns:
+      Any: The response of the underlying model.
+    """
+    self.requests += 1
+    return self.model.generate_content(self.prefix + contents, **kwargs)
+
+
+class LocalContextCache(ContextCache):
+  """Simulates context caching in memory, for tests and offline runs."""
+
+  def __init__(
+      self,
+      model: Any,
+      model_name: str,
+      token_counter: Callable[[str], int],
+      min_tokens: int = 0,
+      ttl_seconds: int = DEFAULT_TTL_SECONDS
+      ):
+    """Init method for LocalContextCache.
+
+    Args:
+      model (Any): The model that serves the requests.
+      model_name (str): The model the prefixes are cached for.
+      token_counter (Callable[[str], int]): Counts the tokens of a prefix.
+      min_tokens (int): The minimum tokens of a cached prefix.
+      ttl_seconds (int): The seconds each prefix is kept.
+    """
+    super().__init__(model_name, token_counter, min_tokens, ttl_seconds)
+    self.model = model
+
+  def _create_model(self, prefix: str) -> LocalCachedModel:
+    """Keeps a prefix in memory.
+
+    Args:
+      prefix (str): The prompt prefix.
+
+    Returns:
+      LocalCachedModel: A model that prepends the prefix to its prompts.
+    """
+    return LocalCachedModel(self.model, prefix, self.token_counter(prefix))
+
+
+def create_context_cache(
+    config: dict[str, Any],
+    model: Any,
+    model_name: str,
+    token_counter: Callable[[str], int]
+    ) -> ContextCache | None:
+  """Creates the context cache set in the context_cache config key.
+
+  Args:
+    config (dict[str, Any]): A dictionary containing configuration parameters.
+    model (Any): The model that serves the requests.
+    model_name (str): The model name.
+    token_counter (Callable[[str], int]): Counts the tokens of a prefix.
+
+  Returns:
+    ContextCache | None: The cache, None if context caching is disabled.
+
+  Raises:
+    ValueError: If the context_cache config key is not supported.
+  """
+  cache_type = config.get('context_cache')
+  ttl_seconds = config.get('context_cache_ttl_seconds', DEFAULT_TTL_SECONDS)
+
+  if not cache_type:
+    return None
+  elif cache_type == 'vertex':
+    return VertexContextCache(
+        model_name,
+        token_counter,
+        config.get('context_cache_min_tokens', VERTEX_MIN_CACHED_TOKENS),
+        ttl_seconds
+        )
+  elif cache_type == 'local':
+    return LocalContextCache(
+        model,
+        model_name,
+        token_counter,
+        config.get('context_cache_min_tokens', 0),
+        ttl_seconds
+        )
+
+  raise ValueError(
+      f'Unsupported context_cache: {cache_type}. '
+      'Supported values are vertex and local.'
+      )
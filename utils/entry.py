@@ -15,8 +15,21 @@
 """Entry class.
 """
 
+import json
 import uuid
 
+# Source config keys identifying where the entries are read from. Other keys,
+# like limit, starting_row or priority_column, only select or order the
+# entries read, so they do not change their ids
+ID_NAMESPACE_KEYS = (
+    'spreadsheet_id',
+    'sheet_name',
+    'project_id',
+    'dataset',
+    'table',
+    'query',
+)
+
 
 class Entry:
   """Entry class. Combination of term and associative_term with copies.
@@ -29,6 +42,8 @@ class Entry:
   term_description: str
   associative_term: str
   associative_term_description: str
+  priority: float
+  associative_term_rank: int | None
   association_reason: str
   relationship: bool
   headlines: list[str]
@@ -45,8 +60,30 @@ class Entry:
       associative_term_description: str = None,
       sku: str = None,
       url: str = None,
-      image_url: str = None
+      image_url: str = None,
+      id_namespace: uuid.UUID = None,
+      priority: float = 0.0,
+      associative_term_rank: int | None = None
       ):
+    """Init method for Entry.
+
+    Args:
+      term (str): The term.
+      term_description (str): The description of the term.
+      associative_term (str): The associative term.
+      associative_term_description (str): The description of the
+      associative term.
+      sku (str): The SKU of the term.
+      url (str): The URL of the term.
+      image_url (str): The image URL of the term.
+      id_namespace (uuid.UUID): The namespace of the entry id, see
+      get_id_namespace. Entries with the same term, associative term and SKU
+      get the same id within a namespace.
+      priority (float): The business value of the term. Entries with a
+      higher priority are populated first.
+      associative_term_rank (int | None): The Google Trends rank of the
+      associative term, breaking ties between priorities.
+    """
     self.term = term
     self.term_description = term_description
     self.associative_term = associative_term
@@ -54,8 +91,13 @@ class Entry:
     self.sku = sku
     self.url = url
     self.image_url = image_url
+    self.priority = priority
+    self.associative_term_rank = associative_term_rank
 
-    self.id = uuid.uuid4()
+    self.id = str(uuid.uuid5(
+        id_namespace or uuid.NAMESPACE_OID,
+        json.dumps([term, associative_term, sku])
+        ))
     self.association_reason = None
     self.relationship = False
     self.headlines = None
@@ -77,6 +119,36 @@ class Entry:
         return self.id == other.id
     return False
 
+  @staticmethod
+  def get_id_namespace(source_config: dict[str, object]) -> uuid.UUID:
+    """Returns the namespace of the ids of the entries of a source config.
+
+    Only the source types, the ID_NAMESPACE_KEYS of their configs and any
+    other top-level value, like the country, are part of the namespace, so
+    reading more or fewer rows of the same source keeps the ids.
+
+    Args:
+      source_config (dict[str, object]): The parameters the entries are read
+      from, like the term sources and their configs.
+
+    Returns:
+      uuid.UUID: A namespace that only changes with the sources read.
+    """
+    identifying_config = {
+        key: (
+            {
+                name: config_value
+                for name, config_value in value.items()
+                if name in ID_NAMESPACE_KEYS
+            }
+            if isinstance(value, dict) else value
+            )
+        for key, value in source_config.items()
+    }
+    return uuid.uuid5(
+        uuid.NAMESPACE_OID,
+        json.dumps(identifying_config, sort_keys=True, default=str)
+        )
 
   def must_generate_content(self, must_find_relationship: bool):
     """True if content must be generated for this entry, otherwise false.
@@ -37,3 +37,12 @@ class Destination(Enum):
   SA360_FEED = 3
   DV360_FEED = 4
   ACS_FEED = 5
+  CSV_FILE = 6
+  JSONL_FILE = 7
+  PARQUET_FILE = 8
+
+
+class FeedLayout(Enum):
+  SA360_FEED = 1
+  DV360_FEED = 2
+  ACS_FEED = 3
@@ -16,14 +16,36 @@
 """
 
 import ast
+import collections
 import logging
 import re
 import time
+import types
+from typing import Any, Callable
 import vertexai
 import dirtyjson
-from prompts.prompts import prompts
+from prompts.prompt_registry import PromptRegistry
+from utils import cassette
+from utils import circuit_breaker
+from utils import metrics
+from utils import retry_policy
+from utils import tracing
+from utils.batch_prediction import create_batch_runner
+from utils.batch_prediction import parse_prediction
+from utils.context_cache import create_context_cache
+from utils.hedging import HedgingPolicy
+from utils.region_pool import create_region_pool
+from utils.task_progress import TaskProgress
+from utils.text_list_stream import TextListStream
+from utils.token_usage import TokenUsage
 from vertexai.generative_models import GenerativeModel, SafetySetting
 
+try:
+  # Local tokenizer, installed with google-cloud-aiplatform[tokenization]
+  from vertexai.preview import tokenization
+except ImportError:
+  tokenization = None
+
 # Logger config
 logging.basicConfig()
 logging.root.setLevel(logging.INFO)
@@ -53,157 +75,772 @@ SAFETY_SETTINGS = [
     ),
 ]
 
+SUPPORTED_MODELS = [
+    'gemini-1.5-flash',
+    'gemini-1.5-flash-8b',
+    'gemini-1.5-pro',
+    'gemini-2.0-flash',
+]
+DEFAULT_MODEL = 'gemini-1.5-flash'
+# Route of each kind of request in the gemini_model_routes config. Kinds
+# without a route use the gemini_model config
+MODEL_ROUTES = {
+    'association': 'association',
+    'headlines': 'copies',
+    'descriptions': 'copies',
+    'paths': 'copies',
+    'size_enforcement': 'size_enforcement',
+    'keywords': 'keywords',
+    'feature_extraction': 'features',
+}
+
 TIME_INTERVAL_BETWEEN_REQUESTS = 0
+# Seconds a model is skipped after a quota error, unless the server says
 TIME_INTERVAL_IF_QUOTA_ERROR = 60
-TIME_INTERVAL_IF_GEMINI_ERROR = 10
+
+# Used to estimate token counts if the local tokenizer is not available
+CHARS_PER_TOKEN = 4
+# Batch predictions cost half the price of online requests
+BATCH_PRICE_FACTOR = 0.5
+USAGE_FIELDS = (
+    'prompt_token_count',
+    'candidates_token_count',
+    'cached_content_token_count',
+)
+# Internal attributes of the SDK's models used to call them with a timeout
+SDK_TIMEOUT_ATTRIBUTES = (
+    '_prepare_request',
+    '_prediction_client',
+    '_parse_response',
+)
+
+
+def _to_recorded_response(response: Any) -> dict[str, Any]:
+  """Returns the text and token counts of a response, to record them."""
+  usage_metadata = getattr(response, 'usage_metadata', None)
+  return {
+      'text': response.text,
+      'usage': {
+          field: getattr(usage_metadata, field, 0) for field in USAGE_FIELDS
+      } if usage_metadata is not None else None,
+  }
+
+
+def _from_recorded_response(record: dict[str, Any]) -> types.SimpleNamespace:
+  """Returns a response with the text and token counts of a record."""
+  return types.SimpleNamespace(
+      text=record['text'],
+      usage_metadata=types.SimpleNamespace(**record['usage'])
+      if record['usage'] is not None else None
+      )
+
+
+def _generate_content(
+    model: GenerativeModel,
+    contents: str,
+    timeout: float | None = None,
+    stream: bool = False
+    ) -> Any:
+  """Calls a model, within a timeout if set.
+
+  The SDK's generate_content doesn't take a timeout, so with a timeout the
+  request it prepares is sent with its prediction client, as it does. These
+  SDK internals (SDK_TIMEOUT_ATTRIBUTES) are those of the
+  google-cloud-aiplatform version pinned in requirements.txt, and tested in
+  tests/test_gemini_helper.py. Models without them, like a newer SDK's or
+  the local context cache's, are called without a timeout.
+
+  Args:
+    model (GenerativeModel): The model.
+    contents (str): The prompt.
+    timeout (float | None): The seconds before the call is cancelled with a
+    DeadlineExceeded error. No timeout if None.
+    stream (bool): Whether to stream the response.
+
+  Returns:
+    Any: The response, or an iterator of its chunks if streamed.
+  """
+  if timeout is None or not all(
+      hasattr(model, attribute) for attribute in SDK_TIMEOUT_ATTRIBUTES
+      ):
+    return model.generate_content(
+        contents,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS,
+        stream=stream
+        )
+
+  request = model._prepare_request(  # pylint: disable=protected-access
+      contents=contents,
+      generation_config=GENERATION_CONFIG,
+      safety_settings=SAFETY_SETTINGS
+      )
+  client = model._prediction_client  # pylint: disable=protected-access
+  if not stream:
+    return model._parse_response(  # pylint: disable=protected-access
+        client.generate_content(request=request, timeout=timeout)
+        )
+  return (
+      model._parse_response(chunk)  # pylint: disable=protected-access
+      for chunk in client.stream_generate_content(
+          request=request,
+          timeout=timeout
+          )
+      )
 
 
 class GeminiHelper:
   """Gemini helper to perform Gemini API requests.
   """
 
+  progress: TaskProgress
+  usage: TokenUsage
+
   def __init__(self, config: dict[str, str]) -> None:
     self.config = config
+    self.progress = TaskProgress()
+    self.usage = TokenUsage(config.get('model_prices'))
+    # Number of calls and total seconds of each kind, across tasks
+    self.call_latency = {}
+    self.tokenizer = None
+
+    supported_models = self.__get_supported_models(
+        [config['gemini_model']] if config.get('gemini_model') else []
+        )
+    model_name = supported_models[0] if supported_models else DEFAULT_MODEL
 
-    if 'gemini_model' in config and config["gemini_model"]:
-      model_name = config['gemini_model']
-      models = ['gemini-1.5-flash', 'gemini-1.5-flash-8b', 'gemini-1.5-pro', 'gemini-2.0-flash']
-      if model_name not in models:
-        model_name = 'gemini-1.5-flash'
-    else:
-      model_name = 'gemini-1.5-flash'
-
-    vertexai.init(project=config['project_id'], location='us-central1')
+    self.region_pool = create_region_pool(config)
+    vertexai.init(
+        project=config['project_id'],
+        location=self.region_pool.default_region
+        )
+    self.model_name = model_name
     self.model = GenerativeModel(model_name)
+    self.models = {(model_name, self.region_pool.default_region): self.model}
+    self.model_ladders = self.__get_model_ladders(config)
+    self.prompt_registry = PromptRegistry(config['language'], self.count_tokens)
+    self.context_cache = create_context_cache(
+        config,
+        self.model,
+        model_name,
+        self.count_tokens
+        )
+    self.retry_policy = retry_policy.RetryPolicy(
+        RETRIES,
+        config.get('gemini_deadline_seconds')
+        )
+    self.hedging = (
+        HedgingPolicy(config['gemini_hedging'])
+        if config.get('gemini_hedging') else None
+        )
+    self.batch_runner = None
+    # Batch prediction responses of each prompt, used before calling the API
+    self.batch_responses = collections.defaultdict(list)
 
-  def generate_dict(self, prompt: str) -> dict:
+  def generate_dict(self, prompt: str, kind: str = 'dict') -> dict:
     """Makes a request to Gemini and returns a dict.
 
     Args:
       prompt (str): The prompt to ask Gemini to generate content
+      kind (str): The kind of request, used in the task progress.
 
     Returns:
       dict: Response dict.
     """
-    retries = RETRIES
-    while retries > 0:
-      try:
-        response = self.model.generate_content(
-            prompt,
-            generation_config=GENERATION_CONFIG,
-            safety_settings=SAFETY_SETTINGS
-            )
-        response_json = re.search('({.*?})', response.text, re.DOTALL).group(1)
-        response_json = dirtyjson.loads(response_json)
-        response_json = dict(response_json)
-        time.sleep(TIME_INTERVAL_BETWEEN_REQUESTS)
-
-        return response_json
-      except Exception as e:
-        if 'Quota exceeded' in str(e) or 'quota' in str(e).lower():
-          logging.error(
-              'Quota exceeded, sleeping %ds. Retries left: %d...',
-              TIME_INTERVAL_IF_QUOTA_ERROR,
-              retries
-              )
-          time.sleep(TIME_INTERVAL_IF_QUOTA_ERROR)
-        elif ('candidate' in str(e) or 'response was blocked' in str(e)
-              or 'quick accessor' in str(e)):
-          logging.error(
-              'Gemini error, sleeping %ds. Retries left: %d...',
-              TIME_INTERVAL_IF_GEMINI_ERROR,
-              retries
-              )
-          time.sleep(TIME_INTERVAL_IF_GEMINI_ERROR)
-        else:
-          logging.error(' %s. Retries left: %d...', str(e), retries)
-      retries = retries - 1
-    return {'status': 'Error'}
+    return self.__generate(
+        prompt,
+        kind,
+        self.__parse_dict,
+        {'status': 'Error'}
+        )
 
-  def generate_text_list(self, prompt: str) -> list[str]:
+  def generate_text_list(
+      self,
+      prompt: str,
+      kind: str = 'text_list',
+      cached_prefix: str | None = None
+      ) -> list[str]:
     """Makes a request to Gemini and returns a list of strings.
 
     Args:
       prompt (str): the prompt to ask Gemini to generate content
+      kind (str): The kind of request, used in the task progress.
+      cached_prefix (str | None): A prefix of the prompt shared across the
+      task, served from the context cache if enabled.
 
     Returns:
       list[str]: a list of strings with the generated texts
     """
-    retries = RETRIES
-    while retries > 0:
-      try:
-        response = self.model.generate_content(
-            prompt,
-            generation_config=GENERATION_CONFIG,
-            safety_settings=SAFETY_SETTINGS
-            )
-        start_idx = response.text.index('[')
-        end_idx = response.text.index(']')
-        time.sleep(TIME_INTERVAL_BETWEEN_REQUESTS)
+    return self.__generate(
+        prompt,
+        kind,
+        self.__parse_text_list,
+        ['Generation failed'],
+        cached_prefix
+        )
 
-        return ast.literal_eval(response.text[start_idx:end_idx+1])
-      except Exception as e:
-        if 'Quota exceeded' in str(e) or 'quota' in str(e).lower():
-          logging.error(
-              'Quota exceeded, sleeping %ds. Retries left: %d...',
-              TIME_INTERVAL_IF_QUOTA_ERROR,
-              retries
-              )
-          time.sleep(TIME_INTERVAL_IF_QUOTA_ERROR)
-        elif ('candidate' in str(e) or 'response was blocked' in str(e)
-              or 'quick accessor' in str(e)):
-          logging.error(
-              'Gemini error, sleeping %ds. Retries left: %d...',
-              TIME_INTERVAL_IF_GEMINI_ERROR,
-              retries
-              )
-          time.sleep(TIME_INTERVAL_IF_GEMINI_ERROR)
-        else:
-          logging.error(' %s. Retries left: %d...', str(e), retries)
-      retries = retries - 1
-    return ['Generation failed']
+  def stream_text_list(
+      self,
+      prompt: str,
+      kind: str,
+      on_item: Callable[[str], bool],
+      cached_prefix: str | None = None
+      ) -> list[str]:
+    """Makes a streaming request to Gemini and hands over the list items.
+
+    Items of a retried request can be handed over again.
+
+    Args:
+      prompt (str): the prompt to ask Gemini to generate content
+      kind (str): The kind of request, used in the task progress.
+      on_item (Callable[[str], bool]): Called with each item of the list,
+      returns True once it has enough items to cancel the rest of the stream.
+      cached_prefix (str | None): A prefix of the prompt shared across the
+      task, served from the context cache if enabled.
+
+    Returns:
+      list[str]: The items of the last attempt, empty if all retries fail.
+    """
+    stream = TextListStream(on_item)
+    return self.__generate(
+        prompt,
+        kind,
+        stream.parse,
+        [],
+        cached_prefix,
+        stream
+        )
 
-  def run_prompt(self, prompt: str) -> str:
+  def run_prompt(self, prompt: str, kind: str = 'text') -> str:
     """Makes a request to Gemini and returns a the response.
 
     Args:
       prompt (str): the prompt to ask Gemini to generate content
+      kind (str): The kind of request, used in the task progress.
 
     Returns:
       response (str): response
     """
-    retries = RETRIES
-    while retries > 0:
+    return self.__generate(prompt, kind, lambda text: text, None)
+
+  def __generate(
+      self,
+      prompt: str,
+      kind: str,
+      parse: Callable[[str], Any],
+      default: Any,
+      cached_prefix: str | None = None,
+      stream: TextListStream | None = None
+      ) -> Any:
+    """Makes a request to Gemini, retrying on errors, and parses the response.
+
+    Args:
+      prompt (str): the prompt to ask Gemini to generate content
+      kind (str): The kind of request, used in the task progress.
+      parse (Callable[[str], Any]): Parses the response text, raising an
+      exception if the response is not valid.
+      default (Any): The value to return if all retries fail.
+      cached_prefix (str | None): A prefix of the prompt shared across the
+      task. If the context cache has it, only the prompt is sent, otherwise
+      both are.
+      stream (TextListStream | None): Parses the response as it is streamed,
+      if set.
+
+    Returns:
+      Any: The parsed response, or the default value.
+    """
+    batch_response = self.__pop_batch_response((cached_prefix or '') + prompt)
+    if batch_response is not None:
       try:
-        response = self.model.generate_content(
-            prompt,
-            generation_config=GENERATION_CONFIG,
-            safety_settings=SAFETY_SETTINGS
+        return parse(batch_response)
+      except Exception as e:
+        logging.error(
+            ' Invalid batch response of kind %s, calling Gemini: %s',
+            kind,
+            str(e)
             )
-        time.sleep(TIME_INTERVAL_BETWEEN_REQUESTS)
 
-        return response.text
-      except Exception as e:
-        if 'Quota exceeded' in str(e) or 'quota' in str(e).lower():
-          logging.error(
-              'Quota exceeded, sleeping %ds. Retries left: %d...',
-              TIME_INTERVAL_IF_QUOTA_ERROR,
-              retries
-              )
-          time.sleep(TIME_INTERVAL_IF_QUOTA_ERROR)
-        elif ('candidate' in str(e) or 'response was blocked' in str(e)
-              or 'quick accessor' in str(e)):
+    cached_model = None
+    if cached_prefix and self.context_cache is not None:
+      cached_model = self.context_cache.get_model(cached_prefix)
+    full_prompt = (cached_prefix or '') + prompt
+    ladder = self.model_ladders.get(
+        MODEL_ROUTES.get(kind),
+        self.model_ladders[None]
+        )
+
+    with tracing.span(
+        'gemini.generate',
+        kind=kind,
+        prompt_chars=len(full_prompt),
+        cached_prefix_chars=len(cached_prefix) if cached_model else None
+        ) as current_span:
+      retry = self.retry_policy.start()
+      fallbacks = 0
+      while True:
+        model_name = self.__select_model(ladder) or ladder[0]
+        region = None
+        try:
+          with (circuit_breaker.guard('gemini'),
+                metrics.track('gemini', kind),
+                self.region_pool.use(model_name) as region):
+            # The context cache is bound to the default model and region
+            if (cached_model is not None
+                and model_name == self.model_name
+                and region == self.region_pool.default_region):
+              model, contents = cached_model, prompt
+            else:
+              model = self.__get_model(model_name, region)
+              contents = full_prompt
+
+            # The deadline of the call bounds the timeout of each attempt
+            timeout = retry.remaining_seconds()
+            start = time.time()
+            metrics.count_bytes('gemini', 'sent', contents)
+            response = cassette.call(
+                'gemini',
+                [kind, full_prompt],
+                lambda: self.__call_model(
+                    kind,
+                    model,
+                    model_name,
+                    contents,
+                    timeout,
+                    stream
+                    ),
+                _to_recorded_response,
+                _from_recorded_response
+                )
+            self.__record_latency(kind, time.time() - start)
+            self.usage.record(
+                kind,
+                model_name,
+                getattr(response, 'usage_metadata', None)
+                )
+            metrics.count_bytes('gemini', 'received', response.text)
+            result = parse(response.text)
+          current_span.set_attributes({
+              'attempts': retry.attempts + 1,
+              'response_chars': len(response.text),
+              'model': model_name,
+              'region': region,
+              'fallbacks': fallbacks,
+              })
+          time.sleep(TIME_INTERVAL_BETWEEN_REQUESTS)
+
+          return result
+        except circuit_breaker.CircuitOpenError:
+          raise
+        except Exception as e:
+          error_class = retry_policy.classify_error(e)
+          if error_class == retry_policy.QUOTA and region is not None:
+            self.region_pool.mark_quota_exhausted(
+                model_name,
+                region,
+                retry_policy.get_retry_after(e) or TIME_INTERVAL_IF_QUOTA_ERROR
+                )
+            next_model_name = self.__select_model(ladder)
+            if next_model_name is not None:
+              # Move to another region or down the ladder without waiting or
+              # using a retry
+              logging.warning(
+                  ' Quota exceeded for %s in %s, falling back to %s',
+                  model_name,
+                  region,
+                  'another region' if next_model_name == model_name
+                  else next_model_name
+                  )
+              fallbacks += 1
+              continue
+
+          delay = retry.next_delay(e)
+          if delay is None:
+            logging.error(
+                ' Gemini %s error, not retrying: %s',
+                error_class,
+                str(e)
+                )
+            break
+
           logging.error(
-              'Gemini error, sleeping %ds. Retries left: %d...',
-              TIME_INTERVAL_IF_GEMINI_ERROR,
-              retries
+              ' Gemini %s error, retrying in %.1fs. Attempts left: %d: %s',
+              error_class,
+              delay,
+              self.retry_policy.max_attempts - retry.attempts,
+              str(e)
               )
-          time.sleep(TIME_INTERVAL_IF_GEMINI_ERROR)
-        else:
-          logging.error(' %s. Retries left: %d...', str(e), retries)
-      retries = retries - 1
+          if error_class == retry_policy.QUOTA:
+            self.progress.quota_sleep(delay)
+          self.progress.gemini_retry(kind)
+          time.sleep(delay)
+      current_span.set_attributes({'attempts': retry.attempts, 'failed': True})
+      return default
+
+  def get_model_name(self, kind: str) -> str:
+    """Returns the first model of the ladder of a kind of request.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+
+    Returns:
+      str: The model name.
+    """
+    return self.model_ladders.get(
+        MODEL_ROUTES.get(kind),
+        self.model_ladders[None]
+        )[0]
+
+  def __get_model_ladders(
+      self,
+      config: dict[str, Any]
+      ) -> dict[str | None, list[str]]:
+    """Returns the models of each route, in fallback order.
+
+    Each route of the gemini_model_routes config is a model or a list of
+    models, and is followed by the gemini_fallback_models config. Routes
+    without models use the gemini_model config, also used by the None route
+    of the kinds without a route.
+
+    Args:
+      config (dict[str, Any]): A dictionary containing configuration parameters.
+
+    Returns:
+      dict[str | None, list[str]]: The model ladder of each route.
+    """
+    routes = config.get('gemini_model_routes') or {}
+    for route in routes:
+      if route not in MODEL_ROUTES.values():
+        logging.warning(
+            ' Unsupported Gemini model route %s. Supported: %s',
+            route,
+            ', '.join(sorted(set(MODEL_ROUTES.values())))
+            )
+
+    fallback_models = self.__get_supported_models(
+        config.get('gemini_fallback_models') or []
+        )
+    ladders = {}
+    for route in [None, *MODEL_ROUTES.values()]:
+      models = routes.get(route) or []
+      if isinstance(models, str):
+        models = [models]
+      models = self.__get_supported_models(models) or [self.model_name]
+      ladders[route] = list(dict.fromkeys(models + fallback_models))
+    return ladders
+
+  def __get_supported_models(self, model_names: list[str]) -> list[str]:
+    """Returns the supported models of a list, logging the others.
+
+    Args:
+      model_names (list[str]): The model names.
+
+    Returns:
+      list[str]: The supported model names.
+    """
+    supported = []
+    for model_name in model_names:
+      if model_name in SUPPORTED_MODELS:
+        supported.append(model_name)
+      else:
+        logging.warning(
+            ' Unsupported Gemini model %s ignored. Supported: %s',
+            model_name,
+            ', '.join(SUPPORTED_MODELS)
+            )
+    return supported
+
+  def __get_model(self, model_name: str, region: str) -> GenerativeModel:
+    """Returns the model of a name in a region, created on first use.
+
+    Args:
+      model_name (str): The model name.
+      region (str): The region of the model endpoint.
+
+    Returns:
+      GenerativeModel: The model.
+    """
+    if (model_name, region) not in self.models:
+      # The full resource name binds the model to the region
+      self.models[(model_name, region)] = GenerativeModel(
+          f'projects/{self.config["project_id"]}/locations/{region}'
+          f'/publishers/google/models/{model_name}'
+          )
+    return self.models[(model_name, region)]
+
+  def __select_model(self, ladder: list[str]) -> str | None:
+    """Returns the first model of a ladder with quota left in a region.
+
+    Args:
+      ladder (list[str]): The models, in fallback order.
+
+    Returns:
+      str | None: The model name, None if every quota is exhausted.
+    """
+    for model_name in ladder:
+      if self.region_pool.is_available(model_name):
+        return model_name
     return None
 
+  def __parse_dict(self, text: str) -> dict:
+    """Parses the first JSON object of a response.
+
+    Args:
+      text (str): The response text.
+
+    Returns:
+      dict: The parsed object.
+    """
+    response_json = re.search('({.*?})', text, re.DOTALL).group(1)
+    return dict(dirtyjson.loads(response_json))
+
+  def __parse_text_list(self, text: str) -> list[str]:
+    """Parses the first list literal of a response.
+
+    Args:
+      text (str): The response text.
+
+    Returns:
+      list[str]: The parsed list.
+    """
+    start_idx = text.index('[')
+    end_idx = text.index(']')
+    return ast.literal_eval(text[start_idx:end_idx+1])
+
+  def run_batch(self, prompts: list[tuple[str, str]]) -> None:
+    """Generates the responses of prompts in one batch prediction job.
+
+    The responses are kept and returned by the next requests with the same
+    prompts, so they are parsed and post-processed as online responses.
+    Failed predictions are requested online.
+
+    Args:
+      prompts (list[tuple[str, str]]): The prompt and kind of each request.
+      Repeated prompts get one response each.
+    """
+    if not prompts:
+      return
+
+    if self.batch_runner is None:
+      self.batch_runner = create_batch_runner(
+          self.config,
+          self.model,
+          self.model_name,
+          GENERATION_CONFIG,
+          [safety_setting.to_dict() for safety_setting in SAFETY_SETTINGS]
+          )
+
+    kinds = dict(prompts)
+    with tracing.span(
+        'gemini.batch_prediction',
+        requests=len(prompts)
+        ) as current_span:
+      start = time.time()
+      with metrics.track('gemini', 'batch_prediction'):
+        metrics.count_bytes('gemini', 'sent', sum(
+            len(prompt.encode('utf-8')) for prompt, _ in prompts
+            ))
+        batch_prompts = [prompt for prompt, _ in prompts]
+        records = cassette.call(
+            'gemini_batch',
+            batch_prompts,
+            lambda: self.batch_runner.run(batch_prompts)
+            )
+
+      failed = 0
+      for record in records:
+        prompt, text, usage_metadata = parse_prediction(record)
+        if text is None:
+          failed += 1
+          continue
+        kind = kinds.get(prompt, 'batch')
+        self.usage.record(
+            kind,
+            self.model_name,
+            usage_metadata,
+            BATCH_PRICE_FACTOR
+            )
+        metrics.count_bytes('gemini', 'received', text)
+        self.batch_responses[prompt].append(text)
+      current_span.set_attributes({'responses': len(records), 'failed': failed})
+
+    logging.info(
+        ' Batch prediction of %d requests done in %ds, %d failed',
+        len(prompts),
+        time.time() - start,
+        failed
+        )
+
+  def clear_batch_responses(self) -> None:
+    """Drops the batch prediction responses not used during a task."""
+    self.batch_responses.clear()
+
+  def __pop_batch_response(self, prompt: str) -> str | None:
+    """Returns and removes a batch prediction response of a prompt.
+
+    Args:
+      prompt (str): The prompt.
+
+    Returns:
+      str | None: The response text, None if there is none left.
+    """
+    responses = self.batch_responses.get(prompt)
+    if not responses:
+      return None
+    return responses.pop(0)
+
+  def clear_context_cache(self) -> None:
+    """Deletes the prefixes cached during a task."""
+    if self.context_cache is not None:
+      self.context_cache.clear()
+
+  def count_tokens(self, prompt: str) -> int:
+    """Counts the tokens of a prompt without calling the API.
+
+    Uses the local tokenizer of the model if available, otherwise estimates
+    CHARS_PER_TOKEN characters per token.
+
+    Args:
+      prompt (str): The prompt.
+
+    Returns:
+      int: The number of tokens.
+    """
+    if self.tokenizer is None and tokenization is not None:
+      try:
+        self.tokenizer = tokenization.get_tokenizer_for_model(self.model_name)
+      except Exception as e:
+        logging.warning(' Local tokenizer not available: %s', str(e))
+        self.tokenizer = False
+
+    if self.tokenizer:
+      return self.tokenizer.count_tokens(prompt).total_tokens
+    return -(-len(prompt) // CHARS_PER_TOKEN)
+
+  def get_token_counter(self) -> str:
+    """Returns the method count_tokens uses.
+
+    Returns:
+      str: tokenizer or chars_per_token.
+    """
+    return 'tokenizer' if self.tokenizer else 'chars_per_token'
+
+  def get_average_latency(self, kind: str) -> float | None:
+    """Returns the average latency of the calls of a kind made so far.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+
+    Returns:
+      float | None: The average seconds per call, None if no call was made.
+    """
+    calls, seconds = self.call_latency.get(kind, (0, 0.0))
+    return seconds / calls if calls else None
+
+  def __call_model(
+      self,
+      kind: str,
+      model: GenerativeModel,
+      model_name: str,
+      contents: str,
+      timeout: float | None = None,
+      stream: TextListStream | None = None
+      ) -> Any:
+    """Calls a model, hedged if gemini_hedging is set.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+      model (GenerativeModel): The model.
+      model_name (str): The model name, used to record the tokens.
+      contents (str): The prompt.
+      timeout (float | None): The seconds before the call is cancelled, None
+      for no timeout.
+      stream (TextListStream | None): Parses the response as it is streamed,
+      if set. Streamed calls are not hedged.
+
+    Returns:
+      Any: The response, or its streamed text and usage metadata.
+    """
+    if stream is not None:
+      return self.__stream_model(kind, model, contents, stream, timeout)
+
+    if self.hedging is None:
+      return _generate_content(model, contents, timeout)
+
+    # The losing call can't be cancelled, but its tokens are still billed
+    return self.hedging.call(
+        kind,
+        lambda attempt_timeout: _generate_content(
+            model,
+            contents,
+            attempt_timeout
+            ),
+        timeout,
+        on_discarded=lambda response: self.usage.record(
+            kind,
+            model_name,
+            getattr(response, 'usage_metadata', None)
+            )
+        )
+
+  def __stream_model(
+      self,
+      kind: str,
+      model: GenerativeModel,
+      contents: str,
+      stream: TextListStream,
+      timeout: float | None = None
+      ) -> types.SimpleNamespace:
+    """Streams a response, cancelling it once the parser has enough items.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+      model (GenerativeModel): The model.
+      contents (str): The prompt.
+      stream (TextListStream): Parses the response chunks.
+      timeout (float | None): The seconds before the whole stream is
+      cancelled, None for no timeout.
+
+    Returns:
+      types.SimpleNamespace: The text and usage metadata of the chunks
+      received.
+    """
+    stream.start()
+    chunks = _generate_content(model, contents, timeout, stream=True)
+    text = ''
+    usage_metadata = None
+    try:
+      for chunk in chunks:
+        text += chunk.text
+        # Each chunk has the token counts of the response so far
+        usage_metadata = (
+            getattr(chunk, 'usage_metadata', None) or usage_metadata
+            )
+        if stream.feed(chunk.text):
+          logging.info(
+              ' Cancelled %s stream after %d items',
+              kind,
+              len(stream.items)
+              )
+          break
+    finally:
+      # Closing the response iterator cancels the request
+      if hasattr(chunks, 'close'):
+        chunks.close()
+    return types.SimpleNamespace(text=text, usage_metadata=usage_metadata)
+
+  def __record_latency(self, kind: str, seconds: float) -> None:
+    """Records the latency of a call in the task progress and the averages.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+      seconds (float): The latency of the call.
+    """
+    self.progress.gemini_call(kind, seconds)
+    calls, total_seconds = self.call_latency.get(kind, (0, 0.0))
+    self.call_latency[kind] = (calls + 1, total_seconds + seconds)
+    if self.hedging is not None:
+      self.hedging.record_latency(kind, seconds)
+
   def enforce_text_size(self, copy: str, t: str, retries: int = RETRIES) -> str:
     """Enforces size limits on generated content of a specified type.
 
@@ -236,7 +873,13 @@ class GeminiHelper:
     else:
       prompt = self.__get_enforce_size_prompt(copy, t)
 
-      result = self.run_prompt(prompt)
+      with tracing.span(
+          'enforce_text_size',
+          copy_type=t,
+          copy_chars=len(copy) if copy else 0,
+          retries_left=retries
+          ):
+        result = self.run_prompt(prompt, 'size_enforcement')
 
       result = result.strip() if result is not None else None
 
@@ -269,12 +912,8 @@ class GeminiHelper:
       raise ValueError(message)
 
     if t == 'paths':
-      return prompts[self.config['language']]['PATH_SIZE_ENFORCEMENT'].format(
-          max_length=max_length,
-          copy=copy,
-          )
+      template = self.prompt_registry.get('PATH_SIZE_ENFORCEMENT')
+    else:
+      template = self.prompt_registry.get('SIZE_ENFORCEMENT')
 
-    return prompts[self.config['language']]['SIZE_ENFORCEMENT'].format(
-        max_length=max_length,
-        copy=copy,
-        )
+    return template.render({'max_length': max_length, 'copy': copy})
@@ -0,0 +1,192 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hedged requests.
+
+If a call hasn't returned after a percentile of the recent latencies of its
+kind, a duplicate is sent and the first successful response wins. Duplicates
+are capped by a budget: each call adds max_extra_fraction of a duplicate, up
+to max_burst, and each duplicate spends one, so they stay within a fraction
+of the calls.
+
+Each attempt runs within a timeout, since the losing attempt can't be
+cancelled and would otherwise keep its worker for as long as it hangs.
+Calls that are not hedged run in the calling thread.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable
+
+from utils import metrics
+
+DEFAULT_SETTINGS = {
+    'percentile': 0.9,
+    'max_extra_fraction': 0.05,
+    # Latencies of a kind needed before its calls are hedged
+    'min_samples': 20,
+    'window_size': 200,
+    'max_burst': 5,
+    # Seconds before an attempt is cancelled, within the timeout of the call
+    'attempt_timeout_seconds': 120,
+}
+HEDGE_WORKERS = 8
+
+
+class HedgingPolicy:
+  """Sends a duplicate of the calls slower than a latency percentile."""
+
+  def __init__(self, settings: dict[str, Any] | None = None):
+    """Init method for HedgingPolicy.
+
+    Args:
+      settings (dict[str, Any] | None): The settings, merged over
+      DEFAULT_SETTINGS.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    self.percentile = settings['percentile']
+    self.max_extra_fraction = settings['max_extra_fraction']
+    self.min_samples = settings['min_samples']
+    self.max_burst = settings['max_burst']
+    self.attempt_timeout_seconds = settings['attempt_timeout_seconds']
+    self.lock = threading.Lock()
+    self.latencies = collections.defaultdict(
+        lambda: collections.deque(maxlen=settings['window_size'])
+        )
+    self.budget = 0.0
+    self.executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=HEDGE_WORKERS,
+        thread_name_prefix='hedge'
+        )
+
+  def record_latency(self, kind: str, seconds: float) -> None:
+    """Adds the latency of a successful call.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+      seconds (float): The latency of the call.
+    """
+    with self.lock:
+      self.latencies[kind].append(seconds)
+
+  def get_hedge_delay(self, kind: str) -> float | None:
+    """Returns the latency percentile after which a call of a kind is hedged.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+
+    Returns:
+      float | None: The seconds, None if there are not enough latencies.
+    """
+    with self.lock:
+      latencies = sorted(self.latencies[kind])
+    if len(latencies) < self.min_samples:
+      return None
+    return latencies[min(
+        len(latencies) - 1,
+        math.ceil(self.percentile * len(latencies)) - 1
+        )]
+
+  def call(
+      self,
+      kind: str,
+      fn: Callable[[float | None], Any],
+      timeout: float | None = None,
+      on_discarded: Callable[[Any], None] | None = None
+      ) -> Any:
+    """Calls a function, hedging it if it's slower than the percentile.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+      fn (Callable[[float | None], Any]): The call, safe to run twice. Called
+      with the timeout of the attempt, after which it must raise.
+      timeout (float | None): The seconds before the whole call times out,
+      None for no timeout.
+      on_discarded (Callable[[Any], None] | None): Called with the result of
+      the call that lost, e.g. to account for its tokens.
+
+    Returns:
+      Any: The result of the first call that succeeds.
+
+    Raises:
+      Exception: The error of the original call, if every call fails.
+    """
+    with self.lock:
+      self.budget = min(self.max_burst, self.budget + self.max_extra_fraction)
+
+    deadline = time.time() + timeout if timeout is not None else None
+    delay = self.get_hedge_delay(kind)
+    if delay is None:
+      return fn(self.__get_attempt_timeout(deadline))
+
+    primary = self.executor.submit(fn, self.__get_attempt_timeout(deadline))
+    done, _ = concurrent.futures.wait([primary], timeout=delay)
+    if done or not self.__spend_budget():
+      return primary.result()
+
+    logging.info(' Hedging %s call after %.1fs', kind, delay)
+    hedge = self.executor.submit(fn, self.__get_attempt_timeout(deadline))
+    pending = {primary, hedge}
+    while pending:
+      done, pending = concurrent.futures.wait(
+          pending,
+          return_when=concurrent.futures.FIRST_COMPLETED
+          )
+      for future in done:
+        if future.exception() is None:
+          metrics.HEDGED_REQUESTS.labels(
+              kind,
+              'won' if future is hedge else 'lost'
+              ).inc()
+          if on_discarded is not None:
+            loser = hedge if future is primary else primary
+            loser.add_done_callback(
+                lambda f: f.exception() is None and on_discarded(f.result())
+                )
+          return future.result()
+
+    metrics.HEDGED_REQUESTS.labels(kind, 'failed').inc()
+    return primary.result()
+
+  def __get_attempt_timeout(self, deadline: float | None) -> float | None:
+    """Returns the timeout of an attempt starting now.
+
+    Args:
+      deadline (float | None): The time the whole call times out, if any.
+
+    Returns:
+      float | None: The seconds, None if there is no timeout.
+    """
+    if deadline is None:
+      return self.attempt_timeout_seconds
+    remaining = max(0.0, deadline - time.time())
+    if self.attempt_timeout_seconds is None:
+      return remaining
+    return min(self.attempt_timeout_seconds, remaining)
+
+  def __spend_budget(self) -> bool:
+    """Spends the budget of a duplicate call, if there is enough.
+
+    Returns:
+      bool: Whether the duplicate can be sent.
+    """
+    with self.lock:
+      if self.budget < 1:
+        return False
+      self.budget -= 1
+      return True
@@ -0,0 +1,119 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prometheus metrics.
+
+Latency, calls, errors and bytes transferred of the external services
+(Gemini, BigQuery, Google Sheets, Google Ads) and the destinations, exposed
+by the /metrics endpoint.
+"""
+
+import contextlib
+import json
+import time
+from typing import Iterator
+
+import prometheus_client
+from utils import retry_policy
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = prometheus_client.Histogram(
+    'topic_mine_request_latency_seconds',
+    'Latency of the requests to external services and destinations.',
+    ['service', 'operation'],
+    buckets=LATENCY_BUCKETS
+)
+REQUESTS = prometheus_client.Counter(
+    'topic_mine_requests',
+    'Requests to external services and destinations.',
+    ['service', 'operation']
+)
+REQUEST_ERRORS = prometheus_client.Counter(
+    'topic_mine_request_errors',
+    'Failed requests by error class: quota, transient, blocked, parse, '
+    'permanent or other.',
+    ['service', 'operation', 'error_class']
+)
+BYTES = prometheus_client.Counter(
+    'topic_mine_bytes',
+    'Bytes sent to, received from or scanned by external services.',
+    ['service', 'direction']
+)
+ROWS_EXPORTED = prometheus_client.Counter(
+    'topic_mine_rows_exported',
+    'Rows written to each destination.',
+    ['destination']
+)
+
+HEDGED_REQUESTS = prometheus_client.Counter(
+    'topic_mine_hedged_requests',
+    'Duplicate Gemini requests by outcome: won, lost or failed.',
+    ['kind', 'outcome']
+)
+
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST
+
+
+@contextlib.contextmanager
+def track(service: str, operation: str) -> Iterator[None]:
+  """Counts a request and its latency, and its error class if it fails.
+
+  Args:
+    service (str): The service, e.g. gemini or sheets.
+    operation (str): The operation, e.g. headlines or write.
+
+  Yields:
+    None
+  """
+  REQUESTS.labels(service, operation).inc()
+  start = time.time()
+  try:
+    yield
+  except Exception as e:
+    REQUEST_ERRORS.labels(
+        service,
+        operation,
+        retry_policy.classify_error(e)
+        ).inc()
+    raise
+  finally:
+    REQUEST_LATENCY.labels(service, operation).observe(time.time() - start)
+
+
+def count_bytes(service: str, direction: str, value: object) -> None:
+  """Counts the bytes of a payload.
+
+  Args:
+    service (str): The service, e.g. gemini or sheets.
+    direction (str): sent, received or scanned.
+    value (object): An int with the number of bytes, a string, or a
+    JSON-serializable payload.
+  """
+  if isinstance(value, int):
+    size = value
+  elif isinstance(value, str):
+    size = len(value.encode('utf-8'))
+  else:
+    size = len(json.dumps(value, default=str).encode('utf-8'))
+  BYTES.labels(service, direction).inc(size)
+
+
+def generate_latest() -> bytes:
+  """Returns the metrics in the Prometheus text format.
+
+  Returns:
+    bytes: The metrics.
+  """
+  return prometheus_client.generate_latest()
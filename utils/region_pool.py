@@ -0,0 +1,247 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pool of the Vertex AI regions that serve Gemini calls.
+
+Gemini quotas are per region, so spreading the calls over several regions
+adds up their quotas. Each call is routed to a region by weighted round
+robin or to the least loaded region, within the requests per minute of each
+region. A region that returns a quota error is skipped for that model until
+its cooldown ends.
+
+Regions are configured with the gemini_regions config key: a list of
+regions, or a dictionary of the weight and rpm of each region.
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+from typing import Any, Iterator
+
+ROUND_ROBIN = 'round_robin'
+LEAST_LOADED = 'least_loaded'
+ROUTING_STRATEGIES = (ROUND_ROBIN, LEAST_LOADED)
+
+DEFAULT_REGION = 'us-central1'
+DEFAULT_WEIGHT = 1
+RATE_LIMIT_WINDOW_SECONDS = 60
+
+
+class RegionPool:
+  """Routes calls across regions, within their rate limits and quotas."""
+
+  def __init__(
+      self,
+      regions: dict[str, dict[str, Any]],
+      routing: str = ROUND_ROBIN
+      ):
+    """Init method for RegionPool.
+
+    Args:
+      regions (dict[str, dict[str, Any]]): The weight and optional rpm (the
+      requests per minute limit) of each region, in order of preference.
+      routing (str): round_robin or least_loaded.
+    """
+    self.regions = list(regions)
+    self.weights = {
+        region: settings.get('weight', DEFAULT_WEIGHT)
+        for region, settings in regions.items()
+    }
+    self.rpm = {
+        region: settings.get('rpm') for region, settings in regions.items()
+    }
+    self.routing = routing
+    self.lock = threading.Lock()
+    self.in_flight = collections.Counter()
+    self.call_times = collections.defaultdict(collections.deque)
+    # Current weights of the smooth weighted round robin
+    self.current_weights = collections.Counter()
+    # Time until which each (model, region) is skipped after a quota error
+    self.quota_exhausted_until = {}
+
+  @property
+  def default_region(self) -> str:
+    """The first region, used by vertexai.init."""
+    return self.regions[0]
+
+  def is_available(self, model_name: str) -> bool:
+    """Returns whether the quota of a model is left in any region.
+
+    Args:
+      model_name (str): The model name.
+
+    Returns:
+      bool: Whether a region is not in quota cooldown for the model.
+    """
+    with self.lock:
+      return bool(self.__get_available_regions(model_name, time.time()))
+
+  def acquire(self, model_name: str) -> str:
+    """Picks the region of a call, waiting for its rate limit if needed.
+
+    If the quota of the model is exhausted in every region, the region whose
+    cooldown ends first is picked.
+
+    Args:
+      model_name (str): The model name.
+
+    Returns:
+      str: The region. Must be released once the call ends.
+    """
+    while True:
+      with self.lock:
+        now = time.time()
+        regions = self.__get_available_regions(model_name, now) or [
+            min(
+                self.regions,
+                key=lambda r: self.quota_exhausted_until[(model_name, r)]
+                )
+            ]
+        waits = {region: self.__get_rate_limit_wait(region, now)
+                 for region in regions}
+        ready = [region for region in regions if waits[region] <= 0]
+        if ready:
+          region = self.__route(ready)
+          self.call_times[region].append(now)
+          self.in_flight[region] += 1
+          return region
+        wait = min(waits.values())
+
+      logging.info(' Region rate limits reached, waiting %.1fs', wait)
+      time.sleep(wait)
+
+  @contextlib.contextmanager
+  def use(self, model_name: str) -> Iterator[str]:
+    """Acquires the region of a call and releases it once the call ends.
+
+    Args:
+      model_name (str): The model name.
+
+    Yields:
+      str: The region.
+    """
+    region = self.acquire(model_name)
+    try:
+      yield region
+    finally:
+      self.release(region)
+
+  def release(self, region: str) -> None:
+    """Marks the call to a region as ended.
+
+    Args:
+      region (str): The region returned by acquire.
+    """
+    with self.lock:
+      self.in_flight[region] -= 1
+
+  def mark_quota_exhausted(
+      self,
+      model_name: str,
+      region: str,
+      seconds: float
+      ) -> None:
+    """Skips a region for a model until a quota cooldown ends.
+
+    Args:
+      model_name (str): The model name.
+      region (str): The region.
+      seconds (float): The cooldown.
+    """
+    with self.lock:
+      self.quota_exhausted_until[(model_name, region)] = time.time() + seconds
+
+  def __get_available_regions(self, model_name: str, now: float) -> list[str]:
+    """Returns the regions not in quota cooldown for a model.
+
+    Must be called with the lock held.
+    """
+    return [
+        region for region in self.regions
+        if self.quota_exhausted_until.get((model_name, region), 0) <= now
+    ]
+
+  def __get_rate_limit_wait(self, region: str, now: float) -> float:
+    """Returns the seconds until a region is under its rpm limit.
+
+    Must be called with the lock held.
+    """
+    call_times = self.call_times[region]
+    while call_times and call_times[0] <= now - RATE_LIMIT_WINDOW_SECONDS:
+      call_times.popleft()
+    rpm = self.rpm[region]
+    if rpm is None or len(call_times) < rpm:
+      return 0.0
+    return call_times[-rpm] + RATE_LIMIT_WINDOW_SECONDS - now
+
+  def __route(self, regions: list[str]) -> str:
+    """Picks one of the regions ready for a call.
+
+    Must be called with the lock held.
+    """
+    if self.routing == LEAST_LOADED:
+      return min(
+          regions,
+          key=lambda region: self.in_flight[region] / self.weights[region]
+          )
+
+    # Smooth weighted round robin, which interleaves the regions evenly
+    total = sum(self.weights[region] for region in regions)
+    for region in regions:
+      self.current_weights[region] += self.weights[region]
+    region = max(regions, key=lambda region: self.current_weights[region])
+    self.current_weights[region] -= total
+    return region
+
+
+def create_region_pool(config: dict[str, Any]) -> RegionPool:
+  """Creates the pool of the gemini_regions config key.
+
+  Without gemini_regions, the pool only has us-central1.
+
+  Args:
+    config (dict[str, Any]): A dictionary containing configuration parameters.
+
+  Returns:
+    RegionPool: The pool.
+
+  Raises:
+    ValueError: If the gemini_region_routing config key is not supported, or
+    a region weight is not a positive number.
+  """
+  regions = config.get('gemini_regions') or [DEFAULT_REGION]
+  if not isinstance(regions, dict):
+    regions = {region: {} for region in regions}
+
+  for region, settings in regions.items():
+    weight = settings.get('weight', DEFAULT_WEIGHT)
+    if (
+        isinstance(weight, bool)
+        or not isinstance(weight, (int, float))
+        or weight <= 0
+        ):
+      raise ValueError(
+          f'Invalid weight for gemini_regions {region}: {weight}. '
+          'Must be a positive number.'
+          )
+
+  routing = config.get('gemini_region_routing', ROUND_ROBIN)
+  if routing not in ROUTING_STRATEGIES:
+    raise ValueError(
+        f'Unsupported gemini_region_routing: {routing}. '
+        f'Supported values are {", ".join(ROUTING_STRATEGIES)}.'
+        )
+  return RegionPool(regions, routing)
@@ -0,0 +1,275 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Retry policy shared by the external service calls.
+
+Errors are classified by their google.api_core exception type, gRPC status or
+HTTP status, falling back to their message for errors raised by the client
+libraries.
+Retries wait an exponential backoff with full jitter, or the delay the server
+asks for, within a number of attempts and an optional deadline per call.
+"""
+
+import logging
+import random
+import time
+from typing import Any
+
+import dirtyjson
+from google.api_core import exceptions
+import grpc
+import requests
+from utils.cassette import CassetteMissError
+from vertexai.generative_models import ResponseValidationError
+
+# Error classes, also used as metric labels
+QUOTA = 'quota'
+TRANSIENT = 'transient'
+BLOCKED = 'blocked'
+PARSE = 'parse'
+PERMANENT = 'permanent'
+OTHER = 'other'
+
+# Base and maximum backoff seconds of each retryable error class
+BACKOFF_SECONDS = {
+    QUOTA: (10, 120),
+    TRANSIENT: (1, 30),
+    BLOCKED: (2, 20),
+    PARSE: (0, 0),
+    OTHER: (0, 0),
+}
+# Extra wait over a server retry delay, as a fraction of the delay
+RETRY_AFTER_JITTER = 0.2
+
+QUOTA_EXCEPTIONS = (exceptions.ResourceExhausted, exceptions.TooManyRequests)
+TRANSIENT_EXCEPTIONS = (
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.BadGateway,
+    exceptions.GatewayTimeout,
+    exceptions.DeadlineExceeded,
+    exceptions.Aborted,
+    ConnectionError,
+    TimeoutError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+PERMANENT_EXCEPTIONS = (
+    exceptions.InvalidArgument,
+    exceptions.PermissionDenied,
+    exceptions.Unauthenticated,
+    exceptions.NotFound,
+    # Replayed requests that were not recorded
+    CassetteMissError,
+)
+PARSE_EXCEPTIONS = (ValueError, SyntaxError, AttributeError, dirtyjson.Error)
+
+GRPC_STATUS_CLASSES = {
+    grpc.StatusCode.RESOURCE_EXHAUSTED: QUOTA,
+    grpc.StatusCode.UNAVAILABLE: TRANSIENT,
+    grpc.StatusCode.DEADLINE_EXCEEDED: TRANSIENT,
+    grpc.StatusCode.INTERNAL: TRANSIENT,
+    grpc.StatusCode.ABORTED: TRANSIENT,
+    grpc.StatusCode.INVALID_ARGUMENT: PERMANENT,
+    grpc.StatusCode.PERMISSION_DENIED: PERMANENT,
+    grpc.StatusCode.UNAUTHENTICATED: PERMANENT,
+    grpc.StatusCode.NOT_FOUND: PERMANENT,
+}
+
+
+def classify_error(e: Exception) -> str:
+  """Returns the class of an error.
+
+  Args:
+    e (Exception): The error.
+
+  Returns:
+    str: quota, transient, blocked, parse, permanent or other.
+  """
+  if isinstance(e, QUOTA_EXCEPTIONS):
+    return QUOTA
+  if isinstance(e, TRANSIENT_EXCEPTIONS):
+    return TRANSIENT
+  if isinstance(e, PERMANENT_EXCEPTIONS):
+    return PERMANENT
+  if isinstance(e, ResponseValidationError):
+    return BLOCKED
+
+  # gRPC errors, and Google Ads errors that wrap them
+  status_code = _get_grpc_status_code(e)
+  if status_code in GRPC_STATUS_CLASSES:
+    return GRPC_STATUS_CLASSES[status_code]
+
+  # HTTP errors, e.g. gspread.exceptions.APIError
+  http_status = getattr(getattr(e, 'response', None), 'status_code', None)
+  if isinstance(http_status, int):
+    if http_status == 429:
+      return QUOTA
+    if http_status >= 500:
+      return TRANSIENT
+    if http_status in (400, 401, 403, 404):
+      return PERMANENT
+
+  # Errors raised by the client libraries without a specific type
+  message = str(e).lower()
+  if 'quota' in message or '429' in message:
+    return QUOTA
+  if ('candidate' in message or 'response was blocked' in message
+      or 'quick accessor' in message):
+    return BLOCKED
+  if isinstance(e, PARSE_EXCEPTIONS):
+    return PARSE
+  return OTHER
+
+
+def get_retry_after(e: Exception) -> float | None:
+  """Returns the seconds the server asks to wait before retrying, if any.
+
+  Reads the google.rpc.RetryInfo details, the Google Ads quota error
+  details and the Retry-After HTTP header.
+
+  Args:
+    e (Exception): The error.
+
+  Returns:
+    float | None: The seconds, None if the error has no retry delay.
+  """
+  for detail in getattr(e, 'details', None) or []:
+    if hasattr(detail, 'retry_delay'):
+      return _to_seconds(detail.retry_delay)
+
+  failure = getattr(e, 'failure', None)
+  for error in getattr(failure, 'errors', None) or []:
+    quota_details = getattr(
+        getattr(error, 'details', None),
+        'quota_error_details',
+        None
+        )
+    if quota_details is not None and _to_seconds(quota_details.retry_delay):
+      return _to_seconds(quota_details.retry_delay)
+
+  headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+  try:
+    return float(headers['Retry-After'])
+  except (KeyError, TypeError, ValueError):
+    return None
+
+
+def _get_grpc_status_code(e: Exception) -> grpc.StatusCode | None:
+  """Returns the gRPC status of an error or of the call it wraps, if any."""
+  for call in (e, getattr(e, 'error', None)):
+    code = getattr(call, 'code', None)
+    if callable(code):
+      try:
+        return code()
+      except Exception:  # pylint: disable=broad-except
+        return None
+  return None
+
+
+def _to_seconds(duration: Any) -> float:
+  """Converts a protobuf Duration to seconds."""
+  return duration.seconds + duration.nanos / 1e9
+
+
+class RetryPolicy:
+  """Number of attempts, deadline and backoff of the calls to a service."""
+
+  def __init__(
+      self,
+      max_attempts: int = 5,
+      deadline_seconds: float | None = None,
+      backoff_seconds: dict[str, tuple[float, float]] | None = None
+      ):
+    """Init method for RetryPolicy.
+
+    Args:
+      max_attempts (int): The maximum attempts of a call.
+      deadline_seconds (float | None): The maximum seconds of a call,
+      retries included. No deadline if None.
+      backoff_seconds (dict[str, tuple[float, float]] | None): The base and
+      maximum backoff of each retryable error class, merged over
+      BACKOFF_SECONDS.
+    """
+    self.max_attempts = max_attempts
+    self.deadline_seconds = deadline_seconds
+    self.backoff_seconds = {**BACKOFF_SECONDS, **(backoff_seconds or {})}
+
+  def start(self) -> 'RetryState':
+    """Starts the retries of a call.
+
+    Returns:
+      RetryState: The attempts and deadline of the call.
+    """
+    return RetryState(self)
+
+
+class RetryState:
+  """Attempts and deadline of a call."""
+
+  def __init__(self, policy: RetryPolicy):
+    """Init method for RetryState.
+
+    Args:
+      policy (RetryPolicy): The retry policy of the call.
+    """
+    self.policy = policy
+    self.start = time.time()
+    self.attempts = 0
+    self.error_class = None
+
+  def remaining_seconds(self) -> float | None:
+    """Returns the seconds left until the deadline of the call.
+
+    Returns:
+      float | None: The seconds, None if the call has no deadline.
+    """
+    if self.policy.deadline_seconds is None:
+      return None
+    return max(0.0, self.start + self.policy.deadline_seconds - time.time())
+
+  def next_delay(self, e: Exception) -> float | None:
+    """Counts a failed attempt and returns the backoff before the next one.
+
+    Args:
+      e (Exception): The error of the attempt.
+
+    Returns:
+      float | None: The seconds to wait, None if the call must not be
+      retried: the error is permanent, or the attempts or the deadline would
+      be exceeded.
+    """
+    self.attempts += 1
+    self.error_class = classify_error(e)
+    if (self.error_class == PERMANENT
+        or self.attempts >= self.policy.max_attempts):
+      return None
+
+    retry_after = get_retry_after(e)
+    if retry_after is not None:
+      delay = retry_after * (1 + random.uniform(0, RETRY_AFTER_JITTER))
+    else:
+      base, maximum = self.policy.backoff_seconds[self.error_class]
+      # Full jitter, so concurrent callers don't retry in lockstep
+      delay = random.uniform(0, min(maximum, base * 2 ** (self.attempts - 1)))
+
+    remaining = self.remaining_seconds()
+    if remaining is not None and delay >= remaining:
+      logging.warning(
+          ' Not retrying %s error, the deadline is in %.1fs',
+          self.error_class,
+          remaining
+          )
+      return None
+    return delay
@@ -17,12 +17,22 @@
 This module contains helper functions for working with Google Sheets.
 """
 
+import json
 import logging
 import backoff
 
 import gspread
+import requests
+from utils import cassette
+from utils import circuit_breaker
+from utils import metrics
+from utils import tracing
 from utils.authentication_helper import Authenticator
 
+# Sheets API recommends payloads of at most 2 MB per request
+MAX_BYTES_PER_CHUNK = 2 * 1024 * 1024
+MAX_CELLS_PER_CHUNK = 50000
+
 
 class GoogleSheetsHelper():
   """Helper class for working with Google Sheets using the Google Sheets API.
@@ -37,6 +47,7 @@ class GoogleSheetsHelper():
     authenticator = Authenticator()
     self.creds = authenticator.authenticate(config)
     self.client = gspread.authorize(self.creds)
+    self.spreadsheets = {}
 
   @backoff.on_exception(backoff.expo, gspread.exceptions.GSpreadException, max_tries=5)
   def create_or_clear_sheet(self, sheet_id: str, sheet_name: str) -> None:
@@ -81,13 +92,22 @@ class GoogleSheetsHelper():
       A list of values corresponding to the specified column starting
       from the given row.
     """
-    spreadsheet = self.client.open_by_key(sheet_id)
-    worksheet = spreadsheet.worksheet(sheet_name)
-    column_values = (worksheet.col_values(ord(column) - 64)
-                     [starting_row - 1:limit+starting_row-1])
+    with (circuit_breaker.guard('sheets'),
+          metrics.track('sheets', 'read_column'),
+          tracing.span('sheets.read_column', column=column, limit=limit)):
+      column_values = cassette.call(
+          'sheets',
+          ['read_column', sheet_id, sheet_name, column, starting_row, limit],
+          lambda: (
+              self.client.open_by_key(sheet_id)
+              .worksheet(sheet_name)
+              .col_values(ord(column) - 64)
+              [starting_row - 1:limit+starting_row-1]
+              )
+          )
+    metrics.count_bytes('sheets', 'received', column_values)
     return column_values
 
-  @backoff.on_exception(backoff.expo, gspread.exceptions.GSpreadException, max_tries=5)
   def write_data_to_sheet(
       self,
       sheet_id: str,
@@ -97,22 +117,472 @@ class GoogleSheetsHelper():
       ) -> None:
     """Write data to the specified Google Sheet.
 
+    Rows are split into chunks bounded by cell count and payload size, and the
+    chunks are written one after another with values_batch_update, as the
+    gspread client is not thread-safe. Each chunk is retried on its own, and
+    the sheet grows if it is too small for the data.
+
     Args:
       sheet_id (str): The unique identifier of the Google Sheet.
       sheet_name (str): The name of the Google Sheet.
-      sheet_range (str): The range to write data to, e.g., 'Sheet1!A1'.
+      sheet_range (str): The range to write data to, e.g., 'Sheet1!A1'. Only
+      its top-left cell is used, the data determines the rest of the range.
       data (list[list[str]]): The data to be written.
     """
-    logging.info(' Writing data to sheet: %s', sheet_name)
+    self.write_ranges_to_sheet(sheet_id, sheet_name, [(sheet_range, data)])
+
+  def write_ranges_to_sheet(
+      self,
+      sheet_id: str,
+      sheet_name: str,
+      write_plan: list[tuple[str, list[list[str]]]]
+      ) -> None:
+    """Write several ranges to the specified Google Sheet in few requests.
+
+    All ranges are split into size-bounded chunks, and the chunks are packed
+    into as few values_batch_update requests as the same bounds allow.
+
+    Args:
+      sheet_id (str): The unique identifier of the Google Sheet.
+      sheet_name (str): The name of the Google Sheet.
+      write_plan (list[tuple[str, list[list[str]]]]): The ranges to write, as
+      (range, data) tuples. Only the top-left cell of each range is used.
+    """
+    write_plan = [(r, data) for r, data in write_plan if data]
+    logging.info(
+        ' Writing %d ranges with %d rows to sheet: %s',
+        len(write_plan),
+        sum(len(data) for _, data in write_plan),
+        sheet_name
+        )
+
+    if not write_plan:
+      return
+
+    spreadsheet = self.__open_spreadsheet(sheet_id)
+    worksheet = spreadsheet.worksheet(sheet_name)
+
+    chunks = []
+    needed_rows = 0
+    needed_cols = 0
+    for sheet_range, data in write_plan:
+      start_cell = sheet_range.split('!')[-1].split(':')[0]
+      start_row, start_col = gspread.utils.a1_to_rowcol(start_cell)
+      needed_rows = max(needed_rows, start_row + len(data) - 1)
+      needed_cols = max(
+          needed_cols,
+          start_col + max(len(row) for row in data) - 1
+          )
+      chunks.extend(
+          self.__split_into_chunks(sheet_name, start_row, start_col, data)
+          )
+
+    self.__ensure_sheet_size(worksheet, needed_rows, needed_cols)
+
+    batches = self.__pack_chunks(chunks)
+    logging.info(' Writing data in %d requests', len(batches))
+
+    with tracing.span(
+        'sheets.write',
+        sheet_name=sheet_name,
+        rows=sum(len(data) for _, data in write_plan),
+        requests=len(batches)
+        ):
+      for batch in batches:
+        self.__write_batch(spreadsheet, batch)
+
+    logging.info(' Data written successfully')
+
+  def batch_get_values(
+      self,
+      sheet_id: str,
+      sheet_name: str,
+      ranges: list[str]
+      ) -> list[list[list[object]]]:
+    """Reads several ranges of a Google Sheet in a single request.
+
+    Args:
+      sheet_id (str): The unique identifier of the Google Sheet.
+      sheet_name (str): The name of the sheet (tab) in the spreadsheet.
+      ranges (list[str]): The ranges to read, e.g., ['A2', 'C2:C10'].
+
+    Returns:
+      list[list[list[object]]]: The values of each range, in the same order.
+    """
+    if not ranges:
+      return []
+
+    with (circuit_breaker.guard('sheets'),
+          metrics.track('sheets', 'batch_get'),
+          tracing.span('sheets.batch_get', ranges=len(ranges))):
+      values = cassette.call(
+          'sheets',
+          ['batch_get', sheet_id, sheet_name, ranges],
+          lambda: [
+              list(values) for values in self.__open_spreadsheet(sheet_id)
+              .worksheet(sheet_name)
+              .batch_get(ranges)
+              ]
+          )
+    metrics.count_bytes('sheets', 'received', values)
+    return values
+
+  def sync_rows(
+      self,
+      sheet_id: str,
+      sheet_name: str,
+      feed: list[list[object]],
+      key_columns: list[str],
+      ignore_columns: list[str] | None = None
+      ) -> dict[str, int]:
+    """Writes only the rows of a feed that changed since the last export.
+
+    The existing feed is read once, and rows are matched by a fingerprint made
+    of the key columns. Changed rows are overwritten in place, inserted rows
+    fill the slots of removed rows first and are appended after that, and
+    removed rows left over are deleted. If the sheet doesn't exist or its
+    header changed, the whole feed is rewritten.
+
+    Args:
+      sheet_id (str): The unique identifier of the Google Sheet.
+      sheet_name (str): The name of the sheet (tab) in the spreadsheet.
+      feed (list[list[object]]): The feed to write, header row included.
+      key_columns (list[str]): The header names whose values identify a row.
+      Names missing in the header are skipped.
+      ignore_columns (list[str] | None): Header names not compared to decide
+      if a row changed, e.g. generated ids.
+
+    Returns:
+      dict[str, int]: The number of inserted, changed, removed and unchanged
+      rows.
+    """
+    header, rows = feed[0], feed[1:]
+    spreadsheet = self.__open_spreadsheet(sheet_id)
 
     try:
-      spreadsheet = self.client.open_by_key(sheet_id)
       worksheet = spreadsheet.worksheet(sheet_name)
-      worksheet.update(sheet_range, data)
+      with (circuit_breaker.guard('sheets'),
+            metrics.track('sheets', 'get_all_values'),
+            tracing.span('sheets.get_all_values', sheet_name=sheet_name)):
+        existing = worksheet.get_all_values()
+      metrics.count_bytes('sheets', 'received', existing)
+    except gspread.exceptions.WorksheetNotFound as _:
+      existing = []
 
-      logging.info(' Data written successfully')
-    except gspread.exceptions.GSpreadException as e:
-      logging.error(' Error writing data: %s', e)
+    if not existing or existing[0] != self.__to_cell_values(header, len(header)):
+      logging.info(' Sheet %s is new or its header changed, rewriting', sheet_name)
+      self.create_or_clear_sheet(sheet_id, sheet_name)
+      self.write_data_to_sheet(sheet_id, sheet_name, 'A1', feed)
+      return {
+          'inserted': len(rows), 'changed': 0, 'removed': 0, 'unchanged': 0
+          }
+
+    key_indexes = [header.index(c) for c in key_columns if c in header]
+    compared_indexes = [
+        i for i, name in enumerate(header) if name not in (ignore_columns or [])
+        ]
+
+    # Sheet row numbers of the existing rows, by fingerprint
+    existing_rows = {}
+    for row_number, row in enumerate(existing[1:], start=2):
+      row = self.__to_cell_values(row, len(header))
+      fingerprint = tuple(row[i] for i in key_indexes)
+      existing_rows.setdefault(fingerprint, []).append((row_number, row))
+
+    write_plan = []
+    inserted = []
+    unchanged = 0
+    for row in rows:
+      # Empty cells are written explicitly so they clear the previous values
+      row = ['' if value is None else value for value in row]
+      row += [''] * (len(header) - len(row))
+      cell_values = self.__to_cell_values(row, len(header))
+      fingerprint = tuple(cell_values[i] for i in key_indexes)
+      if not existing_rows.get(fingerprint):
+        inserted.append(row)
+        continue
+
+      row_number, existing_row = existing_rows[fingerprint].pop(0)
+      if any(cell_values[i] != existing_row[i] for i in compared_indexes):
+        write_plan.append((f'A{row_number}', [row]))
+      else:
+        unchanged += 1
+
+    changed = len(write_plan)
+    free_row_numbers = sorted(
+        row_number
+        for matches in existing_rows.values()
+        for row_number, _ in matches
+        )
+
+    # Inserted rows take the place of removed rows before being appended
+    next_row_number = len(existing) + 1
+    for row in inserted:
+      if free_row_numbers:
+        write_plan.append((f'A{free_row_numbers.pop(0)}', [row]))
+      else:
+        write_plan.append((f'A{next_row_number}', [row]))
+        next_row_number += 1
+
+    self.write_ranges_to_sheet(sheet_id, sheet_name, write_plan)
+
+    if free_row_numbers:
+      self.__delete_rows(spreadsheet, worksheet, free_row_numbers)
+
+    stats = {
+        'inserted': len(inserted),
+        'changed': changed,
+        'removed': len(existing) - 1 - changed - unchanged,
+        'unchanged': unchanged,
+        }
+    logging.info(' Sheet %s synced: %s', sheet_name, stats)
+
+    return stats
+
+  def __to_cell_values(self, row: list[object], length: int) -> list[str]:
+    """Converts a row to the strings the Sheets API returns for it.
+
+    Args:
+      row (list[object]): The row values.
+      length (int): The length to pad or truncate the row to.
+
+    Returns:
+      list[str]: The formatted cell values.
+    """
+    cell_values = []
+    for value in row[:length]:
+      if value is None:
+        cell_values.append('')
+      elif isinstance(value, bool):
+        cell_values.append('TRUE' if value else 'FALSE')
+      else:
+        cell_values.append(str(value))
+    return cell_values + [''] * (length - len(cell_values))
+
+  @backoff.on_exception(backoff.expo, gspread.exceptions.GSpreadException, max_tries=5)
+  def __delete_rows(
+      self,
+      spreadsheet: gspread.Spreadsheet,
+      worksheet: gspread.Worksheet,
+      row_numbers: list[int]
+      ) -> None:
+    """Deletes rows of a worksheet in a single request.
+
+    Args:
+      spreadsheet (gspread.Spreadsheet): The spreadsheet.
+      worksheet (gspread.Worksheet): The worksheet to delete rows from.
+      row_numbers (list[int]): The sheet row numbers to delete.
+    """
+    # Consecutive rows are merged, and deleted bottom-up to keep indexes valid
+    ranges = []
+    for row_number in sorted(row_numbers):
+      if ranges and ranges[-1][1] == row_number - 1:
+        ranges[-1][1] = row_number
+      else:
+        ranges.append([row_number, row_number])
+
+    spreadsheet.batch_update({
+        'requests': [
+            {
+                'deleteDimension': {
+                    'range': {
+                        'sheetId': worksheet.id,
+                        'dimension': 'ROWS',
+                        'startIndex': start - 1,
+                        'endIndex': end,
+                        }
+                    }
+                }
+            for start, end in reversed(ranges)
+            ]
+        })
+    logging.info(' %d rows deleted from sheet %s', len(row_numbers), worksheet.title)
+
+  def __open_spreadsheet(self, sheet_id: str) -> gspread.Spreadsheet:
+    """Opens a spreadsheet by key, reusing it if it was already opened.
+
+    Args:
+      sheet_id (str): The unique identifier of the Google Sheet.
+
+    Returns:
+      gspread.Spreadsheet: The spreadsheet.
+    """
+    if sheet_id not in self.spreadsheets:
+      self.spreadsheets[sheet_id] = self.client.open_by_key(sheet_id)
+    return self.spreadsheets[sheet_id]
+
+  def __ensure_sheet_size(
+      self,
+      worksheet: gspread.Worksheet,
+      rows: int,
+      cols: int
+      ) -> None:
+    """Grows the worksheet if it has less rows or columns than needed.
+
+    Args:
+      worksheet (gspread.Worksheet): The worksheet to grow.
+      rows (int): The number of rows needed.
+      cols (int): The number of columns needed.
+    """
+    if worksheet.row_count >= rows and worksheet.col_count >= cols:
+      return
+
+    logging.info(' Resizing sheet %s to %d rows', worksheet.title, rows)
+    worksheet.resize(
+        rows=max(worksheet.row_count, rows),
+        cols=max(worksheet.col_count, cols)
+        )
+
+  def __split_into_chunks(
+      self,
+      sheet_name: str,
+      start_row: int,
+      start_col: int,
+      data: list[list[str]]
+      ) -> list[dict[str, object]]:
+    """Splits rows into ranges bounded by cell count and payload size.
+
+    Args:
+      sheet_name (str): The name of the sheet (tab) in the spreadsheet.
+      start_row (int): The row of the top-left cell to write to.
+      start_col (int): The column of the top-left cell to write to.
+      data (list[list[str]]): The rows to split.
+
+    Returns:
+      list[dict[str, object]]: The chunks, each one a value range with the
+      absolute range to write to and its values.
+    """
+    chunks = []
+    chunk_rows = []
+    chunk_cells = 0
+    chunk_bytes = 0
+    chunk_start_row = start_row
+
+    for row in data:
+      row_cells = len(row)
+      row_bytes = len(json.dumps(row, default=str))
+
+      if chunk_rows and (
+          chunk_cells + row_cells > MAX_CELLS_PER_CHUNK or
+          chunk_bytes + row_bytes > MAX_BYTES_PER_CHUNK
+          ):
+        chunks.append(self.__get_value_range(
+            sheet_name, chunk_start_row, start_col, chunk_rows
+            ))
+        chunk_start_row += len(chunk_rows)
+        chunk_rows = []
+        chunk_cells = 0
+        chunk_bytes = 0
+
+      chunk_rows.append(row)
+      chunk_cells += row_cells
+      chunk_bytes += row_bytes
+
+    if chunk_rows:
+      chunks.append(self.__get_value_range(
+          sheet_name, chunk_start_row, start_col, chunk_rows
+          ))
+
+    return chunks
+
+  def __get_value_range(
+      self,
+      sheet_name: str,
+      row: int,
+      col: int,
+      values: list[list[str]]
+      ) -> dict[str, object]:
+    """Builds a value range starting at the given cell.
+
+    Args:
+      sheet_name (str): The name of the sheet (tab) in the spreadsheet.
+      row (int): The row of the top-left cell.
+      col (int): The column of the top-left cell.
+      values (list[list[str]]): The values of the range.
+
+    Returns:
+      dict[str, object]: The value range for a values_batch_update request.
+    """
+    return {
+        'range': gspread.utils.absolute_range_name(
+            sheet_name,
+            gspread.utils.rowcol_to_a1(row, col)
+            ),
+        'values': values,
+        }
+
+  def __pack_chunks(
+      self,
+      chunks: list[dict[str, object]]
+      ) -> list[list[dict[str, object]]]:
+    """Packs chunks into batches bounded by cell count and payload size.
+
+    Args:
+      chunks (list[dict[str, object]]): The value ranges to pack.
+
+    Returns:
+      list[list[dict[str, object]]]: The batches of value ranges, one per
+      values_batch_update request.
+    """
+    batches = []
+    batch = []
+    batch_cells = 0
+    batch_bytes = 0
+
+    for chunk in chunks:
+      chunk_cells = sum(len(row) for row in chunk['values'])
+      chunk_bytes = len(json.dumps(chunk['values'], default=str))
+
+      if batch and (
+          batch_cells + chunk_cells > MAX_CELLS_PER_CHUNK or
+          batch_bytes + chunk_bytes > MAX_BYTES_PER_CHUNK
+          ):
+        batches.append(batch)
+        batch = []
+        batch_cells = 0
+        batch_bytes = 0
+
+      batch.append(chunk)
+      batch_cells += chunk_cells
+      batch_bytes += chunk_bytes
+
+    if batch:
+      batches.append(batch)
+
+    return batches
+
+  @backoff.on_exception(
+      backoff.expo,
+      (gspread.exceptions.GSpreadException,
+       requests.exceptions.RequestException),
+      max_tries=5
+      )
+  def __write_batch(
+      self,
+      spreadsheet: gspread.Spreadsheet,
+      batch: list[dict[str, object]]
+      ) -> None:
+    """Writes a batch of chunks, retrying it on its own if it fails.
+
+    Args:
+      spreadsheet (gspread.Spreadsheet): The spreadsheet to write to.
+      batch (list[dict[str, object]]): The value ranges to write.
+    """
+    try:
+      with (circuit_breaker.guard('sheets'),
+            metrics.track('sheets', 'write')):
+        spreadsheet.values_batch_update({
+            'valueInputOption': 'RAW',
+            'data': batch,
+            })
+      metrics.count_bytes('sheets', 'sent', batch)
+    except (gspread.exceptions.GSpreadException,
+            requests.exceptions.RequestException) as e:
+      logging.error(
+          ' Error writing ranges %s: %s',
+          ', '.join(chunk['range'] for chunk in batch),
+          e
+          )
       raise  # Re-raise the exception so backoff can handle it
 
   def get_cell_value(
@@ -0,0 +1,210 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Task Progress class.
+
+It keeps the live counters of a content generation task, so they can be
+exposed by the tasks endpoints.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+from typing import Any, Iterator
+
+
+class TaskProgress:
+  """Task Progress class.
+
+  Thread-safe counters of entries, Gemini calls, retries, quota sleeps and
+  stage latencies of a task. Every update bumps a version, so readers can
+  wait for changes instead of polling.
+  """
+
+  def __init__(self):
+    """Init method for TaskProgress."""
+    self.updated = threading.Condition()
+    self.version = 0
+    self.started_at = time.time()
+    self.generation_started_at = None
+    self.current_stage = None
+    self.entries_total = 0
+    self.entries_done = 0
+    self.entries_requeued = 0
+    self.entries_skipped = 0
+    self.budget_exhausted_by = None
+    self.gemini_calls = collections.Counter()
+    self.gemini_retries = collections.Counter()
+    self.quota_sleeps = 0
+    self.quota_sleep_seconds = 0
+    # Number of runs and total seconds of each stage
+    self.stage_runs = collections.Counter()
+    self.stage_seconds = collections.Counter()
+
+  def set_entries_total(self, entries_total: int) -> None:
+    """Sets the number of entries to generate content for.
+
+    Args:
+      entries_total (int): The number of entries.
+    """
+    with self.updated:
+      self.entries_total = entries_total
+      self.generation_started_at = time.time()
+      self.__notify()
+
+  def entry_done(self) -> None:
+    """Counts an entry with its content generated."""
+    with self.updated:
+      self.entries_done += 1
+      self.__notify()
+
+  def entry_requeued(self) -> None:
+    """Counts an entry requeued because of generation errors."""
+    with self.updated:
+      self.entries_requeued += 1
+      self.__notify()
+
+  def budget_exhausted(self, budget: str, entries_skipped: int) -> None:
+    """Records that a budget stopped the generation before the last entries.
+
+    Args:
+      budget (str): The exhausted budget, time or cost.
+      entries_skipped (int): The entries left without content.
+    """
+    with self.updated:
+      self.budget_exhausted_by = budget
+      self.entries_skipped = entries_skipped
+      self.__notify()
+
+  def gemini_call(self, kind: str, seconds: float) -> None:
+    """Counts a Gemini request.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+      seconds (float): The latency of the request.
+    """
+    with self.updated:
+      self.gemini_calls[kind] += 1
+      self.stage_runs[f'gemini_{kind}'] += 1
+      self.stage_seconds[f'gemini_{kind}'] += seconds
+      self.__notify()
+
+  def gemini_retry(self, kind: str) -> None:
+    """Counts a retried Gemini request.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+    """
+    with self.updated:
+      self.gemini_retries[kind] += 1
+      self.__notify()
+
+  def quota_sleep(self, seconds: float) -> None:
+    """Counts a sleep because of a quota error.
+
+    Args:
+      seconds (float): The seconds slept.
+    """
+    with self.updated:
+      self.quota_sleeps += 1
+      self.quota_sleep_seconds += seconds
+      self.__notify()
+
+  @contextlib.contextmanager
+  def stage(self, name: str) -> Iterator[None]:
+    """Times a run of a stage, e.g. the association of an entry.
+
+    Args:
+      name (str): The name of the stage.
+
+    Yields:
+      None
+    """
+    with self.updated:
+      previous_stage = self.current_stage
+      self.current_stage = name
+      self.__notify()
+
+    start = time.time()
+    try:
+      yield
+    finally:
+      with self.updated:
+        self.current_stage = previous_stage
+        self.stage_runs[name] += 1
+        self.stage_seconds[name] += time.time() - start
+        self.__notify()
+
+  def wait_for_update(self, version: int, timeout: float) -> int:
+    """Waits until the progress changes after a given version.
+
+    Args:
+      version (int): The last version seen.
+      timeout (float): The maximum seconds to wait.
+
+    Returns:
+      int: The current version.
+    """
+    with self.updated:
+      self.updated.wait_for(lambda: self.version != version, timeout)
+      return self.version
+
+  def to_dict(self) -> dict[str, Any]:
+    """Returns a snapshot of the progress.
+
+    Returns:
+      dict[str, Any]: The counters, average latency per stage in seconds,
+      throughput in entries per minute and ETA in seconds.
+    """
+    with self.updated:
+      now = time.time()
+      entries_per_minute = None
+      eta_seconds = None
+      if self.generation_started_at and self.entries_done:
+        seconds_per_entry = (
+            (now - self.generation_started_at) / self.entries_done
+            )
+        entries_per_minute = round(60 / seconds_per_entry, 2)
+        eta_seconds = round(
+            seconds_per_entry * max(self.entries_total - self.entries_done, 0)
+            )
+
+      return {
+          'version': self.version,
+          'elapsed_seconds': round(now - self.started_at),
+          'current_stage': self.current_stage,
+          'entries': {
+              'total': self.entries_total,
+              'done': self.entries_done,
+              'requeued': self.entries_requeued,
+              'skipped': self.entries_skipped,
+          },
+          'budget_exhausted': self.budget_exhausted_by,
+          'gemini_calls': dict(self.gemini_calls),
+          'gemini_retries': dict(self.gemini_retries),
+          'quota_sleeps': self.quota_sleeps,
+          'quota_sleep_seconds': self.quota_sleep_seconds,
+          'stage_average_seconds': {
+              name: round(self.stage_seconds[name] / runs, 3)
+              for name, runs in self.stage_runs.items()
+          },
+          'entries_per_minute': entries_per_minute,
+          'eta_seconds': eta_seconds,
+      }
+
+  def __notify(self) -> None:
+    """Bumps the version and wakes up the readers. Must hold the lock."""
+    self.version += 1
+    self.updated.notify_all()
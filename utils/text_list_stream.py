@@ -0,0 +1,122 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental parser of the list literal of a streamed response.
+
+The string items of the first list in the response are handed to a callback
+as soon as their closing quote arrives, so they can be processed while the
+rest of the response is generated. The callback returns True once it has
+enough items, and the stream is cancelled.
+"""
+
+import ast
+import logging
+from typing import Callable
+
+
+class TextListStream:
+  """Parses the string items of a list literal from the chunks of a response."""
+
+  def __init__(self, on_item: Callable[[str], bool]):
+    """Init method for TextListStream.
+
+    Args:
+      on_item (Callable[[str], bool]): Called with each item, returns True to
+      cancel the rest of the stream.
+    """
+    self.on_item = on_item
+    self.start()
+
+  def start(self) -> None:
+    """Resets the parser for a new response."""
+    self.items = []
+    self.in_list = False
+    self.done = False
+    self.cancelled = False
+    self.fed = False
+    self.quote = None
+    self.escaped = False
+    self.current = []
+
+  def feed(self, text: str) -> bool:
+    """Parses a chunk of the response.
+
+    Args:
+      text (str): The chunk.
+
+    Returns:
+      bool: Whether the stream must be cancelled.
+    """
+    self.fed = True
+    for char in text:
+      if self.done or self.cancelled:
+        break
+
+      if not self.in_list:
+        self.in_list = char == '['
+      elif self.quote is not None:
+        self.current.append(char)
+        if self.escaped:
+          self.escaped = False
+        elif char == '\\':
+          self.escaped = True
+        elif char == self.quote:
+          self.quote = None
+          self.__add_item(''.join(self.current))
+      elif char in ('"', "'"):
+        self.quote = char
+        self.current = [char]
+      elif char == ']':
+        self.done = True
+    return self.cancelled
+
+  def parse(self, text: str) -> list[str]:
+    """Returns the items of a response, parsing it whole if it wasn't streamed.
+
+    Args:
+      text (str): The response text, e.g. a batch or recorded response.
+
+    Returns:
+      list[str]: The items.
+    """
+    if not self.fed:
+      self.feed(text)
+    return self.get_items()
+
+  def get_items(self) -> list[str]:
+    """Returns the items parsed so far.
+
+    Returns:
+      list[str]: The items.
+
+    Raises:
+      ValueError: If the response ended without a list.
+    """
+    if not self.items and not self.done and not self.cancelled:
+      raise ValueError('No list found in the streamed response')
+    return self.items
+
+  def __add_item(self, literal: str) -> None:
+    """Adds a string literal to the items and hands it to the callback.
+
+    Args:
+      literal (str): The quoted item.
+    """
+    try:
+      item = ast.literal_eval(literal)
+    except (ValueError, SyntaxError) as e:
+      logging.warning(' Skipping invalid streamed item %s: %s', literal, e)
+      return
+    self.items.append(item)
+    self.cancelled = bool(self.on_item(item))
@@ -0,0 +1,205 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Token Usage class.
+
+It aggregates the tokens of the Gemini responses of a task and estimates
+their cost.
+"""
+
+import collections
+import contextlib
+import contextvars
+import threading
+from typing import Any, Iterator
+
+# USD per million tokens, overridable with the model_prices config key
+DEFAULT_MODEL_PRICES = {
+    'gemini-1.5-flash': {'input': 0.075, 'output': 0.3, 'cached_input': 0.01875},
+    'gemini-1.5-flash-8b': {'input': 0.0375, 'output': 0.15, 'cached_input': 0.01},
+    'gemini-1.5-pro': {'input': 1.25, 'output': 5.0, 'cached_input': 0.3125},
+    'gemini-2.0-flash': {'input': 0.1, 'output': 0.4, 'cached_input': 0.025},
+}
+
+TOKEN_FIELDS = ('calls', 'prompt_tokens', 'output_tokens', 'cached_tokens')
+
+
+class TokenUsage:
+  """Token Usage class.
+
+  Thread-safe token counts of a task by request kind, by entry and by model,
+  with a cost estimate from a price table.
+  """
+
+  def __init__(self, model_prices: dict[str, dict[str, float]] | None = None):
+    """Init method for TokenUsage.
+
+    Args:
+      model_prices (dict[str, dict[str, float]] | None): USD per million
+      input, output and cached_input tokens of each model, merged over
+      DEFAULT_MODEL_PRICES.
+    """
+    self.lock = threading.Lock()
+    self.model_prices = {**DEFAULT_MODEL_PRICES, **(model_prices or {})}
+    self.current_entry = contextvars.ContextVar('current_entry', default=None)
+    self.by_kind = collections.defaultdict(collections.Counter)
+    self.by_entry = collections.defaultdict(collections.Counter)
+    self.by_model = collections.defaultdict(collections.Counter)
+    self.cost_by_kind = collections.Counter()
+    self.cost_by_entry = collections.Counter()
+    self.unpriced_models = set()
+
+  @contextlib.contextmanager
+  def entry(self, entry_id: str) -> Iterator[None]:
+    """Attributes the tokens used in the current thread to an entry.
+
+    Args:
+      entry_id (str): The id of the entry.
+
+    Yields:
+      None
+    """
+    token = self.current_entry.set(entry_id)
+    try:
+      yield
+    finally:
+      self.current_entry.reset(token)
+
+  def record(
+      self,
+      kind: str,
+      model_name: str,
+      usage_metadata: Any,
+      price_factor: float = 1.0
+      ) -> None:
+    """Adds the tokens of a Gemini response.
+
+    Args:
+      kind (str): The kind of request, e.g. headlines or keywords.
+      model_name (str): The model that served the request.
+      usage_metadata (Any): The usage_metadata of the response.
+      price_factor (float): Multiplies the cost, e.g. 0.5 for batch
+      predictions.
+    """
+    if usage_metadata is None:
+      return
+
+    counts = {
+        'calls': 1,
+        'prompt_tokens': getattr(usage_metadata, 'prompt_token_count', 0) or 0,
+        'output_tokens': (
+            getattr(usage_metadata, 'candidates_token_count', 0) or 0
+            ),
+        'cached_tokens': (
+            getattr(usage_metadata, 'cached_content_token_count', 0) or 0
+            ),
+    }
+    cost = self.get_cost(
+        model_name,
+        counts['prompt_tokens'],
+        counts['output_tokens'],
+        counts['cached_tokens']
+        ) * price_factor
+    entry_id = self.current_entry.get()
+
+    with self.lock:
+      self.by_kind[kind].update(counts)
+      self.by_model[model_name].update(counts)
+      self.cost_by_kind[kind] += cost
+      if entry_id is not None:
+        self.by_entry[entry_id].update(counts)
+        self.cost_by_entry[entry_id] += cost
+
+  def get_total_cost(self) -> float:
+    """Returns the estimated cost of the tokens so far.
+
+    Returns:
+      float: The cost in USD.
+    """
+    with self.lock:
+      return sum(self.cost_by_kind.values())
+
+  def to_dict(self, include_entries: bool = True) -> dict[str, Any]:
+    """Returns the token totals and cost estimates.
+
+    Args:
+      include_entries (bool): Whether to include the counts of each entry.
+
+    Returns:
+      dict[str, Any]: The totals, and the counts by kind, model and entry.
+      Costs are in USD.
+    """
+    with self.lock:
+      totals = collections.Counter()
+      for counts in self.by_kind.values():
+        totals.update(counts)
+
+      usage = {
+          'total': {
+              **{field: totals[field] for field in TOKEN_FIELDS},
+              'cost': round(sum(self.cost_by_kind.values()), 6),
+          },
+          'by_kind': {
+              kind: {
+                  **{field: counts[field] for field in TOKEN_FIELDS},
+                  'cost': round(self.cost_by_kind[kind], 6),
+              }
+              for kind, counts in self.by_kind.items()
+          },
+          'by_model': {
+              model: {field: counts[field] for field in TOKEN_FIELDS}
+              for model, counts in self.by_model.items()
+          },
+          'unpriced_models': sorted(self.unpriced_models),
+      }
+      if include_entries:
+        usage['by_entry'] = {
+            entry_id: {
+                **{field: counts[field] for field in TOKEN_FIELDS},
+                'cost': round(self.cost_by_entry[entry_id], 6),
+            }
+            for entry_id, counts in self.by_entry.items()
+        }
+
+      return usage
+
+  def get_cost(
+      self,
+      model_name: str,
+      prompt_tokens: int,
+      output_tokens: int,
+      cached_tokens: int = 0
+      ) -> float:
+    """Estimates the cost of a number of tokens.
+
+    Args:
+      model_name (str): The model that serves the requests.
+      prompt_tokens (int): The prompt tokens, cached ones included.
+      output_tokens (int): The output tokens.
+      cached_tokens (int): The prompt tokens served from a context cache.
+
+    Returns:
+      float: The cost in USD, 0 if the model has no price.
+    """
+    prices = self.model_prices.get(model_name)
+    if not prices:
+      with self.lock:
+        self.unpriced_models.add(model_name)
+      return 0.0
+
+    return (
+        (prompt_tokens - cached_tokens) * prices.get('input', 0) +
+        cached_tokens * prices.get('cached_input', prices.get('input', 0)) +
+        output_tokens * prices.get('output', 0)
+        ) / 1_000_000
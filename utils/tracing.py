@@ -0,0 +1,155 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Optional OpenTelemetry tracing.
+
+Tracing is enabled with the tracing_exporter config key (console, memory,
+otlp or any exporter added with register_exporter) and requires the
+opentelemetry-sdk package, plus opentelemetry-exporter-otlp for otlp. When
+it is disabled or the packages are missing, spans are no-ops.
+"""
+
+import contextlib
+import logging
+from typing import Any, Callable, Iterator
+
+try:
+  from opentelemetry import trace
+  from opentelemetry.sdk.resources import Resource
+  from opentelemetry.sdk.trace import TracerProvider
+  from opentelemetry.sdk.trace.export import BatchSpanProcessor
+  from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+  from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+  from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:
+  trace = None
+
+SERVICE_NAME = 'topic-mine'
+
+_tracer = None
+_memory_exporter = None
+
+
+class _NoOpSpan:
+  """Span used when tracing is disabled."""
+
+  def set_attribute(self, key: str, value: Any) -> None:
+    """Ignores the attribute."""
+
+  def set_attributes(self, attributes: dict[str, Any]) -> None:
+    """Ignores the attributes."""
+
+
+def _create_otlp_exporter():
+  """Creates an OTLP exporter configured with the OTEL_* environment vars."""
+  from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter  # pylint: disable=g-import-not-at-top
+  return OTLPSpanExporter()
+
+
+def _create_memory_exporter():
+  """Creates the in-memory exporter read by get_finished_spans."""
+  global _memory_exporter
+  _memory_exporter = InMemorySpanExporter()
+  return _memory_exporter
+
+
+EXPORTERS: dict[str, Callable[[], Any]] = {
+    'console': lambda: ConsoleSpanExporter(),
+    'memory': _create_memory_exporter,
+    'otlp': _create_otlp_exporter,
+}
+
+
+def register_exporter(name: str, factory: Callable[[], Any]) -> None:
+  """Makes a span exporter available to the tracing_exporter config key.
+
+  Args:
+    name (str): The value of tracing_exporter that selects the exporter.
+    factory (Callable[[], Any]): Creates the SpanExporter.
+  """
+  EXPORTERS[name] = factory
+
+
+def init_tracing(config: dict[str, str]) -> None:
+  """Enables tracing if a tracing_exporter is configured.
+
+  Args:
+    config (dict[str, str]): A dictionary containing configuration parameters.
+  """
+  global _tracer
+
+  exporter_name = config.get('tracing_exporter')
+  if not exporter_name:
+    return
+
+  if trace is None:
+    logging.warning(
+        ' tracing_exporter is %s but opentelemetry-sdk is not installed, '
+        'tracing is disabled',
+        exporter_name
+        )
+    return
+
+  if exporter_name not in EXPORTERS:
+    raise ValueError(
+        f'Unsupported tracing_exporter: {exporter_name}. '
+        f'Supported values are {", ".join(EXPORTERS)}.'
+        )
+
+  exporter = EXPORTERS[exporter_name]()
+  # Local exporters get spans as they end, remote ones in batches
+  if exporter_name in ('console', 'memory'):
+    processor = SimpleSpanProcessor(exporter)
+  else:
+    processor = BatchSpanProcessor(exporter)
+
+  provider = TracerProvider(
+      resource=Resource.create({'service.name': SERVICE_NAME})
+      )
+  provider.add_span_processor(processor)
+  _tracer = provider.get_tracer(__name__)
+  logging.info(' Tracing enabled with the %s exporter', exporter_name)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+  """Starts a span, child of the current span of the thread, if any.
+
+  Args:
+    name (str): The span name, e.g. gemini.generate.
+    **attributes (Any): The span attributes. None values are skipped.
+
+  Yields:
+    The span, to add attributes once they are known.
+  """
+  if _tracer is None:
+    yield _NoOpSpan()
+    return
+
+  with _tracer.start_as_current_span(
+      name,
+      attributes={k: v for k, v in attributes.items() if v is not None}
+      ) as current_span:
+    yield current_span
+
+
+def get_finished_spans() -> list[Any]:
+  """Returns the spans kept by the memory exporter.
+
+  Returns:
+    list[Any]: The finished spans, empty if the memory exporter is not used.
+  """
+  if _memory_exporter is None:
+    return []
+  return list(_memory_exporter.get_finished_spans())